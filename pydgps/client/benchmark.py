@@ -0,0 +1,283 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Benchmark of the acquisition to log path: readBytes -> getMessageFromBuffer -> epoch checks -> median/best ->
+# Log.writeLog, run reading after reading over recorded captures and the synthetic corpora below
+#
+#   python benchmark.py                          synthetic corpora on the emulator, against benchmark_baseline.json
+#   python benchmark.py capture.ubx --save b.json
+#   python benchmark.py capture.ubx --baseline b.json    exits with 1 if anything got worse than THRESHOLDS allow
+#   python benchmark.py capture.ubx --board /dev/ttyACM0 the same pipeline on a pyboard, via mpremote
+#
+# on the PC main.py runs on the emulator (see emulator.py) with getReadings called back to back, timed in one pass
+# and traced with tracemalloc in a second so the tracing doesn't slow the timed one
+# on the board boardbench.py is run from the REPL instead, as main.py can't be imported there without starting it
+# benchmark_baseline.json is the synthetic corpora on the emulator, saved when the pipeline last got faster or smaller;
+# save it again with --save benchmark_baseline.json when a change is meant to move the numbers
+# the times in it are from whatever PC saved it, so against it only the heap metrics can regress, pass --baseline
+# with a json saved on the same machine to check the times too
+import argparse
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import emulator
+import pybimport
+import Formats
+import Layouts
+
+# allowed change against a baseline before it is a regression, as a fraction of the baseline
+# frames_per_s may not drop by more, everything else may not rise by more
+THRESHOLDS = {"frames_per_s": 0.25, "wall_ms_per_reading": 0.25, "alloc_b_per_epoch": 0.10, "peak_heap_kb": 0.10}
+HIGHER_IS_BETTER = ("frames_per_s",)
+PORTABLE = ("alloc_b_per_epoch", "peak_heap_kb") # the same on any PC, so checked against benchmark_baseline.json
+MAX_READINGS = 100 # per corpus
+TIMED_PASSES = 5 # the fastest is kept, the others are mostly the machine being busy with something else
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+LAYOUTS = dict(((cls, id), layout) for cls, id, name, layout in Layouts.MESSAGES)
+
+
+def packFrame(cls, id, values, extra=b""):
+    fmt, names = Layouts.compileLayout(LAYOUTS[(cls, id)])
+    payload = struct.pack(fmt, *[values.get(name, 0) for name in names]) + extra
+    body = struct.pack("<BBH", cls, id, len(payload)) + payload
+    ck_a, ck_b = Formats.ubxChecksum(body)
+    return b"\xb5b" + body + bytes((ck_a, ck_b))
+
+
+# the messages of one rover epoch (see config_r.json), fix quality and position noise drawn from rnd
+# with pvt, a NAV-PVT of the same epoch too, for receivers set to send it in place of the others
+def roverEpoch(rnd, n, svs=12, badFix=0.0, pvt=False):
+    tow = 300000000 + n * 1000
+    ok = rnd.random() >= badFix
+    secs = 12 * 3600 + n
+    extra = b""
+    if pvt:
+        extra = packFrame(0x01, 0x07, {"iTOW": tow, "year": 2021, "month": 4, "day": 2, "hour": secs // 3600 % 24,
+                                       "min": secs // 60 % 60, "sec": secs % 60, "valid": 7, "tAcc": 20,
+                                       "fixType": 3 if ok else 0, "flags": 0x03 if ok else 0, "numSV": svs,
+                                       "lon": -10000000, "lat": 520000000})
+    return extra + (packFrame(0x01, 0x13, {"iTOW": tow, "ecefX": 385000000 + rnd.randint(-30, 30),
+                                   "ecefY": -20000000 + rnd.randint(-30, 30), "ecefZ": 500000000 + rnd.randint(-30, 30),
+                                   "ecefXHp": rnd.randint(-99, 99), "ecefYHp": rnd.randint(-99, 99),
+                                   "ecefZHp": rnd.randint(-99, 99), "pAcc": rnd.randint(100, 400)}) +
+            packFrame(0x01, 0x03, {"iTOW": tow, "gpsFix": 3 if ok else 0, "flags": 0x0f if ok else 0x0c,
+                                   "ttff": 30000, "msss": 600000 + n * 1000}) +
+            packFrame(0x01, 0x35, {"iTOW": tow, "numSvs": svs}, bytes(12 * svs)) +
+            packFrame(0x01, 0x21, {"iTOW": tow, "tAcc": 20, "year": 2021, "month": 4, "day": 2,
+                                   "hour": secs // 3600 % 24, "min": secs // 60 % 60, "sec": secs % 60, "valid": 7}))
+
+
+def cleanCorpus(epochs=600):
+    rnd = random.Random(1)
+    return b"".join(roverEpoch(rnd, n) for n in range(epochs))
+
+
+# a full sky: 30 satellites in every NAV-SAT, plus a registered message we don't use and one we have no decoder for
+def busyCorpus(epochs=600):
+    rnd = random.Random(2)
+    dop = b"\xb5b\x01\x04\x12\x00" + bytes(18)
+    dop += bytes(Formats.ubxChecksum(dop[2:]))
+    return b"".join(roverEpoch(rnd, n, svs=30) + packFrame(0x01, 0x02, {"iTOW": 300000000 + n * 1000}) + dop
+                    for n in range(epochs))
+
+
+# line noise between frames, broken checksums and epochs without a fix
+def noisyCorpus(epochs=600):
+    rnd = random.Random(3)
+    out = bytearray()
+    for n in range(epochs):
+        epoch = bytearray(roverEpoch(rnd, n, badFix=0.05))
+        if rnd.random() < 0.05:
+            epoch[rnd.randrange(6, len(epoch))] ^= 0xff
+        out += bytes(rnd.randrange(256) for i in range(rnd.randrange(8))) + epoch
+    return bytes(out)
+
+
+CORPORA = {"synthetic-clean": cleanCorpus, "synthetic-busy": busyCorpus, "synthetic-noisy": noisyCorpus}
+
+
+# main.py started up on the emulator and stopped at its main loop, with the RTC wakeups off so getReadings is only
+# run when the benchmark calls it
+# the polling loop is the one getReadings belongs to, and at 0 s the startup can't wait for the receiver's replies, so
+# the benchmark runs at gps_baudrate with the receiver's output left as the capture has it
+BOOT_CONFIG = {"async_runtime": False, "gps_fast_baudrates": [], "configure_output": False}
+
+
+def bootBoard(capture, config):
+    main = emulator.run(capture, dict(BOOT_CONFIG, **(config or {})), seconds=0)
+    main.clock.wakeup(None)
+    emulator.pyb.clock.until = None
+    return main
+
+
+def captureDone(main):
+    feed = emulator.pyb.feeds[main.GPS_UART_PORT]
+    return feed.burst >= len(feed.bursts)
+
+
+# runs getReadings until the capture runs out, each reading is measured by after(before()), plus the frames it
+# parsed and the epochs it kept
+def runReadings(capture, config, before, after):
+    main = bootBoard(capture, config)
+    parsed = [0]
+    getMessageFromBuffer = main.getMessageFromBuffer
+
+    def counted():
+        parsed[0] += 1
+        return getMessageFromBuffer()
+
+    main.getMessageFromBuffer = counted
+    readings = []
+    with emulator.boardContext(main.workdir, True):
+        while not captureDone(main) and len(readings) < MAX_READINGS:
+            parsed[0] = 0
+            state = before()
+            main.getReadings()
+            readings.append(after(state) + (parsed[0], main.epochs))
+    return readings
+
+
+def measureHost(capture, config=None):
+    timed = None
+    for n in range(TIMED_PASSES):
+        readings = runReadings(capture, config, time.perf_counter, lambda t0: (time.perf_counter() - t0,))
+        if timed is None or sum(r[0] for r in readings) < sum(r[0] for r in timed):
+            timed = readings
+
+    # the heap is measured from where it was once main.py had started, leaving out the capture held by the emulator
+    started = []
+    tracemalloc.start()
+    try:
+        def before():
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            if len(started) == 0:
+                started.append(current)
+            return current
+
+        def after(start):
+            current, peak = tracemalloc.get_traced_memory()
+            return peak - start, peak - started[0]
+
+        traced = runReadings(capture, config, before, after)
+    finally:
+        tracemalloc.stop()
+
+    wall = sum(r[0] for r in timed)
+    frames = sum(r[1] for r in timed)
+    epochs = sum(r[3] for r in traced)
+    return {"readings": len(timed),
+            "frames_per_s": frames / wall if wall > 0 else 0.0,
+            "wall_ms_per_reading": 1000 * wall / max(len(timed), 1),
+            # heap the reading grows by before it is done, per epoch it kept
+            "alloc_b_per_epoch": sum(r[0] for r in traced) / max(epochs, 1),
+            "peak_heap_kb": max([r[1] for r in traced] + [0]) / 1024}
+
+
+# runs boardbench.py on a pyboard with the capture copied to its flash, it prints the same metrics as one line of json
+def measureBoard(capture, port, noReadings=20):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "boardbench.py"), "rb") as f:
+        script = pybimport.stripBanner(f.read())
+    with tempfile.TemporaryDirectory() as tmp:
+        data = emulator.loadCapture(capture)
+        captureFile = os.path.join(tmp, "bench.ubx")
+        with open(captureFile, "wb") as f:
+            f.write(data)
+        scriptFile = os.path.join(tmp, "bench_run.py")
+        with open(scriptFile, "wb") as f:
+            f.write("BENCH_FILE = 'bench.ubx'\nNO_READINGS = {0}\n".format(noReadings).encode() + script)
+        out = subprocess.run(["mpremote", "connect", port, "fs", "cp", captureFile, ":bench.ubx", "+",
+                              "run", scriptFile], check=True, capture_output=True, text=True).stdout
+    return json.loads([line for line in out.splitlines() if line.startswith("{")][-1])
+
+
+# names of the metrics that are worse than baseline by more than THRESHOLDS allows
+def regressions(result, baseline, metrics=tuple(THRESHOLDS)):
+    worse = []
+    for metric in metrics:
+        allowed = THRESHOLDS[metric]
+        if metric not in result or not baseline.get(metric):
+            continue
+        change = (result[metric] - baseline[metric]) / baseline[metric]
+        if metric in HIGHER_IS_BETTER:
+            change = -change
+        if change > allowed:
+            worse.append(metric)
+    return worse
+
+
+def printResult(name, result, baseline=None):
+    print(name)
+    for metric in ("readings",) + tuple(THRESHOLDS) + ("held_b_per_epoch",):
+        if metric not in result:
+            continue
+        line = "  {0:20} {1:12.1f}".format(metric, result[metric])
+        if baseline is not None and baseline.get(metric):
+            line += "  ({0:+.1f}%)".format(100 * (result[metric] - baseline[metric]) / baseline[metric])
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the acquisition to log path")
+    parser.add_argument("captures", nargs="*", help="recorded UBX captures, the synthetic corpora if none are given")
+    parser.add_argument("--baseline", help="json of an earlier --save to compare against, benchmark_baseline.json "
+                                           "for the emulator if not given")
+    parser.add_argument("--no-baseline", action="store_true", help="don't compare against any baseline")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--board", help="serial port of a pyboard to run on instead of the emulator")
+    args = parser.parse_args(argv)
+
+    corpora = [(os.path.basename(fn), fn) for fn in args.captures]
+    if len(corpora) == 0:
+        corpora = [(name, make()) for name, make in CORPORA.items()]
+    metrics = tuple(THRESHOLDS)
+    if args.baseline is None and args.board is None:
+        args.baseline = BASELINE
+        metrics = PORTABLE
+    baseline = {}
+    if args.baseline is not None and not args.no_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = []
+    for name, capture in corpora:
+        if args.board is not None:
+            results[name] = measureBoard(capture, args.board)
+        else:
+            results[name] = measureHost(capture)
+        printResult(name, results[name], baseline.get(name))
+        failed += [name + " " + metric for metric in regressions(results[name], baseline.get(name, {}), metrics)]
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if len(failed) > 0:
+        print("Regressed past THRESHOLDS:", ", ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
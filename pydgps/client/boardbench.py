@@ -0,0 +1,124 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Board side of benchmark.py, run from the REPL by mpremote with BENCH_FILE and NO_READINGS set in front of it
+# main.py starts its loop when imported, so its acquisition path is repeated here with the capture on flash in place
+# of the UART: decoder -> frame queue -> parseUBXFrame -> epochs -> median/best -> LocationBlock.writeLog
+# the gc is held off during each reading so gc.mem_alloc() counts every byte the reading allocated, then a collect
+# with the reading's epochs still held gives the heap each epoch takes up
+import gc
+import utime
+import Epoch
+import Log
+import Stream
+from Message import *
+
+LOC_CODE = 0
+STAT_CODE = 1
+SATINF_CODE = 2
+CODES = {HPECEF: LOC_CODE, Status: STAT_CODE, SatInfo: SATINF_CODE}
+
+decoder = Stream.UBXDecoder(1024)
+frames = Stream.FrameQueue(2048, 25)
+assembler = Epoch.EpochAssembler(3, 4, 2000)
+capture = open(BENCH_FILE, "rb")
+chunk = bytearray(512)
+pending = b""
+
+
+# same job as readBytes, with the file in place of the UART, False once the capture is used up
+def readBytes():
+    global pending
+    while len(frames) == 0:
+        if len(pending) == 0:
+            n = capture.readinto(chunk)
+            if not n:
+                return False
+            pending = memoryview(chunk)[:n]
+        taken = decoder.feed(pending)
+        pending = pending[taken:]
+        while not frames.full():
+            start = decoder.nextFrame()
+            if start < 0:
+                break
+            if isRegistered(decoder.buf[start + 2], decoder.buf[start + 3]):
+                if not frames.push(decoder.buf, start, decoder.frameLength(start)):
+                    decoder.unread(start)
+                    break
+    return True
+
+
+def nextEpoch():
+    while readBytes():
+        start = frames.peek()
+        msg = parseUBXFrame(frames.buf, start)
+        frames.pop()
+        code = CODES.get(type(msg), -1)
+        if code >= 0:
+            epoch = assembler.add(msg.getTOW(), code, msg)
+            if epoch is not None:
+                return epoch
+    return None
+
+
+def reading(epochs):
+    while len(epochs) < NO_READINGS:
+        epoch = nextEpoch()
+        if epoch is None:
+            break
+        if epoch[STAT_CODE].gpsFixOK and not epoch[LOC_CODE].invalidFix:
+            epochs.append(epoch)
+    if len(epochs) > 0:
+        median = sorted(epochs, key=lambda e: e[LOC_CODE].getNormSq())[(len(epochs) - 1) // 2]
+        best = min(epochs, key=lambda e: e[LOC_CODE].getPAcc())
+        block = Log.LocationBlock(median[LOC_CODE], b'\x12', median[SATINF_CODE])
+        block.add(best[LOC_CODE], b'\x13', best[SATINF_CODE])
+        block.writeLog()
+        Log.commitLogs()
+
+
+readings = 0
+epochs = 0
+us = 0
+alloc = 0
+held = 0
+peak = 0
+while True:
+    kept = []
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    start = utime.ticks_us()
+    reading(kept)
+    took = utime.ticks_diff(utime.ticks_us(), start)
+    allocated = gc.mem_alloc()
+    gc.enable()
+    gc.collect()
+    n = len(kept)
+    if n == 0:
+        break
+    held += gc.mem_alloc() - before
+    kept = None
+    readings += 1
+    epochs += n
+    us += took
+    alloc += allocated - before
+    peak = max(peak, allocated)
+msgs = sum(hits.values())
+capture.close()
+print('{"readings": %d, "frames_per_s": %f, "wall_ms_per_reading": %f, "alloc_b_per_epoch": %f, "held_b_per_epoch": %f, '
+      '"peak_heap_kb": %f}' % (readings, msgs * 1000000 / max(us, 1), us / 1000 / max(readings, 1),
+                               alloc / max(epochs, 1), held / max(epochs, 1), peak / 1024))
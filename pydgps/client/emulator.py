@@ -0,0 +1,258 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Runs the board code (../pyb/main.py) on a PC with a recorded UBX capture in place of the receiver
+# pyb, lcd160cr and utime come from hostpyb/, which run everything off a virtual clock: main.py's waits move the
+# clock on instead of sleeping, so hours of readings, RTC wakeups and transmits take seconds
+#
+#   import emulator
+#   main = emulator.run("capture.ubx", {"log_period_s": 120}, seconds=900)
+#   main.pyb.uarts[3].written   # what was sent over the radio
+#
+# the logs are written to the run's working directory, as they would be to the board's flash
+import contextlib
+import datetime
+import importlib.util
+import json
+import os
+import struct
+import sys
+import tempfile
+
+import pybimport
+
+HOSTPYB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb")
+
+pybimport.install([HOSTPYB_DIR, pybimport.PYB_DIR])
+import pyb
+import Commands
+import Formats
+import Layouts
+
+Halt = pyb.Halt
+
+# on top of the rover's config: the LCD is left off so the board sleeps between readings as it does in the field
+# everything else is as config_r.json has it, the baud rate stepped up, the output configured (the Receiver below
+# answers both) and the asyncio runtime on; pass a config to change any of it
+EMULATOR_CONFIG = {
+    "lcd_start_on": False,
+}
+
+
+def loadCapture(capture):
+    if isinstance(capture, (bytes, bytearray)):
+        return bytes(capture)
+    with open(capture, "rb") as f:
+        return f.read()
+
+
+def packFrame(cls, id, payload):
+    body = struct.pack("<BBH", cls, id, len(payload)) + payload
+    return b"\xb5b" + body + bytes(Formats.ubxChecksum(body))
+
+
+# the receiver on the GPS UART, sending the capture's epochs and answering the configuration commands main.py
+# sends: CFG-VALSET sets its values (a new CFG_UART1_BAUDRATE takes effect at once, the ACK is sent at the new rate),
+# CFG-VALGET is answered with the values it has for the keys polled, each followed by an ACK as the M9 sends them
+# the capture's frames are sent only if their CFG_MSGOUT_UART1 key is on, every one is to begin with
+# a CFG_UART1_BAUDRATE above maxBaudrate is NAKed, as for a receiver that can't take it
+class Receiver(pyb.Feed):
+    REPLY_MS = 20 # from the end of a command to its reply
+
+    maxBaudrate = None
+    values = None
+    inbox = None # bytes written that aren't a whole frame yet
+    commands = None # (class, id) of every command answered
+    version = 0 # counts changes to the output keys, so a burst filtered before one is filtered again
+    clean = None # (burst, version) of the burst last filtered
+    outputKeys = None # class << 8 | id -> CFG_MSGOUT_UART1 key
+
+    def __init__(self, bursts, baudrate, maxBaudrate=None):
+        super().__init__(bursts)
+        self.baudrate = baudrate
+        self.maxBaudrate = maxBaudrate
+        self.values = {key: 1 for name, key in Commands.CFG_MSGOUT_UART1}
+        self.values[Commands.CFG_UART1OUTPROT_NMEA] = 1
+        self.values[Commands.CFG_UART1_BAUDRATE] = baudrate
+        self.inbox = bytearray()
+        self.commands = []
+        self.version = 0
+        self.clean = None
+        self.outputKeys = {}
+        for classs, id, name, fields in Layouts.MESSAGES:
+            for msgName, key in Commands.CFG_MSGOUT_UART1:
+                if msgName == name:
+                    self.outputKeys[classs << 8 | id] = key
+
+    def current(self):
+        t, data = self.bursts[self.burst]
+        if self.off > 0 or self.clean == (data, self.version):
+            return t, data
+        out = bytearray()
+        i = 0
+        while i < len(data):
+            n = 8 + (data[i + 4] | data[i + 5] << 8) if data[i:i + 2] == b"\xb5b" and i + 6 <= len(data) else 1
+            key = self.outputKeys.get(data[i + 2] << 8 | data[i + 3]) if n > 1 else None
+            if key is None or self.values.get(key, 0) != 0:
+                out += data[i:i + n]
+            i += n
+        data = bytes(out)
+        self.bursts[self.burst] = (t, data)
+        self.clean = (data, self.version)
+        return t, data
+
+    def written(self, uart, data):
+        if uart.baudrate != self.baudrate:
+            return # garbage to the receiver
+        self.inbox += data
+        while True:
+            start = self.inbox.find(b"\xb5b")
+            if start < 0 or start + 8 > len(self.inbox):
+                return
+            end = start + 8 + (self.inbox[start + 4] | self.inbox[start + 5] << 8)
+            if end > len(self.inbox):
+                return
+            frame = bytes(self.inbox[start:end])
+            del self.inbox[:end]
+            self.command(frame[2], frame[3], frame[6:-2])
+
+    def command(self, classs, id, payload):
+        self.commands.append((classs, id))
+        reply = b""
+        ack = 0x01
+        if (classs, id) == (0x06, 0x8A):
+            values = {}
+            at = 4
+            while at + 4 <= len(payload):
+                key = struct.unpack_from("<L", payload, at)[0]
+                size = Commands.KEY_SIZES[(key >> 28) & 7]
+                values[key] = int.from_bytes(payload[at + 4:at + 4 + size], "little")
+                at += 4 + size
+            rate = values.get(Commands.CFG_UART1_BAUDRATE, self.baudrate)
+            if self.maxBaudrate is not None and rate > self.maxBaudrate:
+                ack = 0x00
+            else:
+                self.values.update(values)
+                self.version += 1
+                self.baudrate = rate
+        elif (classs, id) == (0x06, 0x8B):
+            out = bytearray(struct.pack("<BBH", 1, payload[1], 0))
+            for at in range(4, len(payload) - 3, 4):
+                key = struct.unpack_from("<L", payload, at)[0]
+                if key in self.values:
+                    size = Commands.KEY_SIZES[(key >> 28) & 7]
+                    out += struct.pack("<L", key) + self.values[key].to_bytes(size, "little")
+            reply = packFrame(0x06, 0x8B, bytes(out))
+        self.send(pyb.clock.ms + self.REPLY_MS, reply + packFrame(0x05, ack, bytes((classs, id))))
+
+
+# splits a capture into the bursts the receiver sends each epoch, one every epochMs from startMs
+# a burst starts at each frame of the same type as the first frame, bytes that aren't a frame stay where they are
+def epochBursts(data, epochMs=1000, startMs=0):
+    bursts = []
+    first = None
+    burstStart = 0
+    i = 0
+    while i + 6 <= len(data):
+        if data[i] != 0xb5 or data[i + 1] != 0x62:
+            i += 1
+            continue
+        key = data[i + 2] << 8 | data[i + 3]
+        if first is None:
+            first = key
+        elif key == first and i > burstStart:
+            bursts.append(data[burstStart:i])
+            burstStart = i
+        i += 8 + (data[i + 4] | data[i + 5] << 8)
+    bursts.append(data[burstStart:])
+    return [(startMs + n * epochMs, burst) for n, burst in enumerate(bursts) if len(burst) > 0]
+
+
+# board modules are imported afresh for each run, so nothing is left over from the one before
+def forgetBoardModules():
+    dirs = (os.path.abspath(HOSTPYB_DIR), os.path.abspath(pybimport.PYB_DIR))
+    for name, module in list(sys.modules.items()):
+        fn = getattr(module, "__file__", None)
+        if fn is not None and os.path.dirname(os.path.abspath(fn)) in dirs and name != "pyb":
+            del sys.modules[name]
+
+
+def writeConfig(workdir, config):
+    with open(os.path.join(pybimport.PYB_DIR, "config_r.json")) as f:
+        data = json.load(f)
+    data.update(EMULATOR_CONFIG)
+    if config is not None:
+        data.update(config)
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump(data, f, indent=2)
+    return data
+
+
+# main.py's working directory, where it finds config.json and writes its logs
+# with quiet, its printing goes to console.txt there
+@contextlib.contextmanager
+def boardContext(workdir, quiet=True):
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                console = stack.enter_context(open("console.txt", "a"))
+                stack.enter_context(contextlib.redirect_stdout(console))
+            yield
+    finally:
+        os.chdir(cwd)
+
+
+# runs main.py until the virtual clock reaches seconds, returning the main module as it was left
+# capture is a file name or bytes, fed to the GPS UART one epoch every epochMs
+# rtc is the time the board's RTC starts at (it is set from the capture once a NAV-TIMEUTC is parsed)
+# the receiver starts at receiverBaudrate (gps_baudrate if None), and NAKs any rate above maxBaudrate
+def run(capture, config=None, seconds=600, workdir=None, rtc=datetime.datetime(2021, 4, 1, 11, 55),
+        epochMs=1000, quiet=True, receiverBaudrate=None, maxBaudrate=None):
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix="bergprobe-")
+    data = writeConfig(workdir, config)
+
+    forgetBoardModules()
+    pyb.reset(rtc)
+    pyb.clock.until = seconds * 1000
+    if receiverBaudrate is None:
+        receiverBaudrate = data.get("gps_baudrate", 38400)
+    pyb.feeds[data.get("gps_uart", 6)] = Receiver(epochBursts(loadCapture(capture), epochMs), receiverBaudrate,
+                                                  maxBaudrate)
+
+    spec = importlib.util.find_spec("main")
+    main = importlib.util.module_from_spec(spec)
+    sys.modules["main"] = main
+    with boardContext(workdir, quiet):
+        try:
+            spec.loader.exec_module(main)
+        except Halt:
+            pass
+    main.workdir = workdir
+    return main
+
+
+if __name__ == "__main__":
+    import time
+
+    wall = time.perf_counter()
+    m = run(sys.argv[1], seconds=int(sys.argv[2]) if len(sys.argv) > 2 else 600)
+    print("{0:.0f} s emulated in {1:.2f} s, logs in {2}".format(pyb.clock.ms / 1000, time.perf_counter() - wall,
+                                                                m.workdir))
+    for fn in sorted(os.listdir(m.workdir)):
+        print(fn, os.path.getsize(os.path.join(m.workdir, fn)))
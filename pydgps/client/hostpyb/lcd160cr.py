@@ -0,0 +1,88 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Host stand-in for the lcd160cr driver, see hostpyb/pyb.py
+# draws nothing, it keeps the text written since the last erase so a run can check what the screen showed
+PORTRAIT = 0
+LANDSCAPE = 1
+PORTRAIT_UPSIDEDOWN = 2
+LANDSCAPE_UPSIDEDOWN = 3
+
+
+class LCD160CR:
+    w = 128
+    h = 160
+    power = 1
+    orient = PORTRAIT
+    text = "" # written since the last erase
+    touch = (0, 0, 0) # (active, x, y) get_touch returns, set it to press the screen
+
+    def __init__(self, connect=None, **kwargs):
+        self.text = ""
+        self.touch = (0, 0, 0)
+
+    @staticmethod
+    def rgb(r, g, b):
+        return (b & 0xf8) << 8 | (g & 0xfc) << 3 | r >> 3
+
+    def set_power(self, on):
+        self.power = on
+
+    def set_orient(self, orient):
+        self.orient = orient
+        if orient & 1:
+            self.w, self.h = 160, 128
+        else:
+            self.w, self.h = 128, 160
+
+    def set_pos(self, x, y):
+        pass
+
+    def set_font(self, font, scale=0, bold=0, trans=0, scroll=0):
+        pass
+
+    def set_text_color(self, fg, bg):
+        pass
+
+    def set_pen(self, line, fill):
+        pass
+
+    def set_scroll(self, on):
+        pass
+
+    def erase(self):
+        self.text = ""
+
+    def write(self, s):
+        self.text += s
+
+    def line(self, x1, y1, x2, y2):
+        pass
+
+    def poly_line(self, data):
+        pass
+
+    def rect_interior(self, x, y, w, h):
+        pass
+
+    def rect_outline(self, x, y, w, h):
+        pass
+
+    def get_touch(self):
+        return self.touch
+
+    def save_to_flash(self):
+        pass
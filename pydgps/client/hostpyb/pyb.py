@@ -0,0 +1,426 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Host stand-in for the pyboard's pyb module so the code in ../pyb can run under CPython, see client/emulator.py
+# nothing here touches hardware or real time: everything runs off a virtual clock that only moves when the board
+# code waits (delay, wfi, stop, a blocking UART read), so a reading that takes minutes on the board takes as long
+# as the CPU needs to parse its bytes
+# RTC wakeup and switch callbacks are run from delay/wfi/stop, never in the middle of a UART read, and never
+# inside another callback
+import datetime
+
+TIMER_CLOCK = 84000000 # Hz, timer 2 on APB1 of the pyboard v1.1
+
+
+# raised from a wait once the clock passes the end of the run, ends main.py's loop from the inside
+class Halt(Exception):
+    pass
+
+
+class VirtualClock:
+    ms = 0.0
+    until = None # ms the run ends at, None to run forever
+
+    def __init__(self):
+        self.ms = 0.0
+        self.until = None
+
+    # moves time on without running any callbacks, for waits that can't be interrupted
+    def wait(self, ms):
+        if ms > 0:
+            self.ms += ms
+
+    def waitUntil(self, ms):
+        if ms > self.ms:
+            self.ms = ms
+
+    # sleeps until ms, running every RTC wakeup that falls due on the way
+    def sleepUntil(self, ms):
+        if self.until is not None and ms > self.until:
+            ms = self.until
+        while not inCallback:
+            due = rtc.nextWakeup()
+            if due is None or due > ms:
+                break
+            self.waitUntil(due)
+            rtc.fire()
+        self.waitUntil(ms)
+        self.check()
+
+    def check(self):
+        if self.until is not None and self.ms >= self.until:
+            raise Halt("virtual clock reached {0} ms".format(self.until))
+
+
+clock = VirtualClock()
+inCallback = False
+
+
+def runCallback(callback, arg):
+    global inCallback
+    inCallback = True
+    try:
+        callback(arg)
+    finally:
+        inCallback = False
+
+
+def millis():
+    return int(clock.ms)
+
+
+def micros():
+    return int(clock.ms * 1000)
+
+
+def elapsed_millis(start):
+    return millis() - start
+
+
+def elapsed_micros(start):
+    return micros() - start
+
+
+def delay(ms):
+    clock.sleepUntil(clock.ms + ms)
+
+
+def udelay(us):
+    clock.sleepUntil(clock.ms + us / 1000)
+
+
+# the next interrupt is the next RTC wakeup, nothing else can change while the board waits for it
+def wfi():
+    due = rtc.nextWakeup()
+    if due is None:
+        due = clock.until if clock.until is not None else clock.ms + 1
+    clock.sleepUntil(due)
+
+
+def stop():
+    wfi()
+
+
+def standby():
+    raise Halt("standby")
+
+
+def main(filename):
+    pass
+
+
+def country(code):
+    pass
+
+
+def freq():
+    return 168000000, 168000000, 42000000, 84000000
+
+
+# bytes arriving on a UART, a list of (ms, data) bursts sent back to back at the UART's baud rate
+# each burst starts at its ms or when the one before it has been sent, whichever is later
+# a feed with a baudrate of its own is a device that can be at a different rate to the UART, its bytes are garbled then
+class Feed:
+    bursts = None
+    burst = 0
+    off = 0
+    line = 0.0 # ms the last byte sent finished
+    baudrate = None # None to always be at the UART's rate
+
+    def __init__(self, bursts):
+        self.bursts = bursts
+        self.burst = 0
+        self.off = 0
+        self.line = 0.0
+
+    # the burst being sent, for a device to change (e.g. filter) as it starts
+    def current(self):
+        return self.bursts[self.burst]
+
+    # called with what the board writes to the UART, for a device to answer with send()
+    def written(self, uart, data):
+        pass
+
+    # adds a burst to be sent at ms, after the ones already due by then
+    def send(self, ms, data):
+        i = self.burst + 1 if self.off > 0 else self.burst
+        while i < len(self.bursts) and self.bursts[i][0] <= ms:
+            i += 1
+        self.bursts.insert(i, (ms, data))
+
+    # ms the next byte has arrived by, None once everything has been sent
+    def nextArrival(self, byteMs):
+        if self.burst >= len(self.bursts):
+            return None
+        return max(self.bursts[self.burst][0], self.line) + byteMs
+
+    # hands every byte that has arrived by now to received(data, start, n)
+    def arrive(self, now, byteMs, received):
+        while self.burst < len(self.bursts):
+            t, data = self.current()
+            start = max(t, self.line)
+            n = min(int((now - start) / byteMs + 1e-9), len(data) - self.off)
+            if n <= 0:
+                return
+            received(data, self.off, n)
+            self.off += n
+            self.line = start + n * byteMs
+            if self.off < len(data):
+                return
+            self.burst += 1
+            self.off = 0
+
+
+feeds = {} # port -> Feed, set before the UART is made
+uarts = {} # port -> UART, every UART the board code has made
+
+
+class UART:
+    port = 0
+    baudrate = 9600
+    timeout = 0
+    timeout_char = 0
+    read_buf_len = 64
+    rx = None # bytes received but not read yet
+    written = None # every byte the board has written
+    overflows = 0 # bytes lost with rx full, as the real UART drops them
+
+    def __init__(self, port, baudrate=None, **kwargs):
+        self.port = port
+        self.rx = bytearray()
+        self.written = bytearray()
+        self.overflows = 0
+        uarts[port] = self
+        if baudrate is not None:
+            self.init(baudrate, **kwargs)
+
+    def init(self, baudrate, bits=8, parity=None, stop=1, timeout=0, timeout_char=0, read_buf_len=64, **kwargs):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        # at least one character, as pyb makes it
+        self.timeout_char = max(timeout_char, 13000 // baudrate + 1)
+        self.read_buf_len = read_buf_len
+        self.arrive()
+        self.rx = bytearray()
+
+    def deinit(self):
+        pass
+
+    def byteMs(self):
+        return 10000 / self.baudrate # start + 8 data + stop bits
+
+    def arrive(self):
+        feed = feeds.get(self.port)
+        if feed is not None:
+            feed.arrive(clock.ms, self.byteMs(), self.received)
+
+    def received(self, data, start, n):
+        room = min(n, self.read_buf_len - len(self.rx))
+        if room > 0:
+            chunk = data[start:start + room]
+            feed = feeds.get(self.port)
+            if feed.baudrate is not None and feed.baudrate != self.baudrate:
+                chunk = bytes(b ^ 0xA5 for b in chunk) # sampled at the wrong rate
+            self.rx.extend(chunk)
+        self.overflows += n - room
+
+    def nextArrival(self):
+        feed = feeds.get(self.port)
+        if feed is None:
+            return None
+        return feed.nextArrival(self.byteMs())
+
+    def any(self):
+        self.arrive()
+        return len(self.rx)
+
+    # waits at most ms for another byte, True if one arrived
+    def waitForByte(self, ms):
+        t = self.nextArrival()
+        if t is None or t > clock.ms + ms:
+            clock.wait(ms)
+            return False
+        clock.waitUntil(t)
+        self.arrive()
+        return True
+
+    def readinto(self, buf, nbytes=-1):
+        if nbytes < 0 or nbytes > len(buf):
+            nbytes = len(buf)
+        self.arrive()
+        if len(self.rx) == 0 and not self.waitForByte(self.timeout):
+            return None
+        got = 0
+        while True:
+            n = min(nbytes - got, len(self.rx))
+            buf[got:got + n] = self.rx[:n]
+            del self.rx[:n]
+            got += n
+            if got >= nbytes or not self.waitForByte(self.timeout_char):
+                return got
+
+    def read(self, nbytes=-1):
+        if nbytes < 0:
+            self.arrive()
+            nbytes = max(len(self.rx), 1)
+        buf = bytearray(nbytes)
+        n = self.readinto(buf)
+        if n is None:
+            return None
+        return bytes(buf[:n])
+
+    def readchar(self):
+        data = self.read(1)
+        return -1 if data is None else data[0]
+
+    def write(self, buf):
+        self.written.extend(buf)
+        clock.wait(len(buf) * self.byteMs())
+        feed = feeds.get(self.port)
+        if feed is not None:
+            feed.written(self, bytes(buf))
+        return len(buf)
+
+    def writechar(self, char):
+        self.write(bytes((char,)))
+
+
+class RTC:
+    base = datetime.datetime(2000, 1, 1)
+    setAt = 0.0 # clock.ms base was set at
+    period = None # wakeup period in ms, None when off
+    due = None
+    callback = None
+
+    # the board has one RTC, every RTC() is it
+    def __new__(cls):
+        global rtc
+        if rtc is None:
+            rtc = super().__new__(cls)
+        return rtc
+
+    def now(self):
+        return self.base + datetime.timedelta(milliseconds=clock.ms - self.setAt)
+
+    def datetime(self, datetimetuple=None):
+        if datetimetuple is None:
+            t = self.now()
+            subseconds = 255 - t.microsecond * 256 // 1000000
+            return t.year, t.month, t.day, t.isoweekday(), t.hour, t.minute, t.second, subseconds
+        year, month, day, weekday, hours, minutes, seconds = datetimetuple[:7]
+        self.base = datetime.datetime(year, month, day, hours, minutes, seconds)
+        self.setAt = clock.ms
+
+    def wakeup(self, timeout, callback=None):
+        if timeout is None:
+            self.period = None
+            self.due = None
+            return
+        self.period = timeout
+        self.due = clock.ms + timeout
+        self.callback = callback
+
+    def nextWakeup(self):
+        return self.due
+
+    def fire(self):
+        self.due += self.period
+        if self.callback is not None:
+            runCallback(self.callback, self)
+
+
+rtc = None
+RTC()
+
+
+class LED:
+    def __init__(self, id):
+        self.id = id
+
+    def on(self):
+        leds[self.id] = 255
+
+    def off(self):
+        leds[self.id] = 0
+
+    def toggle(self):
+        leds[self.id] = 0 if leds.get(self.id, 0) else 255
+
+    def intensity(self, value=None):
+        if value is None:
+            return leds.get(self.id, 0)
+        leds[self.id] = value
+
+
+leds = {}
+
+
+class Timer:
+    def __init__(self, id, prescaler=0, period=0xffff, **kwargs):
+        self.id = id
+        self.prescaler = prescaler
+        self.period = period
+        self.start = clock.ms
+
+    def ticks(self):
+        return int((clock.ms - self.start) * TIMER_CLOCK / 1000 / (self.prescaler + 1))
+
+    def counter(self, value=None):
+        if value is None:
+            return self.ticks() % (self.period + 1)
+        self.start = clock.ms - value * 1000 * (self.prescaler + 1) / TIMER_CLOCK
+
+    def callback(self, fun):
+        pass
+
+    def deinit(self):
+        pass
+
+
+switchCallback = None
+
+
+class Switch:
+    def __call__(self):
+        return False
+
+    def value(self):
+        return False
+
+    def callback(self, fun):
+        global switchCallback
+        switchCallback = fun
+
+
+# presses the USR switch, running its callback now as the interrupt would
+def pressSwitch():
+    if switchCallback is not None:
+        runCallback(lambda arg: switchCallback(), None)
+
+
+# back to power on: no UARTs, clock at 0 with the RTC at base
+def reset(base=datetime.datetime(2000, 1, 1)):
+    global switchCallback, inCallback
+    clock.__init__()
+    inCallback = False
+    feeds.clear()
+    uarts.clear()
+    leds.clear()
+    switchCallback = None
+    rtc.base = base
+    rtc.setAt = 0.0
+    rtc.wakeup(None)
+    rtc.callback = None
@@ -0,0 +1,229 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Host stand-in for MicroPython's uasyncio on the virtual clock of hostpyb/pyb.py, as much of it as main.py uses
+# tasks take turns as they do on the board, and once every task is waiting the clock jumps to the first time one of
+# them can go on (a sleep or timeout ending, a byte arriving on a UART it reads), running RTC wakeups on the way
+# an exception in a task ends the run instead of being printed, so the emulator's tests see it (pyb.Halt included)
+import pyb
+
+TimeoutError = TimeoutError
+
+
+class CancelledError(BaseException):
+    pass
+
+
+# what a task is waiting for, yielded up to the loop
+class Wait:
+    until = None # clock ms a sleep ends at
+    deadline = None # clock ms the wait times out at, with TimeoutError
+    event = None
+    task = None # a task to finish
+    uart = None # a UART to have a byte to read
+
+    def __init__(self, until=None, deadline=None, event=None, task=None, uart=None):
+        self.until = until
+        self.deadline = deadline
+        self.event = event
+        self.task = task
+        self.uart = uart
+
+    def __await__(self):
+        value = yield self
+        return value
+
+    # the value or exception the task goes on with, None if it has to wait longer
+    def outcome(self):
+        if self.until is not None and pyb.clock.ms >= self.until:
+            return (None, None)
+        if self.event is not None and self.event.state:
+            return (True, None)
+        if self.task is not None and self.task.done:
+            return (self.task.result, self.task.error)
+        if self.uart is not None and self.uart.any() > 0:
+            return (None, None)
+        if self.deadline is not None and pyb.clock.ms >= self.deadline:
+            return (None, TimeoutError())
+        return None
+
+    # clock ms the wait may end at without another task doing anything, None if only another task can end it
+    def due(self):
+        times = [t for t in (self.until, self.deadline) if t is not None]
+        if self.uart is not None:
+            arrival = self.uart.nextArrival()
+            if arrival is not None:
+                times.append(arrival)
+        return min(times) if len(times) > 0 else None
+
+
+class Task:
+    def __init__(self, coro):
+        self.coro = coro
+        self.done = False
+        self.result = None
+        self.error = None
+        self.wait = None
+
+    def finish(self, result, error):
+        self.done = True
+        self.result = result
+        self.error = error
+
+    def cancel(self):
+        if not self.done:
+            self.coro.close()
+            self.finish(None, CancelledError())
+
+
+class Loop:
+    def __init__(self):
+        self.ready = [] # (task, value, exception) to run next, in turn
+        self.waiting = []
+
+    def start(self, task):
+        self.ready.append((task, None, None))
+
+    def step(self, task, value, error):
+        try:
+            if error is not None:
+                wait = task.coro.throw(error)
+            else:
+                wait = task.coro.send(value)
+        except StopIteration as e:
+            task.finish(e.value, None)
+            return
+        except CancelledError:
+            task.finish(None, CancelledError())
+            return
+        task.wait = wait
+        self.waiting.append(task)
+
+    # moves every task that can go on to ready
+    def wake(self):
+        for task in list(self.waiting):
+            if task.done:
+                self.waiting.remove(task)
+                continue
+            outcome = task.wait.outcome()
+            if outcome is not None:
+                self.waiting.remove(task)
+                self.ready.append((task, outcome[0], outcome[1]))
+
+    def runUntil(self, main):
+        while not main.done:
+            self.wake()
+            if len(self.ready) > 0:
+                task, value, error = self.ready.pop(0)
+                if not task.done:
+                    self.step(task, value, error)
+                continue
+            times = [t for t in (task.wait.due() for task in self.waiting) if t is not None]
+            if len(times) == 0 and pyb.clock.until is None:
+                raise RuntimeError("every task is waiting with nothing to wake it")
+            # always some way on, so a byte due a rounding error before it arrives can't stop the clock
+            pyb.clock.sleepUntil(max(min(times), pyb.clock.ms + 0.001) if len(times) > 0 else pyb.clock.until)
+        if main.error is not None:
+            raise main.error
+        return main.result
+
+
+loop = Loop()
+
+
+def create_task(coro):
+    task = Task(coro)
+    loop.start(task)
+    return task
+
+
+def run(coro):
+    global loop
+    loop = Loop()
+    return loop.runUntil(create_task(coro))
+
+
+async def sleep_ms(ms):
+    await Wait(until=pyb.clock.ms + max(ms, 0))
+
+
+async def sleep(seconds):
+    await sleep_ms(seconds * 1000)
+
+
+async def wait_for_ms(aw, timeout):
+    task = create_task(aw)
+    try:
+        return await Wait(task=task, deadline=pyb.clock.ms + timeout)
+    except TimeoutError:
+        task.cancel()
+        raise
+
+
+class Event:
+    def __init__(self):
+        self.state = False
+
+    def is_set(self):
+        return self.state
+
+    # a task already waiting goes on even if the event is cleared before its turn, as on the board
+    def set(self):
+        self.state = True
+        for task in list(loop.waiting):
+            if task.wait.event is self:
+                loop.waiting.remove(task)
+                loop.ready.append((task, True, None))
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        if not self.state:
+            await Wait(event=self)
+        return True
+
+
+# reads wait for the UART to have a byte, then take what it has without waiting for more
+class StreamReader:
+    def __init__(self, uart):
+        self.uart = uart
+
+    async def readinto(self, buf):
+        await Wait(uart=self.uart)
+        n = min(len(buf), self.uart.any())
+        return self.uart.readinto(buf, n)
+
+    async def read(self, n=-1):
+        await Wait(uart=self.uart)
+        if n < 0:
+            n = self.uart.any()
+        return self.uart.read(min(n, self.uart.any()))
+
+
+class StreamWriter:
+    def __init__(self, uart, extra=None):
+        self.uart = uart
+        self.out = bytearray()
+
+    def write(self, data):
+        self.out.extend(data)
+
+    async def drain(self):
+        data = bytes(self.out)
+        self.out = bytearray()
+        self.uart.write(data)
+        await sleep_ms(0)
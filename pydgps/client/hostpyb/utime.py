@@ -0,0 +1,61 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Host stand-in for MicroPython's utime, on the virtual clock and RTC of hostpyb/pyb.py
+import datetime
+
+import pyb
+
+EPOCH = datetime.datetime(2000, 1, 1) # MicroPython's epoch on the pyboard
+TICKS_PERIOD = 1 << 30
+
+
+# seconds since EPOCH by the RTC
+def time():
+    return int((pyb.rtc.now() - EPOCH).total_seconds())
+
+
+def localtime(secs=None):
+    t = pyb.rtc.now() if secs is None else EPOCH + datetime.timedelta(seconds=secs)
+    return t.year, t.month, t.day, t.hour, t.minute, t.second, t.weekday(), t.timetuple().tm_yday
+
+
+def ticks_ms():
+    return pyb.millis() % TICKS_PERIOD
+
+
+def ticks_us():
+    return pyb.micros() % TICKS_PERIOD
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    return (ticks1 - ticks2 + TICKS_PERIOD // 2) % TICKS_PERIOD - TICKS_PERIOD // 2
+
+
+def sleep(seconds):
+    pyb.delay(seconds * 1000)
+
+
+def sleep_ms(ms):
+    pyb.delay(ms)
+
+
+def sleep_us(us):
+    pyb.udelay(us)
@@ -0,0 +1,124 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Indexes of the board's log files (see Log.py) on a PC: builds the .idx of any log that has none or whose index is
+# behind it, and pulls the location fixes of a time range out of a season of logs through them
+#
+#   python logindex.py logs/                                         index the logs without a current index
+#   python logindex.py logs/ --rebuild                               index every log again
+#   python logindex.py logs/ --from 2021-04-01 --to 2021-04-08 --kind med
+#
+# fixes are printed as kind,date,x,y,z,pAcc,numSvs with the position in cm, as unparseLog writes them
+import argparse
+import datetime
+import os
+import struct
+import sys
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import Log
+
+KINDS = dict((name, kind) for kind, name in Log.BLOCK_KINDS.items())
+# a location block is timed at its first fix and holds the rest of that reading's, which are well within this of it
+BLOCK_SPAN = datetime.timedelta(hours=1)
+
+
+def logFiles(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, fn) for fn in sorted(os.listdir(path)) if fn.endswith(".bin")]
+        else:
+            files.append(path)
+    return files
+
+
+# the fixes of a record as (time, kind, x, y, z, pAcc, numSvs), time as Log.getTime gives it and x, y and z as
+# (cm, hp) pairs
+def recordFixes(date, type, data):
+    type = type[0]
+    time = Log.getTime(date)
+    if type == Log.BLOCK_TYPE[0]:
+        return [(Log.addSeconds(time, fix[7]), fix[0]) + fix[2:7] for fix in Log.readLocationBlock(data) or []]
+    if type in Log.BLOCK_KINDS and len(data) >= 20:
+        x, y, z, xhp, yhp, zhp, pacc, svs = struct.unpack("<lllbbbLB", data[:20])
+        return [(time, type, (x, xhp), (y, yhp), (z, zhp), pacc, svs)]
+    return []
+
+
+# (year, month, day) a daily log is for, from its name (see Log.getdtstring), None if it isn't named that way
+def logDay(filename):
+    try:
+        day, month, year = map(int, os.path.basename(filename).split("-")[:3])
+    except ValueError:
+        return None
+    return year, month, day
+
+
+def parseDate(text):
+    return timeTuple(datetime.datetime.fromisoformat(text))
+
+
+def timeTuple(t):
+    return t.year, t.month, t.day, t.hour, t.minute, t.second
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index the board's log files and read fixes through the indexes")
+    parser.add_argument("paths", nargs="+", help="log files, or directories of them")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="index every log again, not just those without a current index")
+    parser.add_argument("--from", dest="start", type=parseDate, help="first time to print fixes for (ISO format)")
+    parser.add_argument("--to", dest="end", type=parseDate,
+                        help="time to print fixes up to, not including it (ISO format)")
+    parser.add_argument("--kind", action="append", choices=sorted(KINDS), help="kinds of fix to print, all by default")
+    args = parser.parse_args(argv)
+
+    files = logFiles(args.paths)
+    for fn in files:
+        if args.rebuild or not Log.indexIsCurrent(fn):
+            Log.rebuildIndex(fn)
+            print("indexed", fn, file=sys.stderr)
+    if args.start is None and args.end is None and args.kind is None:
+        return 0
+
+    kinds = tuple(KINDS[k] for k in args.kind) if args.kind is not None else tuple(Log.BLOCK_KINDS)
+    # records are looked up from BLOCK_SPAN before the start, for blocks started before it with fixes after
+    first = None
+    if args.start is not None:
+        first = timeTuple(datetime.datetime(*args.start) - BLOCK_SPAN)
+    for fn in files:
+        # a day's records are all in that day's files, so the other days' indexes aren't read at all
+        day = logDay(fn)
+        if day is not None and (first is not None and day < first[:3] or
+                                args.end is not None and day > args.end[:3]):
+            continue
+        for date, did, type, data in Log.seekRecords(fn, first, args.end, kinds=kinds):
+            for time, kind, x, y, z, pacc, svs in recordFixes(date, type, data):
+                if kind not in kinds or args.start is not None and time < args.start or \
+                        args.end is not None and time >= args.end:
+                    continue
+                when = "{2}/{1}/{0} {3}:{4}:{5}".format(*time)
+                print("{0},{1},{2:.2f},{3:.2f},{4:.2f},{5:.2f},{6}".format(
+                    Log.BLOCK_KINDS[kind], when, x[0] + 1e-2 * x[1], y[0] + 1e-2 * y[1], z[0] + 1e-2 * z[1],
+                    pacc * .01, svs))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Lets the PC code import the modules in ../pyb (import Layouts, import Message, ...)
+# the sources start with a C style licence block which CPython can't compile, it is blanked out on import
+# (keeping the line numbers) instead of keeping a second copy of the board code here
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+PYB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyb")
+
+
+def stripBanner(data):
+    if not data.startswith(b"/*"):
+        return data
+    end = data.index(b"*/") + 2
+    return b"\n" * data.count(b"\n", 0, end) + data[end:]
+
+
+class PybLoader(importlib.machinery.SourceFileLoader):
+    def get_data(self, path):
+        data = super().get_data(path)
+        if path.endswith(".py"):
+            return stripBanner(data)
+        return data
+
+
+class PybFinder(importlib.abc.MetaPathFinder):
+    dirs = None
+
+    def __init__(self, dirs):
+        self.dirs = dirs
+
+    def find_spec(self, fullname, path, target=None):
+        if "." in fullname:
+            return None
+        for d in self.dirs:
+            fn = os.path.join(d, fullname + ".py")
+            if os.path.exists(fn):
+                return importlib.util.spec_from_file_location(fullname, fn, loader=PybLoader(fullname, fn))
+        return None
+
+
+# dirs are searched before sys.path, later calls put their dirs in front of the earlier ones
+def install(dirs=None):
+    if dirs is None:
+        dirs = [PYB_DIR]
+    sys.meta_path.insert(0, PybFinder([os.path.abspath(d) for d in dirs]))
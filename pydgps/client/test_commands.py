@@ -0,0 +1,159 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks of the receiver commands (../pyb/Commands.py) on a PC
+#
+#   python -m unittest test_commands
+import os
+import struct
+import unittest
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import Commands
+import Formats
+
+
+class UART:
+    def __init__(self):
+        self.written = bytearray()
+
+    def write(self, buf):
+        self.written.extend(buf)
+
+
+# (class, id, payload) of a frame, checking its sync chars, length and checksum
+def unpackFrame(test, frame):
+    frame = bytes(frame)
+    test.assertEqual(frame[:2], b"\xb5b")
+    length = frame[4] | frame[5] << 8
+    test.assertEqual(len(frame), length + 8)
+    test.assertEqual(tuple(frame[-2:]), Formats.ubxChecksum(frame[2:-2]))
+    return frame[2], frame[3], frame[6:-2]
+
+
+# the key/value pairs of a CFG-VALSET payload, values read unsigned at the size the key gives
+def valsetPairs(payload):
+    pairs = []
+    at = 4
+    while at < len(payload):
+        key = struct.unpack_from("<L", payload, at)[0]
+        size = Commands.KEY_SIZES[(key >> 28) & 7]
+        pairs.append((key, int.from_bytes(payload[at + 4:at + 4 + size], "little")))
+        at += 4 + size
+    return pairs
+
+
+# a CFG-VALGET reply with the given values, as the receiver sends it
+def valgetReply(values, layer=Commands.POLL_RAM):
+    payload = bytearray(struct.pack("<BBH", 1, layer, 0))
+    for key, value in values:
+        payload += struct.pack("<L", key) + struct.pack(Commands.KEY_CODES[(key >> 28) & 7], value)
+    body = struct.pack("<BBH", 0x06, 0x8B, len(payload)) + payload
+    return b"\xb5b" + body + bytes(Formats.ubxChecksum(body))
+
+
+class ValSetTest(unittest.TestCase):
+    def test_message_output(self):
+        enabled = ("NAV-HPPOSECEF", "NAV-STATUS", "NAV-SAT")
+        classs, id, payload = unpackFrame(self, Commands.messageOutput(enabled).frame())
+        self.assertEqual((classs, id), (0x06, 0x8A))
+        self.assertEqual(tuple(payload[:4]), (0, Commands.LAYER_RAM, 0, 0))
+        expected = [(key, 1 if name in enabled else 0) for name, key in Commands.CFG_MSGOUT_UART1]
+        self.assertEqual(valsetPairs(payload), expected + [(Commands.CFG_UART1OUTPROT_NMEA, 0)])
+        # one byte values for these keys
+        self.assertEqual(len(payload), 4 + 5 * (len(Commands.CFG_MSGOUT_UART1) + 1))
+
+    def test_fixed_position_sizes_and_signs(self):
+        command = Commands.fixedPosition(-385000000, 20000000, -1, -7, 99, -128, 25000)
+        classs, id, payload = unpackFrame(self, command.frame())
+        self.assertEqual(payload[1], Commands.LAYER_ALL)
+        self.assertEqual(valsetPairs(payload), [(Commands.CFG_TMODE_MODE, Commands.TMODE_FIXED),
+                                                (Commands.CFG_TMODE_POS_TYPE, 0),
+                                                (Commands.CFG_TMODE_ECEF_X, -385000000 & 0xFFFFFFFF),
+                                                (Commands.CFG_TMODE_ECEF_Y, 20000000),
+                                                (Commands.CFG_TMODE_ECEF_Z, 0xFFFFFFFF),
+                                                (Commands.CFG_TMODE_ECEF_X_HP, 0xF9),
+                                                (Commands.CFG_TMODE_ECEF_Y_HP, 99),
+                                                (Commands.CFG_TMODE_ECEF_Z_HP, 0x80),
+                                                (Commands.CFG_TMODE_FIXED_POS_ACC, 25000)])
+
+    # the template is reused, nothing from a longer command before it is left in the frame
+    def test_reuse(self):
+        Commands.fixedPosition(1, 2, 3, 4, 5, 6, 7).frame()
+        classs, id, payload = unpackFrame(self, Commands.baudrate(460800).frame())
+        self.assertEqual(valsetPairs(payload), [(Commands.CFG_UART1_BAUDRATE, 460800)])
+        classs, id, payload = unpackFrame(self, Commands.surveyIn(600, 10000, Commands.LAYER_RAM).frame())
+        self.assertEqual(valsetPairs(payload), [(Commands.CFG_TMODE_MODE, Commands.TMODE_SURVEY_IN),
+                                                (Commands.CFG_TMODE_SVIN_MIN_DUR, 600),
+                                                (Commands.CFG_TMODE_SVIN_ACC_LIMIT, 10000)])
+
+    def test_too_many_keys(self):
+        valset = Commands.ValSet(2).begin()
+        valset.add(Commands.CFG_TMODE_MODE, 0).add(Commands.CFG_TMODE_POS_TYPE, 0)
+        self.assertRaises(ValueError, valset.add, Commands.CFG_TMODE_MODE, 0)
+        self.assertRaises(ValueError, Commands.ValGet(0).begin().add, Commands.CFG_TMODE_MODE)
+
+
+class ValGetTest(unittest.TestCase):
+    def setUp(self):
+        Commands.pending.clear()
+
+    def test_poll_frame(self):
+        classs, id, payload = unpackFrame(self, Commands.pollMessageOutput(Commands.POLL_FLASH).finish(
+            Commands.valget.length))
+        self.assertEqual((classs, id), (0x06, 0x8B))
+        self.assertEqual(tuple(payload[:4]), (0, Commands.POLL_FLASH, 0, 0))
+        keys = list(struct.unpack_from("<%dL" % ((len(payload) - 4) // 4), payload, 4))
+        self.assertEqual(keys, [key for name, key in Commands.CFG_MSGOUT_UART1] + [Commands.CFG_UART1OUTPROT_NMEA])
+
+    def test_reply_read_and_matched(self):
+        enabled = ("NAV-HPPOSECEF", "NAV-PVT")
+        uart = UART()
+        Commands.send(uart, Commands.pollMessageOutput())
+        self.assertEqual(Commands.ackState(Commands.valget), Commands.ACK_WAITING)
+        unpackFrame(self, uart.written)
+        reply = valgetReply([(key, 1 if name in enabled else 0) for name, key in Commands.CFG_MSGOUT_UART1] +
+                            [(Commands.CFG_UART1OUTPROT_NMEA, 0), (Commands.CFG_UART1_BAUDRATE, 921600)])
+        Commands.valuesReceived(b"junk" + reply, 4)
+        self.assertEqual(Commands.ackState(Commands.valget), Commands.ACK_ACKED)
+        self.assertTrue(Commands.outputMatches(enabled))
+        self.assertFalse(Commands.outputMatches(("NAV-HPPOSECEF",)))
+        self.assertEqual(Commands.values[Commands.CFG_UART1_BAUDRATE], 921600)
+
+    # a reply cut short keeps the values that were whole
+    def test_truncated_reply(self):
+        Commands.values.clear()
+        reply = bytearray(valgetReply([(Commands.CFG_UART1_BAUDRATE, 115200), (Commands.CFG_TMODE_MODE, 2)]))
+        reply[4] -= 1
+        Commands.valuesReceived(reply, 0)
+        self.assertEqual(Commands.values, {Commands.CFG_UART1_BAUDRATE: 115200})
+
+    def test_acks(self):
+        uart = UART()
+        Commands.send(uart, Commands.baudrate(115200))
+        Commands.ackReceived(0x06, 0x8B, True)  # not the command that was sent
+        self.assertEqual(Commands.ackState(Commands.valset), Commands.ACK_WAITING)
+        Commands.ackReceived(0x06, 0x8A, False)
+        self.assertEqual(Commands.ackState(Commands.valset), Commands.ACK_NAKED)
+        self.assertEqual(Commands.ackState(Commands.saveCfg), Commands.ACK_NONE)
+        classs, id, payload = unpackFrame(self, Commands.saveCfg.buf[:21])
+        self.assertEqual(struct.unpack("<LLLB", payload), (0, 7967, 0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
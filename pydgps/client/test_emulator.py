@@ -0,0 +1,231 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks of the board's main loop (../pyb/main.py) run in the emulator on a PC
+#
+#   python -m unittest test_emulator
+import collections
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import benchmark
+import emulator
+import test_log
+
+
+# the log files of a run, name to contents
+def logFiles(main):
+    logs = {}
+    for fn in sorted(os.listdir(main.workdir)):
+        if fn.endswith(".bin"):
+            with open(os.path.join(main.workdir, fn), "rb") as f:
+                logs[fn] = f.read()
+    return logs
+
+
+def readingsDone(main):
+    with open(os.path.join(main.workdir, "console.txt")) as f:
+        return f.read().count("READINGS DONE")
+
+
+class EmulatorTest(unittest.TestCase):
+    corpus = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = benchmark.cleanCorpus(600)
+
+    def setUp(self):
+        self.workdirs = []
+
+    def tearDown(self):
+        for workdir in self.workdirs:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def runBoard(self, config, seconds=700):
+        workdir = tempfile.mkdtemp(prefix="bergprobe-")
+        self.workdirs.append(workdir)
+        config = dict(config, log_period_s=120)
+        return emulator.run(self.corpus, config, seconds=seconds, workdir=workdir)
+
+
+class RingSizeTest(EmulatorTest):
+    # a ring too small for the longest frame would stall acquisition, it is raised to fit and the logs don't change
+    def test_small_ring(self):
+        expected = logFiles(self.runBoard({}))
+        self.assertIn("2-4-2021-log.bin", expected)
+        main = self.runBoard({"gps_ring_size": 64})
+        self.assertEqual(main.GPS_RING_SIZ, main.GPS_FRAME_BUF_SIZ)
+        self.assertEqual(logFiles(main), expected)
+
+
+class OutputTest(EmulatorTest):
+    # the receiver is set to send just the enabled messages, whatever order msgs_enabled lists them in, and the
+    # readings come out the same
+    def test_msgs_enabled_orders(self):
+        orders = list(itertools.permutations(["TIMEUTC", "HPECEF", "STATUS", "SAT_INFO"]))
+        expected = None
+        for order in random.Random(1).sample(orders, 6):
+            enabled = dict((name, True) for name in order)
+            enabled["SVIN"] = False
+            main = self.runBoard({"configure_output": True, "msgs_enabled": enabled}, seconds=400)
+            receiver = main.pyb.feeds[main.GPS_UART_PORT]
+            self.assertIn((0x06, 0x8A), receiver.commands)
+            for name, key in main.Commands.CFG_MSGOUT_UART1:
+                self.assertEqual(receiver.values[key], name in main.enabledOutput(), name)
+            self.assertEqual(receiver.values[main.Commands.CFG_UART1OUTPROT_NMEA], 0)
+            self.assertTrue(main.Commands.outputMatches(main.enabledOutput()))
+            logs = logFiles(main)
+            self.assertGreaterEqual(readingsDone(main), 2, order)
+            if expected is None:
+                expected = logs
+            self.assertEqual(logs, expected, order)
+
+    # NAV-PVT alone in place of NAV-STATUS, NAV-SAT and NAV-TIMEUTC, with or without HPPOSECEF before it
+    def test_pvt_output(self):
+        rnd = random.Random(1)
+        corpus = b"".join(benchmark.roverEpoch(rnd, n, pvt=True) for n in range(600))
+        workdir = tempfile.mkdtemp(prefix="bergprobe-")
+        self.workdirs.append(workdir)
+        main = emulator.run(corpus, {"configure_output": True, "pvt_output": True, "log_period_s": 120},
+                            seconds=400, workdir=workdir)
+        receiver = main.pyb.feeds[main.GPS_UART_PORT]
+        self.assertEqual(main.enabledOutput(), ["NAV-HPPOSECEF", "NAV-PVT"])
+        keys = dict(main.Commands.CFG_MSGOUT_UART1)
+        self.assertEqual((receiver.values[keys["NAV-PVT"]], receiver.values[keys["NAV-STATUS"]]), (1, 0))
+        self.assertGreaterEqual(readingsDone(main), 2)
+        self.assertIn("2-4-2021-log.bin", logFiles(main))
+
+
+class ConvergenceTest(EmulatorTest):
+    # the clean corpus has fixes within 30 cm on each axis and a pAcc of at most 40 mm
+    def test_stops_early(self):
+        # the reading still takes MIN_READINGS epochs when it converges in fewer
+        for needed, taken in ((8, 8), (3, 5)):
+            main = self.runBoard({"converge_epochs": needed, "converge_spread_mm": 700, "converge_pacc_mm": 50},
+                                 seconds=400)
+            self.assertEqual(main.MIN_READINGS, 5)
+            with open(os.path.join(main.workdir, "console.txt")) as f:
+                console = f.read()
+            self.assertGreaterEqual(readingsDone(main), 2)
+            self.assertEqual(console.count("Converged after %d epochs" % taken), readingsDone(main))
+        # a pAcc limit no fix meets never ends a reading early
+        main = self.runBoard({"converge_epochs": 8, "converge_spread_mm": 700, "converge_pacc_mm": 5}, seconds=400)
+        with open(os.path.join(main.workdir, "console.txt")) as f:
+            self.assertNotIn("Converged", f.read())
+        self.assertGreaterEqual(readingsDone(main), 2)
+
+
+class BaudrateTest(EmulatorTest):
+    FAST = [115200, 230400, 460800, 921600]
+
+    # each run is 2 s, long enough only if every poll the receiver can't answer ends at its probe deadline
+    def negotiate(self, **receiver):
+        workdir = tempfile.mkdtemp(prefix="bergprobe-")
+        self.workdirs.append(workdir)
+        main = emulator.run(self.corpus, {"gps_fast_baudrates": self.FAST}, seconds=2, workdir=workdir, **receiver)
+        self.assertLess(main.PROBE_TIMEOUT + 50 * 10000 // 38400, main.ACK_TIMEOUT // 2)
+        return main, main.pyb.feeds[main.GPS_UART_PORT]
+
+    def test_steps_up(self):
+        main, receiver = self.negotiate()
+        self.assertEqual((main.GPS_BAUDRATE, main.gpsIn.baudrate, receiver.baudrate), (921600, 921600, 921600))
+
+    # the receiver keeps a rate set earlier until it is power cycled, the rates below it go unanswered
+    def test_receiver_at_a_kept_rate(self):
+        main, receiver = self.negotiate(receiverBaudrate=230400)
+        self.assertEqual((main.GPS_BAUDRATE, receiver.baudrate), (921600, 921600))
+
+    def test_rate_refused(self):
+        main, receiver = self.negotiate(maxBaudrate=230400)
+        self.assertEqual((main.GPS_BAUDRATE, main.gpsIn.baudrate, receiver.baudrate), (230400, 230400, 230400))
+
+    def test_no_receiver(self):
+        main, receiver = self.negotiate(receiverBaudrate=9600)
+        self.assertEqual((main.GPS_BAUDRATE, main.gpsIn.baudrate), (38400, 38400))
+        with open(os.path.join(main.workdir, "console.txt")) as f:
+            self.assertIn("No reply from the receiver at any baud rate", f.read())
+
+
+class AsyncRuntimeTest(EmulatorTest):
+    def test_readings(self):
+        polling = self.runBoard({"async_runtime": False})
+        main = self.runBoard({})
+        self.assertIsNotNone(main.frames_queued)
+        self.assertGreaterEqual(readingsDone(main), 3)
+        self.assertGreater(len(logFiles(main)["2-4-2021-log.bin"]), 0)
+        self.assertGreater(len(main.pyb.uarts[main.RADIO_UART_PORT].written), 0)
+        # the logs are committed once a reading, as the polling loop does, not after each epoch's
+        perReading = [len(logFiles(m)["2-4-2021-eventLog.bin"]) / readingsDone(m) for m in (polling, main)]
+        self.assertLess(perReading[1], perReading[0] * 1.5)
+
+    # a transmission sends the whole of the reading that was just taken, the logs the logging task hasn't written yet
+    # included, so the same fixes and location events go out as with the polling loop
+    def test_transmits_the_reading(self):
+        sent = []
+        for runtime in (False, True):
+            main = self.runBoard({"async_runtime": runtime, "log_blocks": False})
+            records = test_log.splitRecords(bytes(main.pyb.uarts[main.RADIO_UART_PORT].written))
+            sent.append(collections.Counter(r[10] for r in records if 0x10 <= r[10] <= 0x13))
+        self.assertGreater(sent[0][0x13], 0)
+        self.assertEqual(sent[1], sent[0])
+
+    # the base station task saves the receiver's config every 10 s, as the RTC callback does
+    def test_base_station(self):
+        config = {"base_station": True, "transmit_attempts": -1, "log_raw": False, "log_median": False,
+                  "log_best": False,
+                  "msgs_enabled": {"SVIN": True, "TIMEUTC": True, "HPECEF": True, "STATUS": True, "SAT_INFO": True}}
+        saves = []
+        for runtime in (False, True):
+            main = self.runBoard(dict(config, async_runtime=runtime), seconds=60)
+            self.assertEqual(main.frames_queued is not None, runtime)
+            saves.append(bytes(main.pyb.uarts[main.GPS_UART_PORT].written).count(b"\xb5b\x06\x09"))
+        self.assertEqual(saves[0], saves[1])
+        self.assertGreaterEqual(saves[1], 5)
+
+class SurveyTest(EmulatorTest):
+    def toggle(self, main):
+        gps = main.pyb.uarts[main.GPS_UART_PORT]
+        sent = len(gps.written)
+        start = main.pyb.millis()
+        with emulator.boardContext(main.workdir):
+            main.toggleSVIN()
+        self.assertEqual(bytes(gps.written[sent:sent + 4]), b"\xb5b\x06\x8a")
+        self.assertLess(main.pyb.elapsed_millis(start), main.ACK_TIMEOUT + 100)
+
+    def test_survey_in(self):
+        main = self.runBoard({"async_runtime": False}, seconds=30)
+        main.pyb.clock.until = None
+        main.clock.wakeup(None) # no reading in the middle of the wait
+        receiver = main.pyb.feeds[main.GPS_UART_PORT]
+        self.toggle(main)
+        self.assertTrue(main.surveying)
+        self.assertEqual(receiver.values[main.Commands.CFG_TMODE_MODE], main.Commands.TMODE_SURVEY_IN)
+        # no survey message has come in yet, so there's no fixed position to send and the survey just stops
+        with emulator.boardContext(main.workdir):
+            main.toggleSVIN()
+        self.assertFalse(main.surveying)
+        # a receiver that doesn't answer leaves surveying off
+        receiver.baudrate = 9600
+        self.toggle(main)
+        self.assertFalse(main.surveying)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks of the epoch assembler (../pyb/Epoch.py) on a PC
+#
+#   python -m unittest test_epoch
+import os
+import random
+import unittest
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import Epoch
+
+
+class EpochAssemblerTest(unittest.TestCase):
+    def test_any_order_completes(self):
+        assembler = Epoch.EpochAssembler(3)
+        self.assertIsNone(assembler.add(1000, 2, "sat"))
+        self.assertIsNone(assembler.add(1000, 0, "loc"))
+        epoch = assembler.add(1000, 1, "stat")
+        self.assertEqual(epoch, ["loc", "stat", "sat"])
+        self.assertEqual((assembler.completed, assembler.dropped, assembler.latest), (1, 0, 1000))
+        # the slot is free again with a list of its own, the one handed on isn't touched
+        self.assertEqual(assembler.tows, [-1] * 4)
+        assembler.add(2000, 0, "next")
+        self.assertEqual(epoch, ["loc", "stat", "sat"])
+
+    # with no more epochs in flight than slots, every epoch is completed with its own messages
+    def test_interleaved_against_a_dict(self):
+        rnd = random.Random(1)
+        assembler = Epoch.EpochAssembler(4, slots=4, maxAge=10000)
+        messages = [(tow, code) for tow in range(0, 100000, 1000) for code in range(4)]
+        # each message moved at most a few places, so at most four epochs are ever open
+        order = sorted(range(len(messages)), key=lambda i: i + rnd.uniform(-5, 5))
+        held = {}
+        done = []
+        for i in order:
+            tow, code = messages[i]
+            held.setdefault(tow, {})[code] = (tow, code)
+            epoch = assembler.add(tow, code, (tow, code))
+            if len(held[tow]) == 4:
+                self.assertEqual(epoch, [held[tow][c] for c in range(4)])
+                done.append(tow)
+            else:
+                self.assertIsNone(epoch)
+        self.assertEqual(sorted(done), list(range(0, 100000, 1000)))
+        self.assertEqual((assembler.completed, assembler.dropped), (100, 0))
+
+    def test_stale_slot_dropped(self):
+        assembler = Epoch.EpochAssembler(2, slots=3, maxAge=2000)
+        assembler.add(1000, 0, "lost") # its other half never comes
+        assembler.add(2000, 0, "a")
+        self.assertIsNotNone(assembler.add(2000, 1, "b"))
+        assembler.add(3000, 0, "c")
+        assembler.add(5000, 0, "d") # free slots, nothing dropped yet
+        self.assertEqual(assembler.dropped, 0)
+        self.assertIsNotNone(assembler.add(5000, 1, "e"))
+        # 1000 is now more than maxAge from the last complete epoch, so it goes when a slot is next needed
+        assembler.add(6000, 0, "f")
+        self.assertEqual(assembler.dropped, 1)
+        self.assertNotIn(1000, assembler.tows)
+        self.assertIn(3000, assembler.tows)
+
+    # with every slot taken by an epoch still in date, the one furthest from the last complete epoch goes
+    def test_full_slots_evict_the_furthest(self):
+        assembler = Epoch.EpochAssembler(2, slots=3, maxAge=100000)
+        assembler.add(10000, 0, "x")
+        assembler.add(10000, 1, "x")
+        for tow in (11000, 40000, 12000):
+            assembler.add(tow, 0, tow)
+        assembler.add(13000, 0, 13000)
+        self.assertEqual(assembler.dropped, 1)
+        self.assertEqual(sorted(assembler.tows), [11000, 12000, 13000])
+        self.assertEqual(assembler.add(12000, 1, "y"), [12000, "y"])
+
+    # junk TOWs from a noisy UART take slots but never stop the real epochs completing
+    def test_junk_tows(self):
+        rnd = random.Random(2)
+        assembler = Epoch.EpochAssembler(3, slots=4, maxAge=2000)
+        completed = 0
+        for tow in range(1000, 200000, 1000):
+            for code in range(3):
+                if rnd.random() < 0.3:
+                    assembler.add(rnd.randrange(2 ** 32), rnd.randrange(3), "junk")
+                if assembler.add(tow, code, (tow, code)) is not None:
+                    completed += 1
+            self.assertLessEqual(len(assembler.tows), 4)
+        self.assertEqual(completed, 199)
+        self.assertGreater(assembler.dropped, 0)
+
+    def test_reset(self):
+        assembler = Epoch.EpochAssembler(2)
+        assembler.add(1000, 0, "a")
+        assembler.add(1000, 1, "b")
+        assembler.add(2000, 0, "c")
+        assembler.reset()
+        self.assertEqual((assembler.tows, assembler.masks, assembler.latest), ([-1] * 4, [0] * 4, -1))
+        self.assertEqual(assembler.msgs, [[None, None]] * 4)
+        self.assertIsNone(assembler.add(2000, 1, "d"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks of the board's checksums and number formats (../pyb/Formats.py) on a PC
+#
+#   python -m unittest test_formats
+import os
+import random
+import sys
+import types
+import unittest
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import Formats
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+if numpy is not None:
+    import ubxscan
+
+
+# the UBX checksum as the receiver description gives it
+def reference(data):
+    ck_a = ck_b = 0
+    for b in data:
+        ck_a = (ck_a + b) & 255
+        ck_b = (ck_b + ck_a) & 255
+    return ck_a, ck_b
+
+
+# Formats loaded again with micropython.viper as a plain decorator and ptr8 as memoryview, so the viper versions of
+# fletcher and copyBytes run as they are written instead of the fallbacks CPython otherwise gets
+def viperFormats():
+    fake = types.ModuleType("micropython")
+    fake.viper = lambda f: f
+    fn = os.path.join(pybimport.PYB_DIR, "Formats.py")
+    spec = pybimport.importlib.util.spec_from_file_location("ViperFormats", fn,
+                                                            loader=pybimport.PybLoader("ViperFormats", fn))
+    module = pybimport.importlib.util.module_from_spec(spec)
+    saved = sys.modules.get("micropython")
+    sys.modules["micropython"] = fake
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        if saved is None:
+            del sys.modules["micropython"]
+        else:
+            sys.modules["micropython"] = saved
+    module.ptr8 = memoryview
+    return module
+
+
+def randomBytes(rnd, n):
+    return bytes(rnd.randrange(256) for i in range(n))
+
+
+class FletcherTest(unittest.TestCase):
+    modules = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.modules = (Formats, viperFormats())
+
+    def test_matches_the_reference(self):
+        rnd = random.Random(1)
+        for module in self.modules:
+            self.assertEqual(module.ubxChecksum(b""), (0, 0))
+            for n in (1, 2, 255, 256, 257, 1000):
+                data = randomBytes(rnd, n)
+                self.assertEqual(module.ubxChecksum(data), reference(data), module.__name__)
+                self.assertEqual(module.ubxChecksum(bytearray(data)), reference(data), module.__name__)
+            self.assertEqual(module.ubxChecksum(b"\xff" * 5000), reference(b"\xff" * 5000))
+
+    def test_ranges_and_continuing(self):
+        rnd = random.Random(2)
+        for module in self.modules:
+            for trial in range(100):
+                data = randomBytes(rnd, rnd.randint(0, 300))
+                start = rnd.randint(0, len(data))
+                end = rnd.randint(start, len(data))
+                ck_a, ck_b = reference(data[start:end])
+                self.assertEqual(module.fletcher(data, start, end, 0), ck_a | ck_b << 8)
+                cut = rnd.randint(start, end)
+                ck = module.fletcher(data, start, cut, 0)
+                self.assertEqual(module.fletcher(data, cut, end, ck), ck_a | ck_b << 8)
+
+    def test_running_checksum(self):
+        rnd = random.Random(3)
+        data = randomBytes(rnd, 700)
+        for module in self.modules:
+            ck = module.UBXChecksum()
+            i = 0
+            while i < len(data):
+                if rnd.random() < 0.3:
+                    ck.updateByte(data[i])
+                    i += 1
+                else:
+                    n = rnd.randint(0, 50)
+                    ck.update(data, i, min(i + n, len(data)))
+                    i += n
+            self.assertEqual(ck.digest(), reference(data))
+            self.assertTrue(ck.matches(*reference(data)))
+
+    def test_copy_bytes(self):
+        rnd = random.Random(4)
+        for module in self.modules:
+            src = randomBytes(rnd, 100)
+            dst = bytearray(120)
+            module.copyBytes(dst, 7, src, 30, 50)
+            self.assertEqual(bytes(dst[7:57]), src[30:80])
+            self.assertEqual(bytes(dst[:7] + dst[57:]), bytes(70))
+
+    @unittest.skipIf(numpy is None, "ubxscan needs numpy")
+    def test_numpy_checksums_of_many_ranges(self):
+        rnd = random.Random(5)
+        data = numpy.frombuffer(randomBytes(rnd, 5000), dtype=numpy.uint8)
+        starts = numpy.array(sorted(rnd.randrange(5000) for i in range(200)))
+        ends = numpy.minimum(starts + numpy.array([rnd.randrange(600) for i in range(200)]), 5000)
+        ck_a, ck_b = ubxscan.fletcherMany(data, starts, ends)
+        for i in range(200):
+            self.assertEqual((int(ck_a[i]), int(ck_b[i])), reference(bytes(data[starts[i]:ends[i]])))
+
+
+class VarintTest(unittest.TestCase):
+    def values(self):
+        rnd = random.Random(4)
+        return [0, 1, 127, 128, 16383, 16384, 2 ** 32 - 1, 2 ** 63] + [rnd.getrandbits(rnd.randint(1, 64))
+                                                                      for i in range(500)]
+
+    # values one after the other in a buffer come back with the index after each
+    def test_round_trip(self):
+        out = bytearray(b"\xFF")
+        for val in self.values():
+            Formats.putVarint(out, val)
+        i = 1
+        for val in self.values():
+            got, after = Formats.getVarint(out, i)
+            self.assertEqual(got, val)
+            self.assertTrue(all(b >= 128 for b in out[i:after - 1]) and out[after - 1] < 128)
+            self.assertEqual(after - i, max(1, (val.bit_length() + 6) // 7))
+            i = after
+        self.assertEqual(i, len(out))
+
+    # small values either side of 0 stay small
+    def test_zigzag(self):
+        self.assertEqual([Formats.zigzag(val) for val in (0, -1, 1, -2, 2, -64, 63, 64)], [0, 1, 2, 3, 4, 127, 126, 128])
+        for val in [v - 2 ** 62 for v in self.values() if v < 2 ** 63] + [-2 ** 63, 2 ** 63 - 1]:
+            self.assertEqual(Formats.unzigzag(Formats.zigzag(val)), val)
+            self.assertGreaterEqual(Formats.zigzag(val), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
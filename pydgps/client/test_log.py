@@ -0,0 +1,441 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks of the board's log writing (../pyb/Log.py) on a PC
+#
+#   python -m unittest test_log
+import contextlib
+import datetime
+import io
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import pyb
+import Formats
+import Log
+
+
+# the records of a log file's contents, in order
+def splitRecords(data):
+    records = []
+    i = 0
+    while i + 15 <= len(data):
+        length = data[i + 11] | data[i + 12] << 8
+        records.append(bytes(data[i:i + 15 + length]))
+        i += 15 + length
+    return records
+
+
+# the length of a log file's contents up to the end of its last commit marker, checking that each marker's byte count
+# and checksum are those of the bytes since the one before
+def committedLength(test, data):
+    committed = 0
+    i = 0
+    while i + 15 <= len(data):
+        length = data[i + 11] | data[i + 12] << 8
+        if i + 15 + length > len(data):
+            break
+        if data[i + 10] == Log.COMMIT_TYPE[0]:
+            test.assertEqual(length, 4)
+            test.assertEqual(data[i + 13] | data[i + 14] << 8, i - committed)
+            test.assertEqual(data[i + 15] | data[i + 16] << 8, Formats.fletcher(data, committed, i, 0))
+            committed = i + 15 + length
+        i += 15 + length
+    return committed
+
+
+# each test has its own directory and sinks, so nothing a sink holds is written out in another test's directory
+class LogTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix="bergprobe-")
+        os.chdir(self.workdir)
+        self.sinks = Log.dataSink, Log.eventSink
+        Log.dataSink, Log.eventSink = Log.LogSink(), Log.LogSink()
+
+    def tearDown(self):
+        Log.dataSink, Log.eventSink = self.sinks
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def read(self, filename):
+        with open(filename, "rb") as f:
+            return f.read()
+
+
+class LogSinkTest(LogTest):
+    # random event records, some longer than the sink so they go out on their own
+    def records(self, rnd, n):
+        return [Log.eventString(bytes((rnd.randrange(0x10, 0x20),)), bytes(rnd.randrange(256) for i in
+                                                                              range(rnd.choice((0, 3, 20, 150)))))
+                for i in range(n)]
+
+    def test_commit_markers_round_trip(self):
+        rnd = random.Random(1)
+        sink = Log.LogSink(128)
+        records = self.records(rnd, 60)
+        commits = 0
+        for record in records:
+            sink.add("a-log.bin", record)
+            if rnd.random() < 0.1:
+                sink.commit()
+                commits += 1
+        sink.commit()
+        data = self.read("a-log.bin")
+        self.assertEqual(committedLength(self, data), len(data))
+        written = [r for r in splitRecords(data) if r[10] != Log.COMMIT_TYPE[0]]
+        self.assertEqual(written, records)
+        self.assertGreater(len(splitRecords(data)) - len(records), commits)
+
+    # a write cut short anywhere leaves the commits before it whole, and a reader stops at the last of them
+    def test_cut_short(self):
+        rnd = random.Random(2)
+        sink = Log.LogSink(256)
+        for record in self.records(rnd, 30):
+            sink.add("a-log.bin", record)
+        sink.commit()
+        data = self.read("a-log.bin")
+        ends = [0]
+        at = 0
+        for record in splitRecords(data):
+            at += len(record)
+            if record[10] == Log.COMMIT_TYPE[0]:
+                ends.append(at)
+        for cut in range(len(data) + 1):
+            self.assertEqual(committedLength(self, data[:cut]), max(end for end in ends if end <= cut))
+
+    def test_new_file_commits(self):
+        sink = Log.LogSink()
+        sink.add("1-4-2021-log.bin", Log.eventString(b"\x10", b"one"))
+        sink.add("2-4-2021-log.bin", Log.eventString(b"\x10", b"two"))
+        data = self.read("1-4-2021-log.bin")
+        self.assertEqual(committedLength(self, data), len(data))
+        self.assertFalse(os.path.exists("2-4-2021-log.bin"))
+
+    # initLogs makes room for every fix of a reading, logged one ECEFLog each, so the reading is one write, the index
+    # waiting for a sector's worth of entries
+    def test_a_reading_is_one_write(self):
+        writes = []
+        appendToFile = Log.appendToFile
+        Log.appendToFile = lambda filename, data: writes.append(filename)
+        try:
+            Log.initLogs(0, 28)
+            for n in range(28):
+                Log.dataSink.add("2-4-2021-log.bin", bytes(Log.ECEF_RECORD_SIZE))
+            Log.dataSink.commit()
+        finally:
+            Log.appendToFile = appendToFile
+        self.assertEqual(writes, ["2-4-2021-log.bin"])
+
+
+class EventRingTest(LogTest):
+    time = (2021, 4, 2, 5, 12, 30, 15, 255)
+
+    # (readable, csv rows) of each record in the day's event log, as unparseLog describes them
+    def described(self):
+        Log.eventSink.commit()
+        lines = []
+        with open(Log.getdtstring(self.time) + "eventLog.bin", "rb") as f, contextlib.redirect_stdout(io.StringIO()):
+            line = Log.getLine(f)
+            while line is not None:
+                if line[2] != Log.COMMIT_TYPE:
+                    lines.append(Log.describeRecord(*line))
+                line = Log.getLine(f)
+        return lines
+
+    # repeats are timed at the first of them
+    def test_repeats_read_as_the_event(self):
+        ring = Log.EventRing()
+        later = (2021, 4, 2, 5, 13, 0, 0, 255)
+        ring.add(b"\x10", b"\x12", self.time)
+        ring.add(b"\xF5", b"", self.time)
+        for n in range(2):
+            ring.add(b"\x10", b"\x12", later)
+            ring.add(b"\xF5", b"", later)
+        ring.add(b"\x10", b"\x13", later)
+        ring.add(b"\x00", b"", later)
+        ring.flush()
+        self.assertEqual([readable for readable, rows in self.described()],
+                         ["[0] - 2/4/2021 12:30:15 - (x3) ECEF Location logged [median]",
+                          "[0] - 2/4/2021 12:30:15 - (x3) Reading t-o",
+                          "[0] - 2/4/2021 13:0:0 - ECEF Location logged [best-acc]",
+                          "[0] - 2/4/2021 13:0:0 - Device startup"])
+
+    # an error of the longest text is read back whole from its repeat record
+    def test_longest_error_repeated(self):
+        error = Log.UnknownError("No ACK for " + "x" * 80)
+        self.assertEqual(len(error.payload), Log.EVENT_MAX)
+        ring = Log.EventRing()
+        ring.add(error.class_id, error.payload, self.time)
+        ring.flush()
+        for n in range(2):
+            ring.add(error.class_id, error.payload, self.time)
+        ring.flush()
+        once, twice = [readable for readable, rows in self.described()]
+        self.assertEqual(twice, once.replace(" - b'", " - (x2) b'"))
+
+    # a full ring is passed on in the order the events first came, and the counts stop at REPEAT_MAX
+    def test_full_ring_and_count_cap(self):
+        ring = Log.EventRing(2)
+        for n in range(Log.REPEAT_MAX + 10):
+            ring.add(b"\xF4", b"", self.time)
+        ring.add(b"\x21", b"", self.time)
+        ring.add(b"\x20", b"", self.time)
+        self.assertEqual((ring.used, ring.ids[0]), (1, b"\x20"))
+        ring.flush()
+        self.assertEqual([readable[26:] for readable, rows in self.described()],
+                         ["(x65535) Calibration t-o", "LCD off", "LCD on"])
+
+
+# the parts of HPPOSECEF and NAV-SAT a location block is given
+class Fix:
+    def __init__(self, tow, position, pacc):
+        self.iTOW = tow
+        (self.ecefX, self.ecefXHp), (self.ecefY, self.ecefYHp), (self.ecefZ, self.ecefZHp) = map(Log.splitHp,
+                                                                                                  position)
+        self.pAcc = pacc
+
+    def getTOW(self):
+        return self.iTOW
+
+
+class Sats:
+    def __init__(self, n):
+        self.n = n
+
+    def getNumSvs(self):
+        return self.n
+
+
+class LocationBlockTest(unittest.TestCase):
+    def tearDown(self):
+        Log.stopClock()
+
+    # fixes of a reading, positions in 0.1 mm, with steady epochs, missed ones and now and then one far away
+    def fixes(self, rnd, n):
+        tow = rnd.randrange(604800000)
+        fixes = []
+        for i in range(n):
+            tow += 1000 * rnd.choice((1, 1, 1, 2, 7))
+            far = rnd.random() < 0.1
+            position = [rnd.randint(-2 ** 35, 2 ** 35) if far else base + rnd.randint(-3000, 3000)
+                        for base in (38500000000, -2000000000, 50000000000)]
+            fixes.append((rnd.choice((b"\xF1", b"\x12", b"\x13")), tow, position, rnd.randrange(5000),
+                          rnd.randrange(256)))
+        return fixes
+
+    # every fix is read back as added, timed by the RTC when it was, the first with the block itself
+    def test_round_trip(self):
+        rnd = random.Random(9)
+        for n in (1, 2, 5, 300):
+            pyb.reset(datetime.datetime(2021, 4, 30, 23, 55))
+            fixes = self.fixes(rnd, n)
+            block = None
+            seconds = []
+            for smoothType, tow, position, pacc, svs in fixes:
+                pyb.clock.sleepUntil(pyb.clock.ms + rnd.randrange(3000))
+                seconds.append(pyb.clock.ms // 1000)
+                if block is None:
+                    block = Log.LocationBlock(Fix(tow, position, pacc), smoothType, Sats(svs))
+                else:
+                    block.add(Fix(tow, position, pacc), smoothType, Sats(svs))
+            read = Log.readLocationBlock(block.payload)
+            self.assertEqual(len(read), n)
+            for fix, got in zip(fixes, read):
+                smoothType, tow, position, pacc, svs = fix
+                self.assertEqual(got[:2], (smoothType[0] & 0x1F, tow))
+                self.assertEqual(list(got[2:5]), list(map(Log.splitHp, position)))
+                self.assertEqual(got[5:7], (pacc, svs))
+            self.assertEqual([got[7] for got in read], [s - seconds[0] for s in seconds])
+            kinds = set(fix[0][0] & 0x1F for fix in fixes)
+            self.assertEqual(Log.blockKinds(block.payload, 0, len(block.payload)),
+                             sum(1 << (kind - 0x11) for kind in kinds))
+
+    # steady epochs near the first fix take a fraction of an ECEFLog each
+    def test_size(self):
+        pyb.reset(datetime.datetime(2021, 4, 2, 12, 0))
+        position = [38500000000, -2000000000, 50000000000]
+        block = Log.LocationBlock(Fix(1000, position, 14), b"\x12", Sats(30))
+        self.assertEqual(len(block.payload), struct.calcsize(Log.BLOCK_REF) + 2)
+        for i in range(1, 100):
+            block.add(Fix(1000 + 1000 * i, [p + i % 7 for p in position], 14), b"\x12", Sats(30))
+        self.assertLess(len(block.payload) / 100, Log.ECEF_RECORD_SIZE / 3)
+
+    def test_other_versions(self):
+        pyb.reset(datetime.datetime(2021, 4, 2, 12, 0))
+        block = Log.LocationBlock(Fix(1000, [1, 2, 3], 14), b"\x12", Sats(30))
+        payload = bytearray(block.payload)
+        payload[0] = Log.BLOCK_VERSION - 1
+        self.assertIsNone(Log.readLocationBlock(payload))
+        self.assertEqual(Log.blockKinds(payload, 0, len(payload)), 0)
+
+    def test_add_seconds(self):
+        cases = [((2021, 4, 2, 12, 0, 0), 0, (2021, 4, 2, 12, 0, 0)),
+                 ((2021, 4, 2, 23, 59, 59), 1, (2021, 4, 3, 0, 0, 0)),
+                 ((2021, 4, 30, 23, 59, 30), 45, (2021, 5, 1, 0, 0, 15)),
+                 ((2021, 2, 28, 23, 0, 0), 3600, (2021, 3, 1, 0, 0, 0)),
+                 ((2024, 2, 28, 23, 0, 0), 3600, (2024, 2, 29, 0, 0, 0)),
+                 ((2021, 12, 31, 23, 59, 59), 1, (2022, 1, 1, 0, 0, 0)),
+                 ((2021, 1, 31, 12, 0, 0), 86400 * 29, (2021, 3, 1, 12, 0, 0))]
+        for time, secs, expected in cases:
+            self.assertEqual(Log.addSeconds(time, secs), expected)
+        rnd = random.Random(10)
+        for i in range(500):
+            start = datetime.datetime(2020, 1, 1) + datetime.timedelta(seconds=rnd.randrange(86400 * 800))
+            secs = rnd.randrange(86400 * 3)
+            self.assertEqual(Log.addSeconds(start.timetuple()[:6], secs),
+                             (start + datetime.timedelta(seconds=secs)).timetuple()[:6])
+
+
+class IndexTest(LogTest):
+    def setUp(self):
+        super().setUp()
+        pyb.reset(datetime.datetime(2021, 4, 2, 12, 0))
+
+    # records of a day at random times: events, ECEFLogs and location blocks, some too long for a sink
+    def records(self, rnd, n):
+        records = []
+        for i in range(n):
+            time = (2021, 4, 2, 0, rnd.randrange(24), rnd.randrange(60), rnd.randrange(60), 255)
+            type = rnd.choice((0x10, 0x11, 0x12, 0x13, 0x14, 0x20))
+            if type == 0x14:
+                block = Log.LocationBlock(Fix(1000, [1, 2, 3], 14), rnd.choice((b"\x11", b"\x12")), Sats(30))
+                for n in range(rnd.choice((0, 1, 2, 30))):
+                    block.add(Fix(2000 + n, [4, 5, 6], 14), rnd.choice((b"\x12", b"\x13")), Sats(30))
+                payload = block.payload
+            else:
+                payload = bytes(rnd.randrange(256) for n in range(rnd.choice((0, 20, 50))))
+            records.append(Log.eventString(bytes((type,)), payload, time))
+        return records
+
+    # records as a scan of the whole file with getLine finds them
+    def scan(self, filename):
+        lines = []
+        with open(filename, "rb") as f, contextlib.redirect_stdout(io.StringIO()):
+            line = Log.getLine(f)
+            while line is not None:
+                if len(line) > 0:
+                    lines.append(line)
+                line = Log.getLine(f)
+        return lines
+
+    def write(self, rnd, records):
+        sink = Log.LogSink(256)
+        for record in records:
+            sink.add(rnd.choice(("1-4-2021-log.bin", "2-4-2021-log.bin")) if rnd.random() < 0.05 else
+                     sink.filename or "2-4-2021-log.bin", record)
+            if rnd.random() < 0.2:
+                sink.commit()
+        return sink
+
+    # the index the sinks write as they go is the one rebuildIndex makes from the file, once the sink has written it
+    def test_sink_index_is_rebuilt(self):
+        rnd = random.Random(11)
+        sink = self.write(rnd, self.records(rnd, 400))
+        sink.commit()
+        self.assertFalse(Log.indexIsCurrent(sink.filename))
+        sink.writeIndex()
+        for fn in ("1-4-2021-log.bin", "2-4-2021-log.bin"):
+            self.assertTrue(Log.indexIsCurrent(fn))
+            written = self.read(Log.indexName(fn))
+            Log.rebuildIndex(fn)
+            self.assertEqual(self.read(Log.indexName(fn)), written)
+        # an index that lost its last entries is behind the file
+        with open(Log.indexName(fn), "wb") as f:
+            f.write(written[:-2 * Log.INDEX_SIZE - 3])
+        self.assertFalse(Log.indexIsCurrent(fn))
+        Log.rebuildIndex(fn)
+        self.assertTrue(Log.indexIsCurrent(fn))
+
+    # a log without records, or whose index was lost
+    def test_no_index(self):
+        self.assertTrue(Log.indexIsCurrent("2-4-2021-log.bin"))
+        sink = Log.LogSink()
+        sink.add("2-4-2021-log.bin", Log.eventString(b"\x10", b"one"))
+        sink.commit()
+        self.assertFalse(Log.indexIsCurrent("2-4-2021-log.bin"))
+
+    def test_remove_log(self):
+        sink = Log.eventSink
+        sink.add("2-4-2021-log.bin", Log.eventString(b"\x10", b"one"))
+        Log.removeLog("2-4-2021-log.bin")
+        sink.add("2-4-2021-log.bin", Log.eventString(b"\x10", b"two"))
+        sink.commit()
+        sink.writeIndex()
+        self.assertTrue(Log.indexIsCurrent("2-4-2021-log.bin"))
+        self.assertEqual([line[3] for line in self.scan("2-4-2021-log.bin") if line[2] != Log.COMMIT_TYPE], [b"two"])
+
+    # seekRecords finds what a scan of the file does, for time ranges, types and kinds of fix
+    def test_seek_against_scan(self):
+        rnd = random.Random(12)
+        sink = self.write(rnd, self.records(rnd, 400))
+        sink.commit()
+        sink.writeIndex()
+        lines = self.scan("2-4-2021-log.bin")
+        for trial in range(100):
+            start = (2021, 4, 2, rnd.randrange(24), rnd.randrange(60), 0) if rnd.random() < 0.8 else None
+            end = (2021, 4, 2, rnd.randrange(24), rnd.randrange(60), 0) if rnd.random() < 0.8 else None
+            types = (rnd.sample((0x10, 0x11, 0x14, 0x20, Log.COMMIT_TYPE[0]), 2)) if rnd.random() < 0.3 else None
+            kinds = (rnd.sample((0x11, 0x12, 0x13), rnd.randint(1, 2))) if rnd.random() < 0.3 else None
+            mask = sum(1 << (kind - 0x11) for kind in kinds or ())
+            expected = []
+            for line in lines:
+                time = Log.getTime(line[0])
+                type = line[2][0]
+                if start is not None and time < start or end is not None and time >= end or \
+                        types is not None and type not in types or kinds is not None and type not in kinds and not \
+                        (type == Log.BLOCK_TYPE[0] and Log.blockKinds(line[3], 0, len(line[3])) & mask):
+                    continue
+                expected.append(line)
+            got = list(Log.seekRecords("2-4-2021-log.bin", start, end, types, kinds))
+            self.assertEqual(got, expected, (start, end, types, kinds))
+
+
+class ClockTest(unittest.TestCase):
+    def tearDown(self):
+        Log.stopClock()
+
+    # from one read of the RTC, every record of a reading is timed as reading the RTC would, across midnight and
+    # the ends of a month and a year too
+    def test_times_from_one_read(self):
+        for start in (datetime.datetime(2021, 12, 31, 23, 59, 57), datetime.datetime(2021, 4, 30, 23, 59, 58)):
+            for into in (0, 300, 999):
+                pyb.reset(start)
+                pyb.clock.sleepUntil(into)
+                Log.readClock()
+                for ms in range(0, 6000, 37):
+                    pyb.clock.sleepUntil(into + ms)
+                    if (into + ms) % 1000 < 5:
+                        continue  # the subseconds only give the start of the second to within 4 ms
+                    self.assertEqual(Log.logTime()[:7], pyb.RTC().datetime()[:7], (start, into, ms))
+
+    def test_read_each_time_otherwise(self):
+        pyb.reset(datetime.datetime(2021, 4, 2, 12, 0, 0))
+        Log.readClock()
+        Log.stopClock()
+        pyb.clock.sleepUntil(2500)
+        self.assertEqual(Log.logTime()[4:7], (12, 0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks of the board's message decoding (../pyb/Message.py) on a PC
+#
+#   python -m unittest test_message
+import contextlib
+import io
+import json
+import os
+import random
+import struct
+import unittest
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import Formats
+import Log
+import Message
+
+
+def frame(cls, id, payload):
+    body = bytes((cls, id, len(payload) & 255, len(payload) >> 8)) + payload
+    return b"\xb5b" + body + bytes(Formats.ubxChecksum(body))
+
+
+def hpposecef(tow, x, y, z, xhp, yhp, zhp, flags, pacc):
+    return frame(0x01, 0x13, struct.pack("<B3xLlllbbbBL", 0, tow, x, y, z, xhp, yhp, zhp, flags, pacc))
+
+
+class ParseUBXFrameTest(unittest.TestCase):
+    def setUp(self):
+        Log.eventRing = Log.EventRing()
+
+    def test_frame_inside_a_larger_buffer(self):
+        f = hpposecef(1000, 385000000, -20000000, 500000000, 12, -3, 49, 0, 140)
+        buf = bytearray(b"junk") + f + b"more"
+        msg = Message.parseUBXFrame(buf, 4)
+        self.assertIsInstance(msg, Message.HPECEF)
+        self.assertEqual((msg.getTOW(), msg.ecefX, msg.ecefY, msg.ecefZ), (1000, 385000000, -20000000, 500000000))
+        self.assertEqual((msg.ecefXHp, msg.ecefYHp, msg.ecefZHp, msg.pAcc), (12, -3, 49, 140))
+
+    # the header claims the whole payload but the buffer ends part way through it
+    def test_truncated_buffer_is_a_length_mismatch(self):
+        f = hpposecef(1000, 1, 2, 3, 4, 5, 6, 0, 7)
+        for end in range(6, len(f) - 2):
+            self.assertIsNone(Message.parseUBXFrame(f[:end]))
+            self.assertIsNone(Message.parseUBXFrame(bytearray(3) + f[:end], 3))
+        self.assertIn(Log.LengthMismatchError.class_id, Log.eventRing.ids)
+
+    def test_short_payload_is_a_length_mismatch(self):
+        self.assertIsNone(Message.parseUBXFrame(frame(0x01, 0x13, bytes(20))))
+
+
+# fields whose property is worked out from the raw value instead of being it
+DERIVED = (("NAV-STATUS", "gpsFix"), ("NAV-PVT", "lon"), ("NAV-PVT", "lat"), ("NAV-HPPOSLLH", "lon"),
+           ("NAV-HPPOSLLH", "lat"))
+RANGES = {"B": (0, 255), "b": (-128, 127), "H": (0, 65535), "h": (-32768, 32767), "L": (0, 2 ** 32 - 1),
+          "l": (-2 ** 31, 2 ** 31 - 1)}
+
+
+class RecordTest(unittest.TestCase):
+    # every field of every layout at random, the extremes included, read back through its property
+    def test_every_field_reads_back(self):
+        rnd = random.Random(6)
+        for classs, id, name, fields in Message.MESSAGES:
+            fmt, names = Message.compileLayout(fields)
+            codes = [code for field, code in fields if field is not None]
+            for trial in range(50):
+                values = [rnd.choice(RANGES[code] + (rnd.randint(*RANGES[code]),)) for code in codes]
+                msg = Message.parseUBXFrame(frame(classs, id, struct.pack(fmt, *values)))
+                self.assertIsInstance(msg, Message.messageTypes[name])
+                for field, value in zip(names, values):
+                    if (name, field) not in DERIVED and hasattr(msg, field):
+                        self.assertEqual(getattr(msg, field), value, name + " " + field)
+
+    def test_moved_keeps_the_rest_of_the_fix(self):
+        msg = Message.parseUBXFrame(hpposecef(5000, 1, 2, 3, 4, 5, 6, 1, 2 ** 32 - 2))
+        moved = msg.moved(10, 20, 30, -1, -2, -3)
+        self.assertEqual((moved.getTOW(), moved.pAcc, moved.invalidFix), (5000, 2 ** 32 - 2, False))
+        self.assertEqual((moved.ecefX, moved.ecefY, moved.ecefZ, moved.ecefXHp, moved.ecefYHp, moved.ecefZHp),
+                         (10, 20, 30, -1, -2, -3))
+        self.assertEqual(msg.ecefX, 1)
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        Log.eventRing = Log.EventRing()
+        Message.resetMessageCounts()
+
+    def tearDown(self):
+        Message.resetMessageCounts()
+
+    def test_every_layout_is_registered(self):
+        for classs, id, name, fields in Message.MESSAGES:
+            self.assertTrue(Message.isRegistered(classs, id), name)
+            entry = Message.decoders[classs << 8 | id]
+            self.assertEqual(entry[1], Message.layoutSize(fields))
+            self.assertIs(entry[2], Message.messageTypes[name])
+        self.assertFalse(Message.isRegistered(0x01, 0x99))
+
+    def test_hits_and_misses_are_counted(self):
+        f = hpposecef(1000, 1, 2, 3, 4, 5, 6, 0, 7)
+        for i in range(3):
+            Message.parseUBXFrame(f)
+        self.assertIsNone(Message.parseUBXFrame(frame(0x01, 0x99, bytes(4))))
+        Message.countMiss(0x0A09)
+        Message.countMiss(0x0A09)
+        self.assertEqual(sorted(Message.getMessageCounts()), [("01-99", -1), ("0A-09", -2), ("NAV-HPPOSECEF", 3)])
+        Message.resetMessageCounts()
+        self.assertEqual(Message.getMessageCounts(), [])
+
+
+class PositionTest(unittest.TestCase):
+    def test_hpecef_fields_and_position(self):
+        msg = Message.parseUBXFrame(hpposecef(5000, 385000000, -20000000, 500000000, -7, 99, 0, 1, 2 ** 32 - 1))
+        for value in (msg.getTOW(), msg.getX(), msg.getY(), msg.getZ(), msg.getXHP(), msg.getYHP(), msg.getZHP()):
+            self.assertIsInstance(value, int)
+        self.assertTrue(msg.invalidFix)
+        self.assertEqual(msg.pAcc, 2 ** 32 - 1)
+        self.assertAlmostEqual(msg.getPAcc(), (2 ** 32 - 1) * 1e-2)
+        expected = (385000000 - 0.07, -20000000 + 0.99, 500000000.0)
+        for i in range(2):  # the second time from the cached values
+            for a, b in zip(msg.get3DPos(), expected):
+                self.assertAlmostEqual(a, b, places=6)
+            self.assertEqual((msg.getXPos(), msg.getYPos(), msg.getZPos()), msg.get3DPos())
+            self.assertAlmostEqual(msg.getNormSq(), sum(v ** 2 for v in expected), delta=1e3)
+
+    def test_svin_position(self):
+        payload = struct.pack("<B3xLLlllbbbxLLBB2x", 0, 7000, 600, 385000000, -20000000, 500000000, 12, -34, 56,
+                              25000, 300, 1, 0)
+        msg = Message.parseUBXFrame(frame(0x01, 0x3B, payload))
+        self.assertEqual((msg.getDuration(), msg.getObs(), msg.getValid(), msg.getActive()), (600, 300, 1, 0))
+        self.assertAlmostEqual(msg.getPAcc(), 2.5)
+        for a, b in zip(msg.get3DPos(), (385000000.12, -20000000.34, 500000000.56)):
+            self.assertAlmostEqual(a, b, places=6)
+        self.assertEqual(msg.getXPos(), msg.get3DPos()[0])
+
+
+class FieldMaskTest(unittest.TestCase):
+    def tearDown(self):
+        Message.setFieldMask("NAV-STATUS", None)
+        Message.setFieldMask("NAV-HPPOSECEF", None)
+
+    def status(self):
+        return Message.parseUBXFrame(frame(0x01, 0x03, struct.pack("<LBBBBLL", 9000, 3, 0x0F, 2, 8, 12345, 67890)))
+
+    def test_unmasked_fields_are_zero(self):
+        self.assertTrue(Message.setFieldMask("NAV-STATUS", ["flags"]))
+        msg = self.status()
+        self.assertEqual(msg.getTOW(), 9000)  # kept even though it isn't listed
+        self.assertTrue(msg.gpsFixOK and msg.diffSol and msg.wknValid and msg.towValid)
+        self.assertEqual((msg.ttff, msg.msss, msg.fixStat, msg.flags2), (0, 0, 0, 0))
+
+    def test_config_list_of_the_rover(self):
+        with open(os.path.join(pybimport.PYB_DIR, "config_r.json")) as f:
+            fields = json.load(f)["fields"]
+        for name in fields:
+            self.assertTrue(Message.setFieldMask(name, fields[name]), name)
+        msg = self.status()
+        self.assertTrue(msg.gpsFixOK)
+        for name in fields:
+            Message.setFieldMask(name, None)
+
+    def test_mask_of_signed_fields_and_back(self):
+        f = hpposecef(5000, -385000000, -20000000, 500000000, -7, 99, -1, 0, 140)
+        Message.setFieldMask("NAV-HPPOSECEF", ["ecefX", "ecefXHp", "pAcc"])
+        msg = Message.parseUBXFrame(f)
+        self.assertEqual((msg.getTOW(), msg.ecefX, msg.ecefXHp, msg.pAcc), (5000, -385000000, -7, 140))
+        self.assertEqual((msg.ecefY, msg.ecefZ, msg.ecefYHp, msg.ecefZHp), (0, 0, 0, 0))
+        Message.setFieldMask("NAV-HPPOSECEF", None)
+        msg = Message.parseUBXFrame(f)
+        self.assertEqual((msg.ecefY, msg.ecefZ, msg.ecefYHp, msg.ecefZHp), (-20000000, 500000000, 99, -1))
+
+    def test_unknown_message(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(Message.setFieldMask("NAV-NOTHING", ["iTOW"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
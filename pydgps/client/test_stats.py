@@ -0,0 +1,215 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks of the reading's statistics (../pyb/Stats.py) on a PC
+#
+#   python -m unittest test_stats
+import os
+import random
+import unittest
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import Stats
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def key(item):
+    return item[0]
+
+
+def summedDistance(points, x, y, z):
+    return sum(((px - x) ** 2 + (py - y) ** 2 + (pz - z) ** 2) ** 0.5 for px, py, pz in points)
+
+
+class SelectTest(unittest.TestCase):
+    def test_every_k_against_sorted(self):
+        rnd = random.Random(1)
+        for trial in range(300):
+            n = rnd.randint(1, 40)
+            # few distinct keys as well as many, so equal keys are partitioned too
+            items = [(rnd.randrange(rnd.choice((3, 1000))), i) for i in range(n)]
+            expected = sorted(key(item) for item in items)
+            for k in range(n):
+                shuffled = items[:]
+                rnd.shuffle(shuffled)
+                picked = Stats.select(shuffled, k, key)
+                self.assertEqual(key(picked), expected[k])
+                self.assertIs(shuffled[k], picked)
+                self.assertTrue(all(key(item) <= key(picked) for item in shuffled[:k]))
+                self.assertTrue(all(key(item) >= key(picked) for item in shuffled[k + 1:]))
+                self.assertEqual(sorted(shuffled), sorted(items))
+
+    def test_median_is_the_upper_middle(self):
+        rnd = random.Random(2)
+        for n in range(1, 30):
+            items = [(rnd.randrange(100),) for i in range(n)]
+            self.assertEqual(key(Stats.median(items[:], key)), sorted(key(item) for item in items)[n >> 1])
+
+
+class GeometricMedianTest(unittest.TestCase):
+    def coords(self, points, start):
+        return Stats.geometricMedian(points, lambda p: p[0], lambda p: p[1], lambda p: p[2], *start, tol=1e-6,
+                                     iterations=1000)
+
+    def test_symmetric_points(self):
+        square = [(10, 10, 0), (-10, 10, 0), (10, -10, 0), (-10, -10, 0)]
+        for a, b in zip(self.coords(square, (3.0, -1.0, 2.0)), (0, 0, 0)):
+            self.assertAlmostEqual(a, b, places=4)
+
+    def test_collinear_points_give_the_middle_one(self):
+        line = [(0, 0, 0), (1, 0, 0), (2, 0, 0), (30, 0, 0), (500, 0, 0)]
+        for a, b in zip(self.coords(line, (100.0, 0.0, 0.0)), (2, 0, 0)):
+            self.assertAlmostEqual(a, b, places=3)
+
+    def test_starting_on_a_point(self):
+        points = [(0, 0, 0), (4, 0, 0), (0, 4, 0)]
+        x, y, z = self.coords(points, (0.0, 0.0, 0.0))
+        self.assertTrue(all(v == v for v in (x, y, z)))  # no nan from a zero distance
+
+    # nothing near the result does better, and it beats the component-wise median of the same points
+    def test_is_a_minimum(self):
+        rnd = random.Random(3)
+        for trial in range(20):
+            points = [(rnd.gauss(0, 50), rnd.gauss(0, 50), rnd.gauss(0, 50)) for i in range(rnd.randint(3, 25))]
+            points += [(rnd.uniform(1e3, 1e4), 0, 0)] * rnd.randint(0, 3)  # outliers
+            x, y, z = self.coords(points, tuple(sum(p[a] for p in points) / len(points) for a in range(3)))
+            best = summedDistance(points, x, y, z)
+            for step in range(50):
+                dx, dy, dz = (rnd.uniform(-0.5, 0.5) for a in range(3))
+                self.assertLessEqual(best, summedDistance(points, x + dx, y + dy, z + dz) + 1e-6)
+            middle = [sorted(p[a] for p in points)[len(points) >> 1] for a in range(3)]
+            self.assertLessEqual(best, summedDistance(points, *middle) + 1e-6)
+
+
+class ReadingStatsTest(unittest.TestCase):
+    def readingStats(self, size):
+        return Stats.ReadingStats(size, lambda p: p[0], lambda p: p[1], lambda p: p[2], lambda p: p[3])
+
+    # offsets in 0.1 mm of a probe that wanders a few metres, as main.py gives them
+    def epochs(self, rnd, n):
+        return [(rnd.gauss(20000, 9000), rnd.gauss(-5000, 300), rnd.randint(-40000, 40000), rnd.randrange(10, 5000), i)
+                for i in range(n)]
+
+    @unittest.skipIf(numpy is None, "the reference needs numpy")
+    def test_mean_and_variance_against_numpy(self):
+        rnd = random.Random(4)
+        for n in (1, 2, 3, 10, 1000):
+            stats = self.readingStats(5)
+            epochs = self.epochs(rnd, n)
+            for epoch in epochs:
+                stats.add(epoch)
+            positions = numpy.array([epoch[:3] for epoch in epochs], dtype=float)
+            for axis in range(3):
+                self.assertAlmostEqual(stats.mean[axis], positions[:, axis].mean(), places=6)
+                expected = positions[:, axis].var(ddof=1) if n > 1 else 0.0
+                self.assertAlmostEqual(stats.variance(axis), expected, delta=1e-9 * max(expected, 1))
+
+    def test_best_is_the_first_smallest_acc(self):
+        rnd = random.Random(5)
+        epochs = self.epochs(rnd, 200)
+        stats = self.readingStats(10)
+        for epoch in epochs:
+            stats.add(epoch)
+        self.assertIs(stats.best, min(epochs, key=lambda epoch: epoch[3]))
+        self.assertEqual(stats.bestAcc, stats.best[3])
+
+    # every epoch while there are no more than size, a size-sized sample of them after that with each equally likely
+    def test_reservoir(self):
+        rnd = random.Random(6)
+        random.seed(6) # Stats draws from the random module
+        stats = self.readingStats(8)
+        epochs = self.epochs(rnd, 8)
+        for epoch in epochs:
+            stats.add(epoch)
+        self.assertEqual(stats.sample, epochs)
+        kept = [0] * 40
+        for trial in range(2000):
+            stats.reset()
+            for epoch in self.epochs(rnd, 40):
+                stats.add(epoch)
+            self.assertEqual(len(stats.sample), 8)
+            self.assertEqual(len(set(epoch[4] for epoch in stats.sample)), 8)
+            for epoch in stats.sample:
+                kept[epoch[4]] += 1
+        # each is kept 2000 * 8 / 40 = 400 times on average, 100 is over five standard deviations
+        self.assertTrue(all(abs(k - 400) < 100 for k in kept), kept)
+
+    def test_reset(self):
+        stats = self.readingStats(3)
+        for epoch in self.epochs(random.Random(7), 10):
+            stats.add(epoch)
+        stats.reset()
+        self.assertEqual((stats.count, stats.mean, stats.m2, stats.best, stats.sample),
+                         (0, [0.0] * 3, [0.0] * 3, None, []))
+        self.assertEqual(stats.variance(0), 0.0)
+
+
+class ConvergenceTest(unittest.TestCase):
+    def test_needs_a_run(self):
+        convergence = Stats.Convergence(10, 50, 3)
+        self.assertEqual([convergence.add(0, 0, 0, 20) for i in range(5)], [False, False, True, True, True])
+
+    def test_acc_breaks_the_run(self):
+        convergence = Stats.Convergence(10, 50, 3)
+        results = [convergence.add(0, 0, 0, acc) for acc in (20, 20, 51, 20, 20, 50)]
+        self.assertEqual(results, [False, False, False, False, False, True])
+
+    # the box grows to take each epoch up to spread wide, and starts again from the epoch that would make it wider
+    def test_spread(self):
+        convergence = Stats.Convergence(10, 50, 3)
+        self.assertFalse(convergence.add(0, 0, 0, 1))
+        self.assertFalse(convergence.add(6, -4, 0, 1))
+        self.assertTrue(convergence.add(-4, 6, 10, 1))
+        self.assertEqual((convergence.lo, convergence.hi), ([-4, -4, 0], [6, 6, 10]))
+        self.assertFalse(convergence.add(0, 0, -1, 1))
+        self.assertEqual((convergence.run, convergence.lo, convergence.hi), (1, [0, 0, -1], [0, 0, -1]))
+        self.assertFalse(convergence.add(8, 0, -1, 1))
+        self.assertTrue(convergence.add(-2, 0, -1, 1))
+
+    # whenever it says converged, the last needed epochs are all within spread and acc
+    def test_random_positions(self):
+        rnd = random.Random(8)
+        for needed in (1, 2, 5):
+            convergence = Stats.Convergence(40, 300, needed)
+            epochs = []
+            said = 0
+            for i in range(3000):
+                epoch = tuple(rnd.randint(-30, 30) for axis in range(3)) + (rnd.randrange(100, 400),)
+                epochs.append(epoch)
+                if convergence.add(*epoch):
+                    said += 1
+                    last = epochs[-needed:]
+                    self.assertTrue(all(epoch[3] <= 300 for epoch in last))
+                    for axis in range(3):
+                        self.assertLessEqual(max(e[axis] for e in last) - min(e[axis] for e in last), 40)
+            self.assertGreater(said, 0)
+
+    def test_reset(self):
+        convergence = Stats.Convergence(10, 50, 2)
+        convergence.add(0, 0, 0, 1)
+        convergence.reset()
+        self.assertFalse(convergence.add(100, 100, 100, 1))
+        self.assertTrue(convergence.add(100, 100, 100, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks of the board's UART frame decoder and frame queue (../pyb/Stream.py) on a PC
+#
+#   python -m unittest test_stream
+import collections
+import os
+import random
+import unittest
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import Formats
+import Stream
+
+
+def frame(cls, id, payload):
+    body = bytes((cls, id, len(payload) & 255, len(payload) >> 8)) + payload
+    return b"\xb5b" + body + bytes(Formats.ubxChecksum(body))
+
+
+def randomFrames(rnd, n, maxPayload=60):
+    return [frame(rnd.randrange(256), rnd.randrange(256),
+                  bytes(rnd.randrange(256) for i in range(rnd.randrange(maxPayload)))) for k in range(n)]
+
+
+# garbage that can't be mistaken for a frame: stray 0xb5s, but never followed by 0x62
+def garbage(rnd, n):
+    out = bytearray(rnd.choice((0xb5, rnd.randrange(256))) for i in range(n))
+    for i in range(len(out)):
+        if out[i] == 0x62 and (i == 0 or out[i - 1] == 0xb5):
+            out[i] = 0
+    return bytes(out)
+
+
+# a UART that hands over the bytes given to it a few at a time
+class ChunkedUART:
+    def __init__(self, data, rnd, largest=7):
+        self.data = data
+        self.pos = 0
+        self.rnd = rnd
+        self.largest = largest
+
+    def any(self):
+        return min(self.rnd.randint(1, self.largest), len(self.data) - self.pos)
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self.data) - self.pos)
+        if n == 0:
+            return None
+        buf[:n] = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+def drain(decoder):
+    found = []
+    while True:
+        start = decoder.nextFrame()
+        if start < 0:
+            return found
+        found.append(bytes(decoder.frame(start)))
+
+
+class UBXDecoderTest(unittest.TestCase):
+    def test_frames_between_garbage(self):
+        rnd = random.Random(1)
+        frames = randomFrames(rnd, 50)
+        data = b"".join(garbage(rnd, rnd.randrange(20)) + f for f in frames) + garbage(rnd, 5)
+        decoder = Stream.UBXDecoder(256)
+        found = []
+        pos = 0
+        while pos < len(data):
+            pos += decoder.feed(data[pos:])
+            found += drain(decoder)
+        self.assertEqual(found, frames)
+        self.assertEqual(decoder.frames, len(frames))
+
+    def test_frames_split_across_reads(self):
+        rnd = random.Random(2)
+        frames = randomFrames(rnd, 200)
+        uart = ChunkedUART(b"".join(frames), rnd)
+        decoder = Stream.UBXDecoder(128)
+        found = []
+        while decoder.readFrom(uart) > 0:
+            found += drain(decoder)
+        self.assertEqual(found, frames)
+        self.assertEqual(decoder.bytesRead, len(uart.data))
+
+    def test_resync_after_bad_checksum(self):
+        rnd = random.Random(3)
+        good = randomFrames(rnd, 2)
+        bad = bytearray(randomFrames(rnd, 1)[0])
+        bad[-1] ^= 0xff
+        decoder = Stream.UBXDecoder(256)
+        decoder.feed(good[0] + bytes(bad) + good[1])
+        self.assertEqual(drain(decoder), good)
+        self.assertEqual(decoder.badChecksums, 1)
+
+    def test_resync_after_length_too_long_for_buffer(self):
+        rnd = random.Random(4)
+        good = randomFrames(rnd, 1, maxPayload=20)[0]
+        decoder = Stream.UBXDecoder(64)
+        decoder.feed(b"\xb5b\x01\x07\xe8\x03" + good)  # a header claiming 1000 bytes
+        self.assertEqual(drain(decoder), [good])
+        self.assertEqual(decoder.badLengths, 1)
+
+    def test_unread_gives_the_frame_again(self):
+        frames = randomFrames(random.Random(5), 2)
+        decoder = Stream.UBXDecoder(256)
+        decoder.feed(b"".join(frames))
+        start = decoder.nextFrame()
+        decoder.unread(start)
+        self.assertEqual(drain(decoder), frames)
+
+
+class FrameQueueTest(unittest.TestCase):
+    # random pushes and pops against a deque, frames of all sizes so the ring wraps at every point
+    def test_matches_a_deque(self):
+        rnd = random.Random(6)
+        queue = Stream.FrameQueue(200, 8)
+        model = collections.deque()
+        wrapped = 0
+        for step in range(20000):
+            if rnd.random() < 0.55:
+                data = bytes(rnd.randrange(256) for i in range(rnd.randint(8, 90)))
+                src = bytearray(5) + data
+                write = queue.write
+                if queue.push(src, 5, len(data)):
+                    model.append(data)
+                    if len(model) > 1 and queue.offsets[(queue.head + queue.count - 1) % 8] < write:
+                        wrapped += 1
+                else:
+                    # only refused when the free space really is too small or the slots are used up
+                    self.assertTrue(queue.full() or len(data) > self.freeRun(queue))
+            elif len(model) > 0:
+                start = queue.peek()
+                self.assertEqual(bytes(queue.buf[start:start + len(model[0])]), model.popleft())
+                queue.pop()
+            self.assertEqual(len(queue), len(model))
+        self.assertGreater(wrapped, 100)
+
+    # the longest frame push could place: after the newest frame, or at the front once it is past the oldest
+    def freeRun(self, queue):
+        if len(queue) == 0:
+            return len(queue.buf)
+        oldest = queue.peek()
+        if queue.write > oldest:
+            return max(len(queue.buf) - queue.write, oldest)
+        return oldest - queue.write
+
+    def test_empty_and_full(self):
+        queue = Stream.FrameQueue(64, 2)
+        self.assertEqual(queue.peek(), -1)
+        queue.pop()
+        self.assertTrue(queue.push(b"abcd", 0, 4))
+        self.assertTrue(queue.push(b"efgh", 0, 4))
+        self.assertTrue(queue.full())
+        self.assertFalse(queue.push(b"ijkl", 0, 4))
+        self.assertFalse(Stream.FrameQueue(8, 2).push(bytes(9), 0, 9))
+
+
+if __name__ == "__main__":
+    unittest.main()
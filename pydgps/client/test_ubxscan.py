@@ -0,0 +1,220 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Checks that ubxscan decodes captures as the board does frame by frame, and that decodeLog gives the same text,
+# byte for byte, as Log.unparseLog
+#
+#   python -m unittest test_ubxscan
+import contextlib
+import datetime
+import io
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import pyb
+import Formats
+import Log
+import Message
+import Stream
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+if numpy is not None:
+    import ubxscan
+
+
+class Fix:
+    def __init__(self, rnd):
+        # mostly a probe sitting still, now and then anything the fields can hold
+        self.ecefX = rnd.randint(-2 ** 31, 2 ** 31 - 1) if rnd.random() < 0.1 else 385000000 + rnd.randint(-500, 500)
+        self.ecefY = -20000000 + rnd.randint(-500, 500)
+        self.ecefZ = rnd.choice((0, 1, -1, 500000000 + rnd.randint(-5, 5)))
+        self.ecefXHp, self.ecefYHp, self.ecefZHp = (rnd.randint(-99, 99) for i in range(3))
+        self.pAcc = rnd.randint(0, 5000) if rnd.random() < 0.9 else rnd.randint(0, 2 ** 31 - 1)
+        self.iTOW = rnd.randint(0, 600000000)
+
+    def getTOW(self):
+        return self.iTOW
+
+
+class Sats:
+    def __init__(self, n):
+        self.n = n
+
+    def getNumSvs(self):
+        return self.n
+
+
+@unittest.skipIf(numpy is None, "ubxscan needs numpy")
+class DecodeCaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="bergprobe-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    # every frame the board's decoder finds, parsed with parseUBXFrame, as {name: [(field values), ...]}
+    def boardDecode(self, data):
+        decoder = Stream.UBXDecoder(1024)
+        found = {}
+        pos = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            while pos < len(data):
+                pos += decoder.feed(memoryview(data)[pos:pos + 700])
+                while True:
+                    start = decoder.nextFrame()
+                    if start < 0:
+                        break
+                    key = decoder.buf[start + 2] << 8 | decoder.buf[start + 3]
+                    if key in ubxscan.dtypes and Message.parseUBXFrame(decoder.buf, start) is not None:
+                        name, dtype = ubxscan.dtypes[key]
+                        values = struct.unpack_from(Message.compileLayout(Message.decoders[key][4])[0], decoder.buf,
+                                                    start + 6)
+                        found.setdefault(name, []).append(values)
+        return found
+
+    # line noise, broken checksums, frames we have no decoder for, and chunks much smaller than the capture
+    def test_matches_the_board_decoder(self):
+        import benchmark
+
+        data = benchmark.noisyCorpus(400) + benchmark.busyCorpus(100)
+        fn = os.path.join(self.workdir, "capture.ubx")
+        with open(fn, "wb") as f:
+            f.write(data)
+        expected = self.boardDecode(data)
+        for chunkSize in (1, 1 << 24):
+            decoded = ubxscan.decodeCapture(fn, chunkSize)
+            self.assertEqual(sorted(decoded), sorted(expected))
+            for name, arr in decoded.items():
+                self.assertEqual([tuple(int(v) for v in row) for row in arr.tolist()], expected[name], name)
+
+    def test_checksum_and_overlap(self):
+        body = bytes((0x01, 0x35, 4, 0)) + bytes(4)
+        good = b"\xb5b" + body + bytes(Formats.ubxChecksum(body))
+        bad = bytearray(good)
+        bad[-1] ^= 1
+        # a frame hidden in the payload of another one is not a frame of its own
+        outer = bytes((0x01, 0x04, len(good), 0)) + good
+        outer = b"\xb5b" + outer + bytes(Formats.ubxChecksum(outer))
+        buf = numpy.frombuffer(b"xx" + good + bytes(bad) + outer + good[:-3], dtype=numpy.uint8)
+        starts, ends = ubxscan.findFrames(buf.tobytes())
+        self.assertEqual(starts.tolist(), [2, 2 + 2 * len(good)])
+        self.assertEqual((ends - starts).tolist(), [len(good), len(outer)])
+
+
+@unittest.skipIf(numpy is None, "ubxscan needs numpy")
+class DecodeLogTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix="bergprobe-test-")
+        os.chdir(self.workdir)
+        self.logs = Log.dataSink, Log.eventSink, Log.eventRing
+
+    def tearDown(self):
+        Log.dataSink, Log.eventSink, Log.eventRing = self.logs
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir)
+
+    def assertSameText(self, filename):
+        with contextlib.redirect_stdout(io.StringIO()):
+            Log.unparseLog(filename)
+        stem = os.path.splitext(filename)[0]
+        with open(stem + "_parsed_events.txt", "rb") as f:
+            events = f.read()
+        with open(stem + "_parsed_data.csv", "rb") as f:
+            csv = f.read()
+        # the smallest chunks as well, so records are split between them
+        for chunkSize in (1, 1 << 22):
+            decoded = ubxscan.decodeLog(filename, chunkSize)
+            self.assertEqual(decoded["events"], events, filename)
+            self.assertEqual(decoded["csv"], csv, filename)
+
+    # ECEFLogs, location blocks (some passing midnight and the end of the year) and events of every kind
+    def test_random_logs(self):
+        rnd = random.Random(7)
+        pyb.reset(datetime.datetime(2021, 12, 31, 23, 40))
+        Log.dataSink = Log.LogSink()
+        Log.eventSink = Log.LogSink()
+        Log.eventRing = Log.EventRing()
+        for reading in range(150):
+            pyb.clock.ms += rnd.randint(0, 5000)
+            if rnd.random() < 0.5:
+                for i in range(rnd.randint(1, 30)):
+                    Log.ECEFLog(Fix(rnd), rnd.choice((b"\xF1", b"\x12", b"\x13")), Sats(rnd.randint(0, 40))).writeLog()
+            else:
+                first = Fix(rnd)
+                block = Log.LocationBlock(first, rnd.choice((b"\xF1", b"\x12", b"\x13")), Sats(rnd.randint(0, 300)))
+                for i in range(rnd.randint(0, 300)):
+                    pyb.clock.ms += rnd.randint(0, 3000)
+                    fix = Fix(rnd) if rnd.random() < 0.9 else first
+                    block.add(fix, rnd.choice((b"\xF1", b"\xF1", b"\x12", b"\x13")), Sats(rnd.randint(0, 300)))
+                block.writeLog()
+            for i in range(rnd.randint(0, 4)):
+                rnd.choice((lambda: Log.UnknownError("err %d" % rnd.randint(0, 3)),
+                            lambda: Log.LengthForceError(1, 0x35, rnd.randint(0, 400), 3),
+                            lambda: Log.LCDEvent(b"\x22"),
+                            lambda: Log.DecodingError(bytes([rnd.randint(0, 255)] * 2), "<H"),
+                            lambda: Log.LocationEvent(b"\x12")))().writeLog()
+            Log.commitLogs()
+        logs = sorted(fn for fn in os.listdir() if fn.endswith(".bin"))
+        self.assertIn("1-1-2022-log.bin", logs)
+        for fn in logs:
+            self.assertSameText(fn)
+
+    # records of every type but the fixes with payloads of any length getLine reads, repeats of them among them, many
+    # the same
+    def test_every_event_type(self):
+        rnd = random.Random(8)
+        payloads = [bytes(rnd.randrange(256) for n in range(rnd.randint(0, 50))) for i in range(40)]
+        types = [type for type in range(256) if type not in ubxscan.FIX_TYPES]
+        with open("2-4-2021-eventLog.bin", "wb") as f:
+            for i in range(3000):
+                type = rnd.choice(types)
+                payload = rnd.choice(payloads)
+                if rnd.random() < 0.3:
+                    payload = bytes((type,)) + payload[:47]
+                    type = Log.REPEAT_TYPE[0]
+                time = (2021, 4, 2, 0, 12, rnd.randrange(2), rnd.randrange(60), 255)
+                f.write(Log.eventString(bytes((type,)), payload, time))
+        self.assertSameText("2-4-2021-eventLog.bin")
+
+    def test_emulator_logs(self):
+        import benchmark
+        import emulator
+
+        for blocks in (True, False):
+            main = emulator.run(benchmark.cleanCorpus(600), {"log_period_s": 120, "log_blocks": blocks},
+                                seconds=700, workdir=self.workdir)
+            os.chdir(main.workdir)
+            logs = sorted(fn for fn in os.listdir() if fn.endswith("Log.bin") or fn.endswith("log.bin"))
+            self.assertGreater(len(logs), 1)
+            for fn in logs:
+                self.assertSameText(fn)
+            for fn in os.listdir():
+                os.remove(fn)
+
+
+if __name__ == "__main__":
+    unittest.main()
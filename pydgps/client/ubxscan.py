@@ -0,0 +1,742 @@
+# micropython ublox M9 based movement tracker
+# for the glacsweb.org project
+# Authors: Emily James 2020, University of Southampton
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# see <https://www.gnu.org/licenses/> for the GNU General Public License
+
+# Bulk UBX tools for captures and log files on a PC
+# frames are found and decoded with numpy over the whole buffer instead of one binaryParseUBXMessage per frame
+#
+#   python ubxscan.py logs/*.bin           writes the same _parsed_events.txt and _parsed_data.csv as Log.unparseLog
+#   python ubxscan.py --time logs/*.bin    how fast the logs decode, to arrays alone and to text
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+import pybimport
+
+pybimport.install([os.path.join(os.path.dirname(os.path.abspath(__file__)), "hostpyb"), pybimport.PYB_DIR])
+import Layouts
+import Log
+
+MAX_FRAME = 65535 + 8
+
+
+# fletcher (8-bit) checksums of many byte ranges of buf at once, [starts[i], ends[i]) for each range
+# ck_a is the sum of the bytes and ck_b = sum((end - i) * buf[i]), both taken from prefix sums.
+# everything is done modulo 256, in bytes, which is all the checksums keep
+def fletcherMany(buf, starts, ends):
+    data = np.frombuffer(buf, dtype=np.uint8)
+    sums = np.zeros(len(data) + 1, dtype=np.uint8)
+    np.cumsum(data, dtype=np.uint8, out=sums[1:])
+    weighted = np.zeros(len(data) + 1, dtype=np.uint8)
+    np.cumsum(data * rampTo(len(data)), dtype=np.uint8, out=weighted[1:])
+
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    ck_a = sums[ends] - sums[starts]
+    ck_b = ends.astype(np.uint8) * ck_a - (weighted[ends] - weighted[starts])
+    return ck_a, ck_b
+
+
+RAMP = np.tile(np.arange(256, dtype=np.uint8), 1 << 14)
+
+
+# 0, 1, ... n - 1 modulo 256
+def rampTo(n):
+    return RAMP[:n] if n <= len(RAMP) else np.resize(RAMP, n)
+
+
+def fletcher(buf):
+    ck_a, ck_b = fletcherMany(buf, [0], [len(buf)])
+    return int(ck_a[0]), int(ck_b[0])
+
+
+# numpy equivalents of the struct codes used in Layouts
+DTYPE_CODES = {"B": "u1", "b": "i1", "H": "<u2", "h": "<i2", "L": "<u4", "l": "<i4"}
+
+
+def layoutDtype(fields):
+    names = []
+    formats = []
+    offsets = []
+    offset = 0
+    for name, code in fields:
+        size = struct.calcsize("<" + code)
+        if name is not None:
+            names.append(name)
+            formats.append(DTYPE_CODES[code])
+            offsets.append(offset)
+        offset += size
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": offset})
+
+
+# (class << 8 | id) -> (name, dtype), made from the same layouts the board decodes with
+def makeDtypes():
+    made = {}
+    for classs, id, name, fields in Layouts.MESSAGES:
+        made[classs << 8 | id] = (name, layoutDtype(fields))
+    return made
+
+
+dtypes = makeDtypes()
+
+
+# start offsets of every valid frame in buf (checksum ok, no overlap with the frame before it)
+def findFrames(buf, base=0):
+    data = np.frombuffer(buf, dtype=np.uint8)
+    n = len(data)
+    starts = np.flatnonzero((data[:-1] == 0xb5) & (data[1:] == 0x62))
+    starts = starts[starts + 8 <= n]
+    lengths = data[starts + 4].astype(np.int64) | data[starts + 5].astype(np.int64) << 8
+    ends = starts + lengths + 8
+    whole = ends <= n
+    starts, ends = starts[whole], ends[whole]
+
+    ck_a, ck_b = fletcherMany(buf, starts + 2, ends - 2)
+    valid = (ck_a == data[ends - 2]) & (ck_b == data[ends - 1])
+    starts, ends = starts[valid], ends[valid]
+
+    starts, ends = dropOverlaps(starts, ends)
+    return starts + base, ends + base
+
+
+# sync chars inside a payload only pass the checksum by chance, but drop anything inside a frame anyway
+def dropOverlaps(starts, ends):
+    if len(starts) > 1 and np.any(starts[1:] < ends[:-1]):
+        keep = np.ones(len(starts), dtype=bool)
+        last = -1
+        for i in range(len(starts)):
+            if starts[i] < last:
+                keep[i] = False
+            else:
+                last = ends[i]
+        starts, ends = starts[keep], ends[keep]
+    return starts, ends
+
+
+# structured array of every frame with the given key (class << 8 | id) in buf, starts from findFrames
+def decodeFrames(buf, starts, key):
+    name, dtype = dtypes[key]
+    data = np.frombuffer(buf, dtype=np.uint8)
+    starts = starts[(data[starts + 2].astype(np.int64) << 8 | data[starts + 3]) == key]
+    lengths = data[starts + 4].astype(np.int64) | data[starts + 5].astype(np.int64) << 8
+    starts = starts[lengths >= dtype.itemsize]
+    payloads = data[(starts + 6)[:, None] + np.arange(dtype.itemsize)]
+    return np.ascontiguousarray(payloads).view(dtype).reshape(len(starts))
+
+
+# decodes a whole capture, one structured array per message type {"NAV-HPPOSECEF": array, ...}
+# read in chunks so multi-GB files don't have to fit in memory several times over
+def decodeCapture(filename, chunkSize=1 << 24):
+    chunkSize = max(chunkSize, 2 * MAX_FRAME)
+    parts = {}
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            pos = 0
+            while pos < size:
+                end = min(size, pos + chunkSize)
+                chunk = mm[pos:end]
+                starts, ends = findFrames(chunk)
+                if end < size:
+                    # any frame starting before limit is complete in this chunk, the rest is read again with the
+                    # next chunk in case a frame is split between them
+                    limit = len(chunk) - MAX_FRAME
+                    before = starts < limit
+                    starts, ends = starts[before], ends[before]
+                    done = max(limit, int(ends[-1])) if len(ends) > 0 else limit
+                else:
+                    done = len(chunk)
+                for key in dtypes:
+                    arr = decodeFrames(chunk, starts, key)
+                    if len(arr) > 0:
+                        parts.setdefault(dtypes[key][0], []).append(arr)
+                pos += done
+    return {name: np.concatenate(arrs) for name, arrs in parts.items()}
+
+
+# Log files written by the board (see Log.py), decoded to the same text as Log.unparseLog gives
+# a record is b5 62, time (U2 year, U1 month, day, hour, minute, second), device id, type, length (U2), payload and
+# the checksum of the payload
+# location records and blocks, and commit markers, are turned into text a column at a time, any other record (the
+# events, a few per reading) goes through Log.describeRecord itself
+
+LOG_HEAD = 13
+MAX_RECORD = 65535 + LOG_HEAD + 2
+ECEF_TYPES = (0x11, 0x12, 0x13)
+FIX_TYPES = ECEF_TYPES + (Log.BLOCK_TYPE[0],)
+REPEAT_TYPE = Log.REPEAT_TYPE[0]
+MAX_EVENT = 50  # payload bytes getLine reads of anything but a location block
+RECORD_DTYPE = np.dtype([("offset", "<i8"), ("year", "<u2"), ("month", "u1"), ("day", "u1"), ("hour", "u1"),
+                         ("minute", "u1"), ("second", "u1"), ("did", "u1"), ("type", "u1"), ("length", "<u2")])
+# positions in 0.1 mm (ecefX * 100 + ecefXHp), iTOW -1 for fixes logged as ECEFLogs
+# fixes from location blocks have their own times, not the block's
+FIX_DTYPE = np.dtype([("offset", "<i8"), ("fix", "<u2"), ("did", "u1"), ("year", "<u2"), ("month", "u1"),
+                      ("day", "u1"), ("hour", "u1"), ("minute", "u1"), ("second", "u1"), ("kind", "u1"),
+                      ("iTOW", "<i8"), ("x", "<i8"), ("y", "<i8"), ("z", "<i8"), ("pAcc", "<i8"), ("numSvs", "<i8")])
+BLOCK_REF_SIZE = struct.calcsize(Log.BLOCK_REF)
+
+
+# start and end offsets of every record in buf with a good checksum
+def findRecords(buf):
+    data = np.frombuffer(buf, dtype=np.uint8)
+    n = len(data)
+    starts = np.flatnonzero((data[:-1] == 0xb5) & (data[1:] == 0x62))
+    starts = starts[starts + LOG_HEAD + 2 <= n]
+    lengths = data[starts + 11].astype(np.int64) | data[starts + 12].astype(np.int64) << 8
+    ends = starts + LOG_HEAD + 2 + lengths
+    whole = ends <= n
+    starts, ends = starts[whole], ends[whole]
+
+    ck_a, ck_b = fletcherMany(buf, starts + LOG_HEAD, ends - 2)
+    valid = (ck_a == data[ends - 2]) & (ck_b == data[ends - 1])
+    return dropOverlaps(starts[valid], ends[valid])
+
+
+# little endian values of the given numpy type at each of offsets in data
+def gather(data, offsets, dtype):
+    dtype = np.dtype(dtype)
+    return np.ascontiguousarray(data[offsets[:, None] + np.arange(dtype.itemsize)]).view(dtype).reshape(len(offsets))
+
+
+# indexes of the bytes of the ranges [starts[i], starts[i] + lengths[i]) one after the other
+def ranges(starts, lengths):
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    first = np.cumsum(lengths) - lengths
+    return np.repeat(starts - first, lengths) + np.arange(total)
+
+
+# running sums of x that start again with each segment, segments given as the index of their first element
+def segmentSums(x, firsts, counts):
+    sums = np.cumsum(x)
+    return sums - np.repeat(sums[firsts] - x[firsts], counts)
+
+
+# the values of the varints in the ranges [rStarts[i], rEnds[i]) one after the other, each range whole varints
+def decodeVarints(data, rStarts, rEnds):
+    b = data[ranges(rStarts, rEnds - rStarts)]
+    if len(b) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    varStarts = np.flatnonzero(np.r_[True, b[:-1] < 128])
+    varLengths = np.diff(np.r_[varStarts, len(b)])
+    shifts = (7 * (np.arange(len(b)) - np.repeat(varStarts, varLengths))).astype(np.uint64)
+    return np.add.reduceat((b & 127).astype(np.uint64) << shifts, varStarts)
+
+
+# the fixes of version 3 location blocks, payloads at starts with the given lengths (see Log.LocationBlock)
+# the sections of every block are walked together, a step for each, and the varints of all of them decoded at once
+# gives (block of each fix, kind, iTOW, x, y, z, pAcc, numSvs, seconds after the block's time), which blocks
+# decoded and the fixes in each
+def decodeBlocks(data, starts, lengths):
+    nBlocks = len(starts)
+    ends = starts + lengths
+    terms = np.flatnonzero(data < 128)
+    # the first fix's pAcc and numSvs, after the fixed part of the payload
+    pos = starts + BLOCK_REF_SIZE
+    last = np.searchsorted(terms, pos) + Log.FIRST_VARINTS - 1
+    good = last < len(terms)
+    pos[good] = terms[last[good]] + 1
+    good &= pos <= ends
+    firstValues = np.zeros((nBlocks, Log.FIRST_VARINTS), dtype=np.uint64)
+    firstValues[good] = decodeVarints(data, starts[good] + BLOCK_REF_SIZE, pos[good]).reshape(-1, Log.FIRST_VARINTS)
+
+    regions = []
+    active = good & (pos + 2 <= ends)
+    while np.any(active):
+        blocks = np.flatnonzero(active)
+        p = pos[blocks]
+        kinds = data[p]
+        counts = data[p + 1].astype(np.int64)
+        first = np.searchsorted(terms, p + 2)
+        last = first + Log.FIX_VARINTS * counts - 1
+        stop = p + 2
+        some = counts > 0
+        fits = ~some | (last < len(terms))
+        stop[some & fits] = terms[last[some & fits]] + 1
+        fits &= stop <= ends[blocks]
+        good[blocks[~fits]] = False
+        regions.append((blocks[fits], kinds[fits], counts[fits], p[fits] + 2, stop[fits]))
+        pos[blocks] = stop
+        active = good & (pos + 2 <= ends)
+
+    blockOf, kinds, counts, rStarts, rEnds = [np.concatenate(r) for r in zip(*regions)] if len(regions) > 0 else \
+        [np.zeros(0, dtype=np.int64)] * 5
+    keep = good[blockOf]
+    blockOf, kinds, counts, rStarts, rEnds = blockOf[keep], kinds[keep], counts[keep], rStarts[keep], rEnds[keep]
+    # regions in block order, then as they came in each block
+    order = np.lexsort((rStarts, blockOf))
+    blockOf, kinds, counts, rStarts, rEnds = blockOf[order], kinds[order], counts[order], rStarts[order], rEnds[order]
+
+    values = decodeVarints(data, rStarts, rEnds).reshape(-1, Log.FIX_VARINTS)
+    signed = (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+    # the fixes after the first, each block's steps and positions taken from its first fix
+    fixBlock = np.repeat(blockOf, counts)
+    fixKind = np.repeat(kinds, counts)
+    perBlock = np.bincount(fixBlock, minlength=nBlocks)
+    firsts = np.cumsum(perBlock) - perBlock
+    used = perBlock > 0
+    ref = [gather(data, starts + 2, "<u4").astype(np.int64)]
+    for axis in range(3):
+        cm = gather(data, starts + 6 + 4 * axis, "<i4").astype(np.int64)
+        hp = data[starts + 18 + axis].astype(np.int8).astype(np.int64)
+        ref.append(cm * 100 + hp)
+    steps = segmentSums(signed[:, 0], firsts[used], perBlock[used])
+    tow = ref[0][fixBlock] + segmentSums(steps, firsts[used], perBlock[used])
+    rest = (fixBlock, fixKind, tow, ref[1][fixBlock] + signed[:, 1], ref[2][fixBlock] + signed[:, 2],
+            ref[3][fixBlock] + signed[:, 3], values[:, 4].astype(np.int64), values[:, 5].astype(np.int64),
+            values[:, 6].astype(np.int64))
+
+    # the first fixes go before the rest of their block's, a stable sort keeps the order within each block
+    blocks = np.flatnonzero(good)
+    firstFixes = (blocks, data[starts[blocks] + 1], ref[0][blocks], ref[1][blocks], ref[2][blocks], ref[3][blocks],
+                  firstValues[blocks, 0].astype(np.int64), firstValues[blocks, 1].astype(np.int64),
+                  np.zeros(len(blocks), dtype=np.int64))
+    fixBlock = np.concatenate((blocks, fixBlock))
+    order = np.argsort(fixBlock, kind="stable")
+    fixes = tuple(np.concatenate((f, r))[order] for f, r in zip(firstFixes, rest))
+    return fixes, good, perBlock + good
+
+
+# moves the times of fixes on by secs, as Log.addSeconds does, the few that pass midnight one at a time
+def addSeconds(fixes, secs):
+    secs = secs + fixes["hour"].astype(np.int64) * 3600 + fixes["minute"].astype(np.int64) * 60 + fixes["second"]
+    for i in np.flatnonzero(secs >= 86400):
+        fix = fixes[i]
+        when = Log.addSeconds((int(fix["year"]), int(fix["month"]), int(fix["day"]), 0, 0, 0), int(secs[i]))
+        fixes["year"][i], fixes["month"][i], fixes["day"][i] = when[:3]
+        secs[i] = when[3] * 3600 + when[4] * 60 + when[5]
+    fixes["hour"] = secs // 3600
+    fixes["minute"] = secs // 60 % 60
+    fixes["second"] = secs % 60
+
+
+# text is built as a matrix of bytes, a row per line, with each column right aligned in a fixed width and padded
+# with zero bytes, which are dropped when the rows are joined
+
+
+def textLiteral(text, n):
+    return np.repeat(np.frombuffer(text.encode(), dtype=np.uint8)[None, :], n, axis=0)
+
+
+# str() of each of the non-negative values, a minus sign in front where neg
+# small values are looked up in a table of their strings, others are divided down a digit at a time
+def textDigits(values, neg=None):
+    n = len(values)
+    top = int(values.max()) if n > 0 else 0
+    if top < 1 << 16:
+        out = digitTable(len(str(top)))[values]
+    else:
+        width = len(str(top))
+        rest = values.astype(np.uint64 if top >= 1 << 32 else np.uint32)
+        out = np.empty((n, width), dtype=np.uint8)
+        for col in range(width - 1, -1, -1):
+            rest, digit = np.divmod(rest, 10)
+            out[:, col] = digit
+        out += 48
+        # leading zeros are blanked, all but the last
+        lead = np.cumsum(out[:, :-1] != 48, axis=1) == 0
+        out[:, :-1][lead] = 0
+    if neg is not None and bool(np.any(neg)):
+        # the zeros between the sign and the digits are dropped with the rest
+        out = np.hstack([np.where(neg, ord("-"), 0).astype(np.uint8)[:, None], out])
+    return out
+
+
+DIGIT_TABLES = {}
+
+
+def digitTable(width):
+    if width not in DIGIT_TABLES:
+        strings = [str(v).rjust(width, "\0").encode() for v in range(10 ** width if width < 5 else 1 << 16)]
+        DIGIT_TABLES[width] = np.frombuffer(b"".join(strings), dtype=np.uint8).reshape(-1, width)
+    return DIGIT_TABLES[width]
+
+
+def textInt(values):
+    values = values.astype(np.int64)
+    return textDigits(np.abs(values), values < 0)
+
+
+# "{:.2f}" of values / 100, exact for whole numbers of hundredths
+def textHundredths(values):
+    values = values.astype(np.int64)
+    whole = np.abs(values)
+    frac = whole % 100
+    return np.hstack([textDigits(whole // 100, values < 0), textLiteral(".", len(values)),
+                      (48 + frac // 10).astype(np.uint8)[:, None], (48 + frac % 10).astype(np.uint8)[:, None]])
+
+
+# strings[index[i]] for each row
+def textLookup(strings, index):
+    encoded = [t.encode() for t in strings]
+    table = np.zeros((len(encoded), max([len(e) for e in encoded] + [1])), dtype=np.uint8)
+    for i, e in enumerate(encoded):
+        table[i, :len(e)] = np.frombuffer(e, dtype=np.uint8)
+    return table[index]
+
+
+# the rows of columns, each ending in a newline
+def textRows(columns):
+    return np.hstack(columns + [textLiteral("\n", len(columns[0]))])
+
+
+def textStrings(strings):
+    return textLookup([t + "\n" for t in strings], np.arange(len(strings)))
+
+
+# rows from several sources (rows, keys, hashes) put in the order of their keys and joined, as (bytes, row lengths,
+# hashes)
+def mergeRows(parts):
+    parts = [p for p in parts if len(p[1]) > 0]
+    if len(parts) == 0:
+        return np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+    width = max(p[0].shape[1] for p in parts)
+    rows = np.concatenate([np.pad(p[0], ((0, 0), (0, width - p[0].shape[1]))) for p in parts])
+    keys = np.concatenate([p[1] for p in parts])
+    hashes = np.concatenate([p[2] for p in parts])
+    if np.any(keys[1:] < keys[:-1]):
+        order = np.argsort(keys, kind="stable")
+        rows, hashes = rows[order], hashes[order]
+    keep = rows != 0
+    return rows[keep], keep.sum(axis=1), hashes
+
+
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+# 64 bit hashes of rows made by the same columns, from the values that went into them rather than their text, for
+# dropping repeated lines as unparseLog does with hash()
+# the same values give the same text, and each kind of row (layout) has text no other kind can have
+def rowHashes(layout, values):
+    hashes = np.full(len(values[0]), layout, dtype=np.uint64)
+    for v in values:
+        hashes = (hashes ^ np.asarray(v).astype(np.int64).view(np.uint64)) * HASH_MULTIPLIER
+        hashes ^= hashes >> np.uint64(29)
+    return hashes
+
+
+# which rows are the first with their hash, the rest would be dropped anyway so their text isn't made at all
+def firstRows(hashes):
+    first = np.zeros(len(hashes), dtype=bool)
+    first[np.unique(hashes, return_index=True)[1]] = True
+    return first
+
+
+def stringHashes(strings):
+    return np.array([hash(t) for t in strings], dtype=np.int64).view(np.uint64)
+
+
+def prefixValues(recs):
+    return [recs[name] for name in ("did", "year", "month", "day", "hour", "minute", "second")]
+
+
+def prefixColumns(recs, csv):
+    n = len(recs)
+    date = [textInt(recs["day"]), textLiteral("/", n), textInt(recs["month"]), textLiteral("/", n),
+            textInt(recs["year"]), textLiteral(" ", n), textInt(recs["hour"]), textLiteral(":", n),
+            textInt(recs["minute"]), textLiteral(":", n), textInt(recs["second"])]
+    if csv:
+        return [textInt(recs["did"]), textLiteral(",", n)] + date + [textLiteral(",", n)]
+    return [textLiteral("[", n), textInt(recs["did"]), textLiteral("] - ", n)] + date + [textLiteral(" - ", n)]
+
+
+READABLE_KINDS = {0x11: ("Raw location, accuracy: ", ""), 0x12: ("Median-filtered location, accuracy: ", "cm"),
+                  0x13: ("Best-accuracy-filtered location, accuracy: ", "cm")}
+
+
+# the records of buf (one chunk of a file at offset base), the fixes in them, and the lines of unparseLog's event and
+# csv files for them as (bytes, row lengths, row hashes), None for the lines if not text
+def decodeLogChunk(buf, starts, base, text=True):
+    data = np.frombuffer(buf, dtype=np.uint8)
+    recs = np.zeros(len(starts), dtype=RECORD_DTYPE)
+    recs["offset"] = starts + base
+    recs["year"] = data[starts + 2].astype(np.uint16) | data[starts + 3].astype(np.uint16) << 8
+    for i, name in enumerate(("month", "day", "hour", "minute", "second", "did", "type")):
+        recs[name] = data[starts + 4 + i]
+    recs["length"] = data[starts + 11].astype(np.uint16) | data[starts + 12].astype(np.uint16) << 8
+    # getLine skips anything over MAX_EVENT bytes that isn't a location block
+    recs = recs[(recs["length"] <= MAX_EVENT) | (recs["type"] == Log.BLOCK_TYPE[0])]
+    starts = recs["offset"] - base
+    types = recs["type"]
+    lengths = recs["length"].astype(np.int64)
+    payloads = starts + LOG_HEAD
+    keys = recs["offset"] << 16
+
+    events = []
+    csv = []
+    fixes = []
+    python = np.ones(len(recs), dtype=bool)
+
+    # commit markers
+    sel = np.flatnonzero((types == Log.COMMIT_TYPE[0]) & (lengths >= 2))
+    if len(sel) > 0 and text:
+        python[sel] = False
+        size = gather(data, payloads[sel], "<u2")
+        hashes = rowHashes(1, prefixValues(recs[sel]) + [size])
+        first = firstRows(hashes)
+        sel, size = sel[first], size[first]
+        rows = textRows(prefixColumns(recs[sel], False) +
+                        [textLiteral("Logs committed: ", len(sel)), textInt(size), textLiteral(" bytes", len(sel))])
+        events.append((rows, keys[sel], hashes[first]))
+
+    # ECEFLogs
+    sel = np.flatnonzero(np.isin(types, ECEF_TYPES) & (lengths >= 20))
+    if len(sel) > 0:
+        python[sel] = False
+        p = payloads[sel]
+        f = np.zeros(len(sel), dtype=FIX_DTYPE)
+        for name in ("did", "year", "month", "day", "hour", "minute", "second"):
+            f[name] = recs[name][sel]
+        f["offset"] = recs["offset"][sel]
+        f["kind"] = types[sel]
+        f["iTOW"] = -1
+        for axis, name in enumerate("xyz"):
+            f[name] = gather(data, p + 4 * axis, "<i4").astype(np.int64) * 100 + \
+                      data[p + 12 + axis].astype(np.int8).astype(np.int64)
+        f["pAcc"] = gather(data, p + 15, "<i4")
+        f["numSvs"] = data[p + 19]
+        fixes.append(f)
+    if len(sel) > 0 and text:
+        accuracy = f["kind"].astype(np.int64) << 33 | f["pAcc"] + (1 << 31)
+        hashes = rowHashes(2, prefixValues(recs[sel]) + [accuracy])
+        first = firstRows(hashes)
+        sel, accuracy = sel[first], accuracy[first]
+        # "accuracy: " + str(pAcc * .01), worked out once for each value there is
+        pairs, index = np.unique(accuracy, return_inverse=True)
+        strings = []
+        for pair in pairs.tolist():
+            kind = pair >> 33
+            pacc = (pair & ((1 << 33) - 1)) - (1 << 31)
+            strings.append(READABLE_KINDS[kind][0] + str(pacc * .01) + READABLE_KINDS[kind][1])
+        rows = textRows(prefixColumns(recs[sel], False) + [textLookup(strings, index.reshape(-1))])
+        events.append((rows, keys[sel], hashes[first]))
+
+    # location blocks
+    sel = np.flatnonzero((types == Log.BLOCK_TYPE[0]) & (lengths >= BLOCK_REF_SIZE))
+    sel = sel[data[payloads[sel]] == Log.BLOCK_VERSION]
+    if len(sel) > 0:
+        (fixBlock, kind, tow, x, y, z, pacc, svs, secs), good, perBlock = decodeBlocks(data, payloads[sel],
+                                                                                       lengths[sel])
+        f = np.zeros(len(fixBlock), dtype=FIX_DTYPE)
+        blockRecs = recs[sel]
+        for name in ("offset", "did", "year", "month", "day", "hour", "minute", "second"):
+            f[name] = blockRecs[name][fixBlock]
+        addSeconds(f, secs)
+        firsts = np.cumsum(perBlock) - perBlock
+        f["fix"] = np.arange(len(fixBlock)) - firsts[fixBlock]
+        f["kind"] = kind
+        f["iTOW"] = tow
+        f["x"], f["y"], f["z"], f["pAcc"], f["numSvs"] = x, y, z, pacc, svs
+        fixes.append(f)
+    if len(sel) > 0 and text:
+        sel, count = sel[good], perBlock[good]
+        python[sel] = False
+        hashes = rowHashes(3, prefixValues(recs[sel]) + [count])
+        first = firstRows(hashes)
+        sel, count = sel[first], count[first]
+        rows = textRows(prefixColumns(recs[sel], False) +
+                        [textLiteral("Location block, ", len(sel)), textInt(count), textLiteral(" fixes", len(sel))])
+        events.append((rows, keys[sel], hashes[first]))
+
+    # a csv line for every fix, the ECEFLogs and blocks mixed back into file order
+    fixes = np.concatenate(fixes) if len(fixes) > 0 else np.zeros(0, dtype=FIX_DTYPE)
+    order = fixes["offset"] << 16 | fixes["fix"]
+    if np.any(order[1:] < order[:-1]):
+        fixes = fixes[np.argsort(order, kind="stable")]
+    if not text:
+        return recs, fixes, None, None
+    if len(fixes) > 0:
+        names = [Log.BLOCK_KINDS.get(k, "unknown") for k in range(256)]
+        # kinds with the same name give the same line
+        nameOf = np.array([names.index(name) for name in names])[fixes["kind"]]
+        hashes = rowHashes(4, prefixValues(fixes) + [nameOf] +
+                           [fixes[name] for name in ("x", "y", "z", "pAcc", "numSvs")])
+        first = firstRows(hashes)
+        lines, nameOf = fixes[first], nameOf[first]
+        rows = textRows(prefixColumns(lines, True) +
+                        [textLookup(names, nameOf), textLiteral(",", len(lines)),
+                         textHundredths(lines["x"]), textLiteral(",", len(lines)),
+                         textHundredths(lines["y"]), textLiteral(",", len(lines)),
+                         textHundredths(lines["z"]), textLiteral(",", len(lines)),
+                         textHundredths(lines["pAcc"]), textLiteral(",", len(lines)),
+                         textHundredths(lines["numSvs"] * 100)])
+        csv.append((rows, lines["offset"] << 16 | lines["fix"], hashes[first]))
+
+    # events, whose text is the same for the same type and payload: each different one is described once by
+    # Log.describeRecord and looked up for the rest
+    inner = np.where(types == REPEAT_TYPE, data[np.minimum(payloads, len(data) - 1)], types)
+    sel = np.flatnonzero(python & ~np.isin(inner, FIX_TYPES))
+    if len(sel) > 0:
+        python[sel] = False
+        p = payloads[sel]
+        # payload, type and length, padded to whole U8s
+        width = int(lengths[sel].max())
+        key = np.zeros((len(sel), (width + 3 + 7) // 8 * 8), dtype=np.uint8)
+        key[:, :width] = data[np.minimum(p[:, None] + np.arange(width), len(data) - 1)]
+        key[:, :width][np.arange(width) >= lengths[sel][:, None]] = 0
+        key[:, -3] = types[sel]
+        key[:, -2:] = lengths[sel].astype("<u2").view(np.uint8).reshape(-1, 2)
+        firstOf, index = np.unique(rowHashes(5, list(key.view("<u8").T)), return_index=True, return_inverse=True)[1:]
+        index = index.reshape(-1)
+        texts = []
+        for i in firstOf.tolist():
+            at = int(p[i])
+            date, did = bytes(buf[at - 11:at - 4]), bytes(buf[at - 4:at - 3])
+            try:
+                line = Log.describeRecord(date, did, bytes(buf[at - 3:at - 2]),
+                                          bytes(buf[at:at + int(lengths[sel[i]])]))[0]
+            except Exception:
+                # unparseLog would have stopped here
+                line = None
+            texts.append(None if line is None else line[len(Log.recordPrefix(date, did)):])
+        described = np.array([text is not None for text in texts])[index]
+        sel, index = sel[described], index[described]
+        texts = [text or "" for text in texts]
+        hashes = rowHashes(5, prefixValues(recs[sel]) + [stringHashes(texts)[index]])
+        first = firstRows(hashes)
+        rows = textRows(prefixColumns(recs[sel[first]], False) + [textLookup(texts, index[first])])
+        events.append((rows, keys[sel[first]], hashes[first]))
+
+    # everything else, the way unparseLog does it
+    readable = []
+    rows = []
+    readableKeys = []
+    rowKeys = []
+    for i in np.flatnonzero(python):
+        p = int(payloads[i])
+        try:
+            line, lines = Log.describeRecord(bytes(buf[p - 11:p - 4]), bytes(buf[p - 4:p - 3]), bytes(buf[p - 3:p - 2]),
+                                             bytes(buf[p:p + int(lengths[i])]))
+        except Exception:
+            # unparseLog would have stopped here
+            continue
+        readable.append(line)
+        readableKeys.append(keys[i])
+        rows += lines
+        rowKeys += [keys[i] + n for n in range(len(lines))]
+    if len(readable) > 0:
+        events.append((textStrings(readable), np.array(readableKeys, dtype=np.int64), stringHashes(readable)))
+    if len(rows) > 0:
+        csv.append((textStrings(rows), np.array(rowKeys, dtype=np.int64), stringHashes(rows)))
+
+    return recs, fixes, mergeRows(events), mergeRows(csv)
+
+
+# decodes a whole log file: its records and fixes as structured arrays (RECORD_DTYPE, FIX_DTYPE) and, if text, the
+# text of the events and csv files unparseLog writes for it, repeated lines left out as unparseLog leaves them out
+def decodeLog(filename, chunkSize=1 << 22, text=True):
+    chunkSize = max(chunkSize, 2 * MAX_RECORD)
+    recs = []
+    fixes = []
+    events = []
+    csv = []
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+        try:
+            pos = 0
+            while pos < size:
+                end = min(size, pos + chunkSize)
+                chunk = mm[pos:end]
+                starts, ends = findRecords(chunk)
+                if end < size:
+                    # as in decodeCapture, records starting past limit are left for the next chunk
+                    limit = len(chunk) - MAX_RECORD
+                    before = starts < limit
+                    starts, ends = starts[before], ends[before]
+                    done = max(limit, int(ends[-1])) if len(ends) > 0 else limit
+                else:
+                    done = len(chunk)
+                r, fx, ev, cs = decodeLogChunk(chunk, starts, pos, text)
+                recs.append(r)
+                fixes.append(fx)
+                events.append(ev)
+                csv.append(cs)
+                pos += done
+        finally:
+            if size > 0:
+                mm.close()
+    decoded = {"records": np.concatenate(recs) if len(recs) > 0 else np.zeros(0, dtype=RECORD_DTYPE),
+               "fixes": np.concatenate(fixes) if len(fixes) > 0 else np.zeros(0, dtype=FIX_DTYPE)}
+    if text:
+        decoded["events"] = uniqueRows(events)
+        decoded["csv"] = uniqueRows(csv)
+    return decoded
+
+
+# the rows of each part (text, row lengths, row hashes) joined, leaving out any already seen
+def uniqueRows(parts):
+    if len(parts) == 0:
+        return b""
+    keep = firstRows(np.concatenate([p[2] for p in parts]))
+    out = []
+    row = 0
+    for text, lengths, hashes in parts:
+        kept = keep[row:row + len(lengths)]
+        row += len(lengths)
+        out.append(text.tobytes() if np.all(kept) else text[np.repeat(kept, lengths)].tobytes())
+    return b"".join(out)
+
+
+# writes the same two files as Log.unparseLog, next to the log
+def unparseLog(filename):
+    decoded = decodeLog(filename)
+    stem = os.path.splitext(filename)[0]
+    with open(stem + "_parsed_events.txt", "wb") as f:
+        f.write(decoded["events"])
+    with open(stem + "_parsed_data.csv", "wb") as f:
+        f.write(decoded["csv"])
+    return decoded
+
+
+TARGET_MB_S = 100  # what decoding logs to arrays is meant to manage
+
+
+# MB/s of decodeLog on a file, to the arrays alone and with the text as well
+def throughput(filename):
+    size = os.path.getsize(filename)
+    rates = []
+    for text in (False, True):
+        start = time.perf_counter()
+        decodeLog(filename, text=text)
+        rates.append(size / 1e6 / (time.perf_counter() - start))
+    return rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode the board's log files in bulk")
+    parser.add_argument("logs", nargs="+", help="log .bin files")
+    parser.add_argument("--time", action="store_true",
+                        help="time decoding the logs instead of writing their text, against TARGET_MB_S")
+    args = parser.parse_args(argv)
+    for fn in args.logs:
+        if args.time:
+            arrays, text = throughput(fn)
+            print("{0}: arrays {1:.1f} MB/s ({2:.0%} of {3} MB/s), with the text {4:.1f} MB/s".format(
+                fn, arrays, arrays / TARGET_MB_S, TARGET_MB_S, text))
+        else:
+            unparseLog(fn)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
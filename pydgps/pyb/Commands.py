@@ -0,0 +1,277 @@
+/* micropython ublox M9 based movement tracker
+ * for the glacsweb.org project
+ * Authors: Emily James 2020, University of Southampton
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    see <https://www.gnu.org/licenses/> for the GNU General Public License
+*/
+# UBX commands sent to the receiver
+# frames are packed into buffers allocated once at import, only the changing fields are written (pack_into) before
+# the checksum is filled in. Configuration goes through CFG-VALSET so several keys, and all the memory layers, are
+# set with one write and confirmed with one ACK
+import struct
+from Formats import fletcher
+
+# CFG-VALSET/VALGET memory layers
+LAYER_RAM = 0x01
+LAYER_BBR = 0x02
+LAYER_FLASH = 0x04
+LAYER_ALL = LAYER_RAM | LAYER_BBR | LAYER_FLASH
+
+# CFG-VALGET takes a single layer to poll, numbered differently
+POLL_RAM = 0
+POLL_BBR = 1
+POLL_FLASH = 2
+POLL_DEFAULT = 7
+
+# configuration keys, see the CFG-TMODE group in the interface description
+CFG_TMODE_MODE = 0x20030001  # E1 0 = disabled, 1 = survey-in, 2 = fixed
+CFG_TMODE_POS_TYPE = 0x20030002  # E1 0 = ECEF, 1 = LLH
+CFG_TMODE_ECEF_X = 0x40030003  # I4 cm
+CFG_TMODE_ECEF_Y = 0x40030004  # I4 cm
+CFG_TMODE_ECEF_Z = 0x40030005  # I4 cm
+CFG_TMODE_ECEF_X_HP = 0x20030006  # I1 0.1mm
+CFG_TMODE_ECEF_Y_HP = 0x20030007  # I1 0.1mm
+CFG_TMODE_ECEF_Z_HP = 0x20030008  # I1 0.1mm
+CFG_TMODE_FIXED_POS_ACC = 0x4003000F  # U4 0.1mm
+CFG_TMODE_SVIN_MIN_DUR = 0x40030010  # U4 s
+CFG_TMODE_SVIN_ACC_LIMIT = 0x40030011  # U4 0.1mm
+
+# output rate (per navigation epoch, 0 = off) of each UBX message on UART1, see the CFG-MSGOUT group
+CFG_MSGOUT_UART1 = (("NAV-POSECEF", 0x20910025),
+                    ("NAV-POSLLH", 0x2091002a),
+                    ("NAV-STATUS", 0x2091001b),
+                    ("NAV-PVT", 0x20910007),
+                    ("NAV-HPPOSECEF", 0x2091002f),
+                    ("NAV-HPPOSLLH", 0x20910034),
+                    ("NAV-TIMEUTC", 0x2091005c),
+                    ("NAV-SAT", 0x20910016),
+                    ("NAV-SVIN", 0x20910089))
+CFG_UART1OUTPROT_NMEA = 0x10740002  # L
+CFG_UART1_BAUDRATE = 0x40520001  # U4
+
+TMODE_DISABLED = 0
+TMODE_SURVEY_IN = 1
+TMODE_FIXED = 2
+
+# value sizes in bytes from bits 28-30 of a key: 1 = one bit (sent as a byte), 2 = 1 byte ... 5 = 8 bytes
+KEY_SIZES = (0, 1, 1, 2, 4, 8)
+KEY_CODES = ("", "<B", "<B", "<H", "<L", "<Q")
+
+# ack states
+ACK_NONE = 0  # nothing sent
+ACK_WAITING = 1
+ACK_ACKED = 2
+ACK_NAKED = 3
+
+
+class Command:
+    buf = None
+    mv = None
+    length = 0  # payload length of the frame currently in buf
+
+    def __init__(self, classs, id, maxPayload):
+        self.buf = bytearray(maxPayload + 8)
+        self.mv = memoryview(self.buf)
+        self.buf[0] = 0xb5
+        self.buf[1] = 0x62
+        self.buf[2] = classs
+        self.buf[3] = id
+
+    def key(self):
+        return self.buf[2] << 8 | self.buf[3]
+
+    # writes the length and checksum for a payload of the given length, returns the frame ready to be written
+    def finish(self, length):
+        self.length = length
+        struct.pack_into("<H", self.buf, 4, length)
+        ck = fletcher(self.buf, 2, 6 + length, 0)
+        self.buf[6 + length] = ck & 255
+        self.buf[7 + length] = ck >> 8
+        return self.mv[:8 + length]
+
+
+# CFG-VALSET (06 8A) with any number of keys: begin(layers), add(key, value)..., then send()
+class ValSet(Command):
+    maxKeys = 0
+    keys = 0
+
+    def __init__(self, maxKeys=16):
+        # version, layers, 2 reserved, then up to maxKeys key (U4) + value (max 8 bytes) pairs
+        super(ValSet, self).__init__(0x06, 0x8A, 4 + maxKeys * 12)
+        self.maxKeys = maxKeys
+        self.begin()
+
+    def begin(self, layers=LAYER_RAM):
+        self.buf[6] = 0
+        self.buf[7] = layers
+        self.buf[8] = 0
+        self.buf[9] = 0
+        self.length = 4
+        self.keys = 0
+        return self
+
+    def add(self, key, value):
+        if self.keys >= self.maxKeys:
+            raise ValueError("Too many keys in one CFG-VALSET")
+        size = KEY_SIZES[(key >> 28) & 7]
+        at = 6 + self.length
+        struct.pack_into("<L", self.buf, at, key)
+        # signed values are sent as their two's complement
+        struct.pack_into(KEY_CODES[(key >> 28) & 7], self.buf, at + 4, value & ((1 << (8 * size)) - 1))
+        self.length += 4 + size
+        self.keys += 1
+        return self
+
+    def frame(self):
+        return self.finish(self.length)
+
+
+# CFG-VALGET (06 8B) poll of one layer: begin(layer), add(key)..., then send(). The reply is a CFG-VALGET message
+# with the values, see valuesReceived
+class ValGet(Command):
+    maxKeys = 0
+    keys = 0
+
+    def __init__(self, maxKeys=16):
+        super(ValGet, self).__init__(0x06, 0x8B, 4 + maxKeys * 4)
+        self.maxKeys = maxKeys
+        self.begin()
+
+    def begin(self, layer=POLL_RAM):
+        self.buf[6] = 0
+        self.buf[7] = layer
+        self.buf[8] = 0
+        self.buf[9] = 0
+        self.length = 4
+        self.keys = 0
+        return self
+
+    def add(self, key):
+        if self.keys >= self.maxKeys:
+            raise ValueError("Too many keys in one CFG-VALGET")
+        struct.pack_into("<L", self.buf, 6 + self.length, key)
+        self.length += 4
+        self.keys += 1
+        return self
+
+
+# (class << 8 | id) -> ack state of the last command sent with that class/id
+pending = {}
+
+
+def send(uart, command, length=-1):
+    frame = command.finish(command.length if length < 0 else length)
+    pending[command.key()] = ACK_WAITING
+    uart.write(frame)
+    return frame
+
+
+def ackReceived(classs, id, acked):
+    key = classs << 8 | id
+    if key in pending:
+        pending[key] = ACK_ACKED if acked else ACK_NAKED
+
+
+def ackState(command):
+    return pending.get(command.key(), ACK_NONE)
+
+
+# key -> value of everything in the CFG-VALGET replies received
+values = {}
+
+
+# reads the key/value pairs of a CFG-VALGET reply that starts at offset start of buf, the poll counts as answered
+def valuesReceived(buf, start):
+    end = start + 6 + (buf[start + 4] | buf[start + 5] << 8)
+    at = start + 10
+    while at + 4 <= end:
+        key = struct.unpack_from("<L", buf, at)[0]
+        size = KEY_SIZES[(key >> 28) & 7]
+        if size == 0 or at + 4 + size > end:
+            break
+        values[key] = struct.unpack_from(KEY_CODES[(key >> 28) & 7], buf, at + 4)[0]
+        at += 4 + size
+    ackReceived(0x06, 0x8B, True)
+
+
+# built once, reused for every reconfiguration
+valset = ValSet()
+valget = ValGet()
+
+# CFG-CFG (06 09): save the current configuration (clear 0, save mask 7967 (0x1F1F), load 0) to flash (device 2)
+saveCfg = Command(0x06, 0x09, 13)
+struct.pack_into("<LLLB", saveCfg.buf, 6, 0, 7967, 0, 2)
+saveCfg.finish(13)
+
+
+def surveyIn(dur, acc, layers=LAYER_ALL):
+    valset.begin(layers)
+    valset.add(CFG_TMODE_MODE, TMODE_SURVEY_IN)
+    valset.add(CFG_TMODE_SVIN_MIN_DUR, dur)
+    valset.add(CFG_TMODE_SVIN_ACC_LIMIT, acc)
+    return valset
+
+
+# fixed base position, e.g. the mean of a finished survey (x/y/z in cm, hp in 0.1mm, acc in 0.1mm)
+def fixedPosition(x, y, z, xhp, yhp, zhp, acc, layers=LAYER_ALL):
+    valset.begin(layers)
+    valset.add(CFG_TMODE_MODE, TMODE_FIXED)
+    valset.add(CFG_TMODE_POS_TYPE, 0)
+    valset.add(CFG_TMODE_ECEF_X, x)
+    valset.add(CFG_TMODE_ECEF_Y, y)
+    valset.add(CFG_TMODE_ECEF_Z, z)
+    valset.add(CFG_TMODE_ECEF_X_HP, xhp)
+    valset.add(CFG_TMODE_ECEF_Y_HP, yhp)
+    valset.add(CFG_TMODE_ECEF_Z_HP, zhp)
+    valset.add(CFG_TMODE_FIXED_POS_ACC, acc)
+    return valset
+
+
+# UART1 output set to exactly the named messages (once per epoch), with NMEA off
+def messageOutput(enabled, layers=LAYER_RAM):
+    valset.begin(layers)
+    for name, key in CFG_MSGOUT_UART1:
+        valset.add(key, 1 if name in enabled else 0)
+    valset.add(CFG_UART1OUTPROT_NMEA, 0)
+    return valset
+
+
+def pollMessageOutput(layer=POLL_RAM):
+    values.clear()
+    valget.begin(layer)
+    for name, key in CFG_MSGOUT_UART1:
+        valget.add(key)
+    valget.add(CFG_UART1OUTPROT_NMEA)
+    return valget
+
+
+# True if the last poll showed the output set by messageOutput(enabled)
+def outputMatches(enabled):
+    for name, key in CFG_MSGOUT_UART1:
+        if values.get(key) != (1 if name in enabled else 0):
+            return False
+    return values.get(CFG_UART1OUTPROT_NMEA) == 0
+
+
+# the receiver switches as soon as it has the command, the ACK may well be lost
+def baudrate(rate, layers=LAYER_RAM):
+    valset.begin(layers)
+    valset.add(CFG_UART1_BAUDRATE, rate)
+    return valset
+
+
+def pollBaudrate(layer=POLL_RAM):
+    values.clear()
+    valget.begin(layer)
+    valget.add(CFG_UART1_BAUDRATE)
+    return valget
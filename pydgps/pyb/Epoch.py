@@ -0,0 +1,102 @@
+/* micropython ublox M9 based movement tracker
+ * for the glacsweb.org project
+ * Authors: Emily James 2020, University of Southampton
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    see <https://www.gnu.org/licenses/> for the GNU General Public License
+*/
+# Groups the messages of each navigation epoch (same iTOW) as they are parsed
+# a small fixed number of slots are reused, each with a bitmask of the messages it has been given, so an epoch is
+# handed on as soon as its last message arrives and memory stays bounded however many junk TOWs a noisy UART produces.
+# Slots more than maxAge ms away from the last complete epoch are dropped as stale, or junk, when a slot is needed.
+
+
+class EpochAssembler:
+    size = 0  # messages per epoch, codes 0 to size-1
+    full = 0  # mask of a complete epoch
+    maxAge = 0
+    tows = None  # iTOW held by each slot, -1 if free
+    masks = None
+    msgs = None
+    latest = -1  # iTOW of the last complete epoch
+
+    # counters
+    completed = 0
+    dropped = 0  # slots freed before they were complete
+
+    def __init__(self, size, slots=4, maxAge=2000):
+        self.size = size
+        self.full = (1 << size) - 1
+        self.maxAge = maxAge
+        self.tows = [-1] * slots
+        self.masks = [0] * slots
+        self.msgs = [None] * slots
+        for i in range(slots):
+            self.msgs[i] = [None] * size
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.tows)):
+            self.free(i)
+        self.latest = -1
+
+    def free(self, i):
+        self.tows[i] = -1
+        self.masks[i] = 0
+        msgs = self.msgs[i]
+        for j in range(self.size):
+            msgs[j] = None
+
+    # adds the message with the given code to its epoch, returns the epoch's list of messages (indexed by code) if
+    # that completed it, otherwise None. The list returned belongs to the caller, the slot gets a new one
+    def add(self, tow, code, msg):
+        i = self.slot(tow)
+        self.msgs[i][code] = msg
+        self.masks[i] |= 1 << code
+        if self.masks[i] != self.full:
+            return None
+        epoch = self.msgs[i]
+        self.msgs[i] = [None] * self.size
+        self.tows[i] = -1
+        self.masks[i] = 0
+        self.latest = tow
+        self.completed += 1
+        return epoch
+
+    # index of the slot for tow, taking a free one if it has none yet
+    def slot(self, tow):
+        tows = self.tows
+        for i in range(len(tows)):
+            if tows[i] == tow:
+                return i
+        # stale or junk slots are dropped first, so an incomplete epoch doesn't wait for all the slots to fill up
+        if self.latest >= 0:
+            for i in range(len(tows)):
+                if tows[i] >= 0 and abs(tows[i] - self.latest) > self.maxAge:
+                    self.dropped += 1
+                    self.free(i)
+        # then the one furthest from the last complete epoch (or the oldest) if none are free
+        use = -1
+        furthest = -1
+        for i in range(len(tows)):
+            if tows[i] < 0:
+                use = i
+                break
+            age = abs(tows[i] - self.latest) if self.latest >= 0 else -tows[i]
+            if use < 0 or age > furthest:
+                furthest = age
+                use = i
+        if tows[use] >= 0:
+            self.dropped += 1
+            self.free(use)
+        self.tows[use] = tow
+        return use
@@ -120,18 +120,107 @@ def x4toBytes(bytearr):
     return encode(bytearr, "<l")
 
 
-# fletcher's algorithm (8-bit)
-def ubxChecksum(bytes):
-    ck_a, ck_b = 0, 0
-    for i in range(len(bytes)):
-        ck_a += bytes[i]
-        ck_b += ck_a
+# signed to unsigned so small values of either sign stay small: 0, -1, 1, -2... -> 0, 1, 2, 3...
+def zigzag(val):
+    return val << 1 if val >= 0 else (-val << 1) - 1
+
+
+def unzigzag(val):
+    return val >> 1 if val & 1 == 0 else -((val + 1) >> 1)
+
+
+# LEB128, 7 bits a byte with the top bit set on all but the last, appended to out
+def putVarint(out, val):
+    while val > 127:
+        out.append(val & 127 | 128)
+        val >>= 7
+    out.append(val)
+
+
+# the varint at buf[i], and the index after it
+def getVarint(buf, i):
+    val = 0
+    shift = 0
+    while True:
+        b = buf[i]
+        i += 1
+        val |= (b & 127) << shift
+        if b < 128:
+            return val, i
+        shift += 7
+
+
+# fletcher's algorithm (8-bit) over buf[start:end], continuing from a previous ck = ck_a | ck_b << 8
+# native viper loops on the board, plain loops anywhere else
+try:
+    import micropython
+
+    @micropython.viper
+    def fletcher(buf, start: int, end: int, ck: int) -> int:
+        p = ptr8(buf)
+        ck_a = ck & 255
+        ck_b = (ck >> 8) & 255
+        i = start
+        while i < end:
+            ck_a = (ck_a + p[i]) & 255
+            ck_b = (ck_b + ck_a) & 255
+            i += 1
+        return ck_a | (ck_b << 8)
+
+    # dst[at:at + n] = src[start:start + n] without making any slices
+    @micropython.viper
+    def copyBytes(dst, at: int, src, start: int, n: int):
+        d = ptr8(dst)
+        s = ptr8(src)
+        i = 0
+        while i < n:
+            d[at + i] = s[start + i]
+            i += 1
+except ImportError:
+    def fletcher(buf, start, end, ck):
+        ck_a = ck & 255
+        ck_b = ck >> 8
+        for i in range(start, end):
+            ck_a += buf[i]
+            ck_b += ck_a
+
+        # mask to preserve 8-bit
+        return (ck_a & 255) | (ck_b & 255) << 8
+
+    def copyBytes(dst, at, src, start, n):
+        dst[at:at + n] = memoryview(src)[start:start + n]
+
+
+# running checksum that can be fed chunks of a frame as they arrive, so it never has to be re-walked
+class UBXChecksum:
+    ck = 0
+
+    def __init__(self):
+        self.ck = 0
+
+    def reset(self):
+        self.ck = 0
+
+    def update(self, buf, start=0, end=-1):
+        if end < 0:
+            end = len(buf)
+        self.ck = fletcher(buf, start, end, self.ck)
+        return self
+
+    def updateByte(self, byte):
+        ck_a = (self.ck + byte) & 255
+        self.ck = ck_a | ((self.ck >> 8) + ck_a & 255) << 8
+
+    def digest(self):
+        return self.ck & 255, self.ck >> 8
+
+    def matches(self, ck_a, ck_b):
+        return self.ck == ck_a | ck_b << 8
 
-    # mask to preserve 8-bit
-    ck_a &= 255
-    ck_b &= 255
 
-    return ck_a, ck_b
+def ubxChecksum(bytes):
+    ck = fletcher(bytes, 0, len(bytes), 0)
+    return ck & 255, ck >> 8
 
 
 def verifyChecksum(payload, checksum):
@@ -0,0 +1,112 @@
+/* micropython ublox M9 based movement tracker
+ * for the glacsweb.org project
+ * Authors: Emily James 2020, University of Southampton
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    see <https://www.gnu.org/licenses/> for the GNU General Public License
+*/
+# Payload layouts of the UBX messages we decode, field names copied from the documentation:
+# https://www.u-blox.com/en/docs/UBX-13003221
+# Each layout is a tuple of (field name, struct code) in payload order, reserved bytes have no name.
+# Only depends on struct so the same definitions can be used by the PC code in client/
+import struct
+
+# B = U1, b = I1, H = U2, h = I2, L = U4, l = I4, x = reserved byte
+# bitfields (X1, X2, X4) are read as unsigned
+
+# 01 01
+NAV_POSECEF = (("iTOW", "L"), ("ecefX", "l"), ("ecefY", "l"), ("ecefZ", "l"), ("pAcc", "L"))
+
+# 01 02
+NAV_POSLLH = (("iTOW", "L"), ("lon", "l"), ("lat", "l"), ("height", "l"), ("hMSL", "l"), ("hAcc", "L"),
+              ("vAcc", "L"))
+
+# 01 03
+NAV_STATUS = (("iTOW", "L"), ("gpsFix", "B"), ("flags", "B"), ("fixStat", "B"), ("flags2", "B"), ("ttff", "L"),
+              ("msss", "L"))
+
+# 01 06
+NAV_SOL = (("iTOW", "L"), ("fTOW", "l"), ("week", "h"), ("gpsFix", "B"), ("flags", "B"), ("ecefX", "l"),
+           ("ecefY", "l"), ("ecefZ", "l"), ("pAcc", "L"), ("ecefVX", "l"), ("ecefVY", "l"), ("ecefVZ", "l"),
+           ("sAcc", "L"), ("pDOP", "H"), (None, "x"), ("numSV", "B"), (None, "4x"))
+
+# 01 07
+NAV_PVT = (("iTOW", "L"), ("year", "H"), ("month", "B"), ("day", "B"), ("hour", "B"), ("min", "B"), ("sec", "B"),
+           ("valid", "B"), ("tAcc", "L"), ("nano", "l"), ("fixType", "B"), ("flags", "B"), ("flags2", "B"),
+           ("numSV", "B"), ("lon", "l"), ("lat", "l"), ("height", "l"), ("hMSL", "l"), ("hAcc", "L"), ("vAcc", "L"),
+           ("velN", "l"), ("velE", "l"), ("velD", "l"), ("gSpeed", "l"), ("headMot", "l"), ("sAcc", "L"),
+           ("headAcc", "L"), ("pDOP", "H"), ("flags3", "H"), (None, "4x"), ("headVeh", "l"), ("magDec", "h"),
+           ("magAcc", "H"))
+
+# 01 13
+NAV_HPPOSECEF = ((None, "4x"), ("iTOW", "L"), ("ecefX", "l"), ("ecefY", "l"), ("ecefZ", "l"), ("ecefXHp", "b"),
+                 ("ecefYHp", "b"), ("ecefZHp", "b"), ("flags", "B"), ("pAcc", "L"))
+
+# 01 14
+NAV_HPPOSLLH = ((None, "3x"), ("flags", "B"), ("iTOW", "L"), ("lon", "l"), ("lat", "l"), ("height", "l"),
+                ("hMSL", "l"), ("lonHp", "b"), ("latHp", "b"), ("heightHp", "b"), ("hMSLHp", "b"), ("hAcc", "L"),
+                ("vAcc", "L"))
+
+# 01 21
+NAV_TIMEUTC = (("iTOW", "L"), ("tAcc", "L"), ("nano", "l"), ("year", "H"), ("month", "B"), ("day", "B"),
+               ("hour", "B"), ("min", "B"), ("sec", "B"), ("valid", "B"))
+
+# 01 35 - only the header, the per-satellite blocks that follow it are not decoded
+NAV_SAT = (("iTOW", "L"), (None, "x"), ("numSvs", "B"), (None, "2x"))
+
+# 01 3B
+NAV_SVIN = ((None, "4x"), ("iTOW", "L"), ("dur", "L"), ("meanX", "l"), ("meanY", "l"), ("meanZ", "l"),
+            ("meanXHp", "b"), ("meanYHp", "b"), ("meanZHp", "b"), (None, "x"), ("meanAcc", "L"), ("obs", "L"),
+            ("valid", "B"), ("active", "B"), (None, "2x"))
+
+# 05 00 / 05 01 - class and id of the command that was (not) acknowledged
+ACK_NAK = (("clsID", "B"), ("msgID", "B"))
+ACK_ACK = (("clsID", "B"), ("msgID", "B"))
+
+# 06 8B - only the header of a poll reply, the key/value pairs that follow depend on the keys polled
+CFG_VALGET = (("version", "B"), ("layer", "B"), ("position", "H"))
+
+# every layout with its class, id and name, registered with a decoder by Message and used for the numpy
+# dtypes in client/ubxscan.py
+MESSAGES = ((0x01, 0x01, "NAV-POSECEF", NAV_POSECEF),
+            (0x01, 0x02, "NAV-POSLLH", NAV_POSLLH),
+            (0x01, 0x03, "NAV-STATUS", NAV_STATUS),
+            (0x01, 0x06, "NAV-SOL", NAV_SOL),
+            (0x01, 0x07, "NAV-PVT", NAV_PVT),
+            (0x01, 0x13, "NAV-HPPOSECEF", NAV_HPPOSECEF),
+            (0x01, 0x14, "NAV-HPPOSLLH", NAV_HPPOSLLH),
+            (0x01, 0x21, "NAV-TIMEUTC", NAV_TIMEUTC),
+            (0x01, 0x35, "NAV-SAT", NAV_SAT),
+            (0x01, 0x3B, "NAV-SVIN", NAV_SVIN),
+            (0x05, 0x00, "ACK-NAK", ACK_NAK),
+            (0x05, 0x01, "ACK-ACK", ACK_ACK),
+            (0x06, 0x8B, "CFG-VALGET", CFG_VALGET))
+
+
+# returns the little endian struct format of a layout and the names of the values it unpacks to
+# if keep is given, named fields not in it are skipped over like reserved bytes
+def compileLayout(fields, keep=None):
+    fmt = "<"
+    names = []
+    for name, code in fields:
+        if name is None:
+            fmt += code
+        elif keep is None or name in keep:
+            fmt += code
+            names.append(name)
+        else:
+            fmt += "{0}x".format(struct.calcsize("<" + code))
+    return fmt, tuple(names)
+
+
+def layoutSize(fields):
+    return struct.calcsize(compileLayout(fields)[0])
@@ -17,6 +17,7 @@
 import pyb
 import Formats
 import os
+import struct
 
 DEVICE_ID = 0
 PRECISION = 0  # 0=day,1=hour
@@ -40,10 +41,10 @@ class DataLog:
     payload = bytearray()
     logType = bytearray()
 
-    def getLogString(self):
+    def getLogString(self, time=None):
         global DEVICE_ID
         pack = bytearray(b'\xb5b')  # start delim
-        pack.extend(curTimeInBytes())  # uses RTC of pyboard, might not match RT if unsynced/drifted
+        pack.extend(curTimeInBytes(time))  # uses RTC of pyboard, might not match RT if unsynced/drifted
         pack.extend(Formats.u1toBytes(DEVICE_ID))  # identifies device
         pack.extend(self.logType)  # log type
         pack.extend(Formats.u2toBytes(len(self.payload)))  # pack length - set dynamically
@@ -55,55 +56,244 @@ class DataLog:
         return pack
 
     def writeLog(self):
-        fn = getdtstring() + "log.bin"
-        writeDataToFile(fn, self.getLogString())
+        time = logTime()
+        dataSink.add(getdtstring(time) + "log.bin", self.getLogString(time))
 
 
 class ECEFLog(DataLog):
     def __init__(self, ecefMsg, smoothType, satMsg):
-        pl = bytearray()
-        pl.extend(ecefMsg.ecefX[0])
-        pl.extend(ecefMsg.ecefY[0])
-        pl.extend(ecefMsg.ecefZ[0])
-        pl.extend(ecefMsg.ecefXHp[0])
-        pl.extend(ecefMsg.ecefYHp[0])
-        pl.extend(ecefMsg.ecefZHp[0])
-        pl.extend(ecefMsg.pAcc[0])
-        pl.extend(satMsg.numSvs[0])
+        # same 20 byte layout as the HPPOSECEF fields it is copied from
+        self.payload = struct.pack("<lllbbbLB", ecefMsg.ecefX, ecefMsg.ecefY, ecefMsg.ecefZ, ecefMsg.ecefXHp,
+                                   ecefMsg.ecefYHp, ecefMsg.ecefZHp, ecefMsg.pAcc, satMsg.getNumSvs())
         self.logType = (bwAnd(b'\x1F', smoothType))
-        self.payload = pl
 
 
-# deprecated due to HUGE latency caused by it - can be re-enabled by looking into functions and uncommenting
+BLOCK_TYPE = b'\x14'
+BLOCK_VERSION = 3
+BLOCK_SIZE = 1024  # payload bytes a block is passed on at, a reading with more fixes takes several blocks
+BLOCK_REF = "<BBLlllbbb"
+FIRST_VARINTS = 2
+FIX_VARINTS = 7
+
+
+# the fixes of a reading in one record, instead of an ECEFLog each
+# payload (version 3): version (U1), then the first fix, which the others are stored against: kind (U1, 0x11, 0x12 or
+# 0x13 as for ECEFLog), iTOW (U4), ecefX/Y/Z (I4), ecefX/Y/ZHp (I1), and pAcc and numSvs as varints. The rest follow in
+# sections of fixes of the same kind, a section being the kind and a count (U1), then for each fix as varints: the
+# change in iTOW from the fix before less the change before that (zigzag), the position less the first fix's in 0.1 mm
+# (zigzag, x, y, z), pAcc, numSvs, and the seconds from the record's time to the RTC's when the fix was added, so each
+# fix is timed as its ECEFLog would have been
+# the first fix takes 24 bytes, those after it about 11 bytes each when the epochs are steady and the fixes close to
+# the first, an ECEFLog is 35
+class LocationBlock(DataLog):
+    time = None
+    refX = 0  # the first fix's position in 0.1 mm
+    refY = 0
+    refZ = 0
+    lastTow = 0
+    lastStep = 0
+    countAt = -1
+
+    def __init__(self, ecefMsg, smoothType, satMsg):
+        self.logType = BLOCK_TYPE
+        self.time = logTime()  # the record is timed at the first fix, not when it is written
+        self.payload = bytearray(struct.pack(BLOCK_REF, BLOCK_VERSION, smoothType[0] & 0x1F, ecefMsg.getTOW(),
+                                             ecefMsg.ecefX, ecefMsg.ecefY, ecefMsg.ecefZ, ecefMsg.ecefXHp,
+                                             ecefMsg.ecefYHp, ecefMsg.ecefZHp))
+        Formats.putVarint(self.payload, ecefMsg.pAcc)
+        Formats.putVarint(self.payload, satMsg.getNumSvs())
+        self.refX = ecefMsg.ecefX * 100 + ecefMsg.ecefXHp
+        self.refY = ecefMsg.ecefY * 100 + ecefMsg.ecefYHp
+        self.refZ = ecefMsg.ecefZ * 100 + ecefMsg.ecefZHp
+        self.lastTow = ecefMsg.getTOW()
+        self.lastStep = 0
+        self.countAt = -1
+
+    def add(self, ecefMsg, smoothType, satMsg):
+        pl = self.payload
+        kind = smoothType[0] & 0x1F
+        if self.countAt < 0 or pl[self.countAt - 1] != kind or pl[self.countAt] == 255:
+            pl.append(kind)
+            pl.append(0)
+            self.countAt = len(pl) - 1
+        pl[self.countAt] += 1
+        step = ecefMsg.getTOW() - self.lastTow
+        Formats.putVarint(pl, Formats.zigzag(step - self.lastStep))
+        self.lastTow = ecefMsg.getTOW()
+        self.lastStep = step
+        Formats.putVarint(pl, Formats.zigzag(ecefMsg.ecefX * 100 + ecefMsg.ecefXHp - self.refX))
+        Formats.putVarint(pl, Formats.zigzag(ecefMsg.ecefY * 100 + ecefMsg.ecefYHp - self.refY))
+        Formats.putVarint(pl, Formats.zigzag(ecefMsg.ecefZ * 100 + ecefMsg.ecefZHp - self.refZ))
+        Formats.putVarint(pl, ecefMsg.pAcc)
+        Formats.putVarint(pl, satMsg.getNumSvs())
+        Formats.putVarint(pl, (daySeconds(logTime()) - daySeconds(self.time)) % 86400)
+
+    def full(self):
+        return len(self.payload) >= BLOCK_SIZE
+
+    def writeLog(self):
+        dataSink.add(getdtstring(self.time) + "log.bin", self.getLogString(self.time))
+
+
+# the fixes of a version 3 LocationBlock payload as (kind, iTOW, x, y, z, pAcc, numSvs, seconds after the record's
+# time), positions as ECEFLog has them (cm, I4) and the Hp parts (0.1 mm, I1) worked out from the first fix, None for
+# any other version
+def readLocationBlock(payload):
+    if len(payload) < struct.calcsize(BLOCK_REF) or payload[0] != BLOCK_VERSION:
+        return None
+    version, kind, tow, rx, ry, rz, rxhp, ryhp, rzhp = struct.unpack_from(BLOCK_REF, payload, 0)
+    ref = (rx * 100 + rxhp, ry * 100 + ryhp, rz * 100 + rzhp)
+    i = struct.calcsize(BLOCK_REF)
+    pacc, i = Formats.getVarint(payload, i)
+    svs, i = Formats.getVarint(payload, i)
+    fixes = [(kind, tow, splitHp(ref[0]), splitHp(ref[1]), splitHp(ref[2]), pacc, svs, 0)]
+    step = 0
+    while i + 2 <= len(payload):
+        kind = payload[i]
+        count = payload[i + 1]
+        i += 2
+        for n in range(count):
+            d, i = Formats.getVarint(payload, i)
+            step += Formats.unzigzag(d)
+            tow += step
+            pos = []
+            for axis in range(3):
+                d, i = Formats.getVarint(payload, i)
+                pos.append(splitHp(ref[axis] + Formats.unzigzag(d)))
+            pacc, i = Formats.getVarint(payload, i)
+            svs, i = Formats.getVarint(payload, i)
+            secs, i = Formats.getVarint(payload, i)
+            fixes.append((kind, tow, pos[0], pos[1], pos[2], pacc, svs, secs))
+    return fixes
+
+
+BLOCK_KINDS = {0x11: "raw", 0x12: "med", 0x13: "ba"}
+
+
+# seconds into the day of an RTC().datetime() tuple
+def daySeconds(time):
+    return time[4] * 3600 + time[5] * 60 + time[6]
+
+
+def daysInMonth(year, month):
+    if month == 2:
+        return 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28
+    return 30 if month in (4, 6, 9, 11) else 31
+
+
+# (year, month, day, hour, minute, second) secs after the time given as the same, as getTime gives it
+def addSeconds(time, secs):
+    year, month, day, hour, minute, second = time
+    secs += hour * 3600 + minute * 60 + second
+    while secs >= 86400:
+        secs -= 86400
+        day += 1
+        if day > daysInMonth(year, month):
+            day = 1
+            month += 1
+            if month > 12:
+                month = 1
+                year += 1
+    return year, month, day, secs // 3600, secs // 60 % 60, secs % 60
+
+
+# an RTC().datetime() tuple secs later, subseconds left as they were
+def addClockSeconds(time, secs):
+    days = (daySeconds(time) + secs) // 86400
+    year, month, day, hour, minute, second = addSeconds((time[0], time[1], time[2], time[4], time[5], time[6]), secs)
+    return year, month, day, (time[3] - 1 + days) % 7 + 1, hour, minute, second, time[7]
+
+
+# the RTC is read once a reading (readClock) and the records logged until the logs are committed are timed from that
+# and pyb.millis(), which is safe as the board doesn't stop before then
+clockTime = None  # RTC().datetime() when it was read, None when each record reads the RTC itself
+clockMs = 0  # pyb.millis() at the start of that second
+clockSecs = 0  # whole seconds after clockTime that clockNow is
+clockNow = None
+
+
+def readClock():
+    global clockTime, clockMs, clockSecs, clockNow
+    clockTime = pyb.RTC().datetime()
+    # the subseconds count down from 255 over the second
+    clockMs = pyb.millis() - (255 - clockTime[7]) * 1000 // 256
+    clockSecs = 0
+    clockNow = clockTime
+
+
+def stopClock():
+    global clockTime
+    clockTime = None
+
+
+# the time to give a record logged now, the same tuple for every record in a second
+def logTime():
+    global clockSecs, clockNow
+    if clockTime is None:
+        return pyb.RTC().datetime()
+    secs = pyb.elapsed_millis(clockMs) // 1000
+    if secs != clockSecs:
+        clockSecs = secs
+        clockNow = addClockSeconds(clockTime, secs)
+    return clockNow
+
+
+# the kinds of fix in a block's payload buf[start:end] as bits (kind - 0x11), stepping over the fixes by counting
+# the last bytes of their varints
+def blockKinds(buf, start, end):
+    if end - start < struct.calcsize(BLOCK_REF) or buf[start] != BLOCK_VERSION:
+        return 0
+    kinds = 0
+    kind = buf[start + 1]
+    left = FIRST_VARINTS
+    i = start + struct.calcsize(BLOCK_REF)
+    while True:
+        if 0x11 <= kind <= 0x13:
+            kinds |= 1 << (kind - 0x11)
+        while left > 0 and i < end:
+            if buf[i] < 128:
+                left -= 1
+            i += 1
+        if i + 2 > end:
+            return kinds
+        kind = buf[i]
+        left = buf[i + 1] * FIX_VARINTS
+        i += 2
+
+
+# 0.1 mm to the (cm, hp) pair HPPOSECEF gives, hp in -99..99 with the sign of the whole
+def splitHp(value):
+    if value < 0:
+        cm, hp = splitHp(-value)
+        return -cm, -hp
+    return value // 100, value % 100
+
+
+# events are kept in eventRing until the logs are committed, so logging one costs no I/O
 class EventLog:
     class_id = bytearray()
     payload = bytearray()
-    # used to filter out latency issues caused by over-using I/O with minor, unimportant events
-    acceptable_ids = [b'\x00', b'\x01', b'\x02', b'\x1e', b'\x1f', b'\x20', b'\x21', b'\xe2', b'\xf1', b'\xf2', b'\xf3',
-                      b'\xf4', b'\xf5', b'\xfe', b'\xff']
 
-    def getLogString(self):
-        global DEVICE_ID
-        if self.class_id not in self.acceptable_ids:
-            return bytearray()
-        pack = bytearray(b'\xb5b')  # start delim
-        pack.extend(curTimeInBytes())  # uses RTC of pyboard, might not match RT if unsynced/drifted
-        pack.extend(Formats.u1toBytes(DEVICE_ID))  # log type
-        pack.extend(self.class_id)  # log type
-        pack.extend(
-            Formats.u2toBytes(len(self.payload)))  # pack length - should be 24 but just in case, calc dynamically
-        pack.extend(self.payload)
-
-        ck_a, ck_b = Formats.ubxChecksum(self.payload)
-        pack.extend(Formats.u1toBytes(ck_a))
-        pack.extend(Formats.u1toBytes(ck_b))
-        return pack
+    def getLogString(self, time=None):
+        return eventString(self.class_id, self.payload, time)
 
     def writeLog(self):
-        if self.class_id not in self.acceptable_ids:
-            return bytearray()
-        fn = getdtstring() + "eventLog.bin"
-        writeDataToFile(fn, self.getLogString())
+        eventRing.add(self.class_id, self.payload, logTime())
+
+
+def eventString(class_id, payload, time=None):
+    global DEVICE_ID
+    pack = bytearray(b'\xb5b')  # start delim
+    pack.extend(curTimeInBytes(time))  # uses RTC of pyboard, might not match RT if unsynced/drifted
+    pack.extend(Formats.u1toBytes(DEVICE_ID))  # identifies device
+    pack.extend(class_id)  # log type
+    pack.extend(Formats.u2toBytes(len(payload)))  # pack length - set dynamically
+    pack.extend(payload)
+
+    ck_a, ck_b = Formats.ubxChecksum(payload)
+    pack.extend(Formats.u1toBytes(ck_a))
+    pack.extend(Formats.u1toBytes(ck_b))
+    return pack
 
 
 waiting_logs = {}
@@ -112,12 +302,301 @@ waiting_logs = {}
 def writeDataToFile(filename, data):
     if filename not in waiting_logs:
         waiting_logs[filename] = 0
+    appendToFile(filename, data)
+
+
+def appendToFile(filename, data):
     file = open(filename, "ab")
     file.write(data)
     file.flush()
     file.close()
 
 
+SECTOR_SIZE = 512
+COMMIT_TYPE = b'\x0C'
+COMMIT_SIZE = 19  # bytes of a commit marker record, 4 byte payload
+
+
+# write-behind buffer for the records of one log file, so the flash is written a sector at a time instead of being
+# opened, appended to and closed for every record
+# each commit appends the buffered records followed by a commit marker record, whose payload is the number of bytes
+# committed before it (U2) and their checksum. A brownout can only lose records since the last commit, and a reader
+# can tell a write that was cut short from a complete one
+# the index entries of the records are made as they are added and kept until a sector's worth has been written, or the
+# records go to another file, so the index costs a flash write every few dozen records rather than one each commit
+class LogSink:
+    buf = None
+    mv = None
+    used = 0
+    filename = None
+    offset = 0  # size of the file, the offset of buf[0] in it
+    index = None
+    indexUsed = 0
+
+    def __init__(self, size=SECTOR_SIZE):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.used = 0
+        self.filename = None
+        self.offset = 0
+        self.index = bytearray(INDEX_ENTRIES * INDEX_SIZE)
+        self.indexUsed = 0
+
+    def add(self, filename, record):
+        if filename != self.filename:
+            self.commit()
+            self.writeIndex()
+            self.filename = filename
+            self.offset = fileSize(filename)
+        elif self.used + len(record) + COMMIT_SIZE > len(self.buf) or \
+                self.indexUsed + 2 * INDEX_SIZE > len(self.index):
+            self.commit()
+        if len(record) + COMMIT_SIZE > len(self.buf):
+            # longer than the buffer, goes out on its own
+            marker = commitMarker(record, 0, len(record))
+            self.addEntry(record, self.offset)
+            self.addEntry(marker, self.offset + len(record))
+            writeDataToFile(filename, record + marker)
+            self.written(len(record) + COMMIT_SIZE)
+            return
+        self.addEntry(record, self.offset + self.used)
+        Formats.copyBytes(self.buf, self.used, record, 0, len(record))
+        self.used += len(record)
+
+    def commit(self):
+        if self.used == 0:
+            return
+        marker = commitMarker(self.buf, 0, self.used)
+        Formats.copyBytes(self.buf, self.used, marker, 0, COMMIT_SIZE)
+        self.addEntry(marker, self.offset + self.used)
+        writeDataToFile(self.filename, self.mv[:self.used + COMMIT_SIZE])
+        self.written(self.used + COMMIT_SIZE)
+        self.used = 0
+
+    # after each write to the log file there is room for the entries of a record and its commit marker
+    def written(self, size):
+        self.offset += size
+        if self.indexUsed + 2 * INDEX_SIZE > len(self.index):
+            self.writeIndex()
+
+    def addEntry(self, record, offset):
+        packIndexEntry(self.index, self.indexUsed, record, 0, offset)
+        self.indexUsed += INDEX_SIZE
+
+    # the entries of records already in the log file go to its index
+    def writeIndex(self):
+        if self.indexUsed == 0:
+            return
+        appendToFile(indexName(self.filename), memoryview(self.index)[:self.indexUsed])
+        self.indexUsed = 0
+
+
+def commitMarker(buf, start, end):
+    ck = Formats.fletcher(buf, start, end, 0)
+    payload = Formats.u2toBytes(end - start) + Formats.u1toBytes(ck & 255) + Formats.u1toBytes(ck >> 8)
+    return eventString(COMMIT_TYPE, payload)
+
+
+# each log file has an index alongside it (2-4-2021-log.bin -> 2-4-2021-log.idx) with an entry for every record:
+# its offset in the file (U4), time as in the record (U2 year, U1 month, day, hour, minute, second), device id (U1),
+# type (U1) and, for a location block, the kinds of fix it holds (bit kind - 0x11)
+# so a reader can go straight to the records of a time range or type instead of scanning the file for them
+# the board writes the index behind the log, so the index of a file still being written can be missing its last
+# records, indexIsCurrent tells and rebuildIndex makes it again
+INDEX_ENTRY = "<LHBBBBBBBB"
+INDEX_SIZE = 14
+INDEX_ENTRIES = SECTOR_SIZE // INDEX_SIZE  # entries a LogSink holds before writing them
+
+
+def indexName(filename):
+    return filename[:filename.rfind(".")] + ".idx"
+
+
+def fileSize(filename):
+    try:
+        return os.stat(filename)[6]
+    except OSError:
+        return 0
+
+
+# the index entry of the record at buf[i], offset in its file, packed into out at
+def packIndexEntry(out, at, buf, i, offset):
+    kinds = 0
+    if buf[i + 10] == BLOCK_TYPE[0]:
+        kinds = blockKinds(buf, i + 13, i + 13 + (buf[i + 11] | buf[i + 12] << 8))
+    struct.pack_into(INDEX_ENTRY, out, at, offset, buf[i + 2] | buf[i + 3] << 8, buf[i + 4], buf[i + 5], buf[i + 6],
+                     buf[i + 7], buf[i + 8], buf[i + 9], buf[i + 10], kinds)
+
+
+# index entries for the whole records in buf[start:end] with good checksums, buf[start] being at offset base in the
+# file, anything else is stepped over a byte at a time
+def indexEntries(buf, start, end, base):
+    entries = bytearray()
+    i = start
+    while i + 15 <= end:
+        if buf[i] != 0xb5 or buf[i + 1] != 0x62:
+            i += 1
+            continue
+        length = buf[i + 11] | buf[i + 12] << 8
+        stop = i + 13 + length
+        if stop + 2 > end or Formats.fletcher(buf, i + 13, stop, 0) != buf[stop] | buf[stop + 1] << 8:
+            i += 1
+            continue
+        entries.extend(bytes(INDEX_SIZE))
+        packIndexEntry(entries, len(entries) - INDEX_SIZE, buf, i, base + i - start)
+        i = stop + 2
+    return entries
+
+
+# deletes a log file and its index, with whatever a sink is holding for them
+def removeLog(filename):
+    for sink in (dataSink, eventSink):
+        if sink.filename == filename:
+            sink.commit()
+            sink.indexUsed = 0
+            sink.offset = 0
+    os.remove(filename)
+    try:
+        os.remove(indexName(filename))
+    except OSError:
+        pass
+
+
+# indexes a log file from scratch, for files written before there were indexes or whose index was lost
+def rebuildIndex(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    with open(indexName(filename), "wb") as f:
+        f.write(indexEntries(data, 0, len(data), 0))
+
+
+# whether a log file's index has every record of it, its last entry being for the record the file ends with
+def indexIsCurrent(filename):
+    size = fileSize(filename)
+    entries = fileSize(indexName(filename)) // INDEX_SIZE
+    if entries == 0:
+        return size == 0
+    with open(indexName(filename), "rb") as f:
+        f.seek((entries - 1) * INDEX_SIZE)
+        offset = struct.unpack("<L", f.read(4))[0]
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        head = f.read(13)
+    return len(head) == 13 and offset + 15 + (head[11] | head[12] << 8) == size
+
+
+# (offset, (year, month, day, hour, minute, second), device id, type, kinds) of each record in a file's index
+def readIndex(filename):
+    with open(indexName(filename), "rb") as f:
+        data = f.read()
+    entries = []
+    for i in range(0, len(data) - INDEX_SIZE + 1, INDEX_SIZE):
+        offset, year, month, day, hour, minute, second, did, type, kinds = struct.unpack_from(INDEX_ENTRY, data, i)
+        entries.append((offset, (year, month, day, hour, minute, second), did, type, kinds))
+    return entries
+
+
+# the records of a log file in [start, end) by time, (year, month, day, hour, minute, second) tuples, and of the
+# given types, found through its index and returned as getLine does
+# kinds picks location fixes (0x11 raw, 0x12 median, 0x13 best), whether logged alone or in a location block
+def seekRecords(filename, start=None, end=None, types=None, kinds=None):
+    mask = 0
+    if kinds is not None:
+        for kind in kinds:
+            mask |= 1 << (kind - 0x11)
+    with open(filename, "rb") as f:
+        for offset, time, did, type, inBlock in readIndex(filename):
+            if start is not None and time < start or end is not None and time >= end:
+                continue
+            if types is not None and type not in types:
+                continue
+            if kinds is not None and type not in kinds and not inBlock & mask:
+                continue
+            f.seek(offset)
+            yield readRecord(f)
+
+
+# the record at the file's position, as getLine returns it but without searching for the start
+def readRecord(file):
+    head = file.read(13)
+    length = head[11] | head[12] << 8
+    data = file.read(length)
+    file.read(2)
+    return head[2:9], head[9:10], head[10:11], data
+
+
+EVENT_SLOTS = 16
+REPEAT_TYPE = b'\x0D'
+REPEAT_MAX = 65535
+EVENT_MAX = 50 - 3  # payload bytes an event can have for its repeat record to be within the 50 bytes getLine reads
+
+
+# the events logged since the last commit, in the order they first happened
+# an event the same as one already held (type and payload) only adds to that one's count, so a burst of the same
+# error costs one slot and is written as one repeat record: the type it stands for (U1), the count (U2) and the
+# event's payload, timed at the first of them
+# once every slot is taken the events are passed on to eventSink, which writes them when it fills
+class EventRing:
+    ids = None
+    payloads = None
+    times = None
+    counts = None
+    used = 0
+
+    def __init__(self, slots=EVENT_SLOTS):
+        self.ids = [None] * slots
+        self.payloads = [None] * slots
+        self.times = [None] * slots
+        self.counts = [0] * slots
+        self.used = 0
+
+    def add(self, class_id, payload, time):
+        for i in range(self.used):
+            if self.ids[i] == class_id and self.payloads[i] == payload:
+                if self.counts[i] < REPEAT_MAX:
+                    self.counts[i] += 1
+                return
+        if self.used == len(self.ids):
+            self.flush()
+        i = self.used
+        self.ids[i] = class_id
+        self.payloads[i] = payload
+        self.times[i] = time
+        self.counts[i] = 1
+        self.used += 1
+
+    def flush(self):
+        for i in range(self.used):
+            time = self.times[i]
+            if self.counts[i] == 1:
+                record = eventString(self.ids[i], self.payloads[i], time)
+            else:
+                payload = bytearray(self.ids[i])
+                payload.extend(Formats.u2toBytes(self.counts[i]))
+                payload.extend(self.payloads[i][:EVENT_MAX])
+                record = eventString(REPEAT_TYPE, payload, time)
+            eventSink.add(getdtstring(time) + "eventLog.bin", record)
+            self.payloads[i] = None
+            self.times[i] = None
+        self.used = 0
+
+
+dataSink = LogSink()  # sized for a reading by initLogs
+eventSink = LogSink()
+eventRing = EventRing()
+
+
+# writes out everything the sinks are holding, before anything is transmitted and at startup
+# at the end of a reading (events False) the reading's records are written and its events left in eventSink until it
+# fills, so a reading is one flash write, and a brownout loses at most the events since the sink was last written
+def commitLogs(events=True):
+    eventRing.flush()
+    dataSink.commit()
+    if events:
+        eventSink.commit()
+    stopClock()
+
+
 class StartupEvent(EventLog):
     class_id = b'\x00'
 
@@ -182,7 +661,7 @@ class UnacceptableLengthError(EventLog):
     class_id = b'\xF1'
 
     def __init__(self, lengthbytes):
-        self.payload.extend(lengthbytes)
+        self.payload = bytearray(lengthbytes)
 
 
 class NoMessageError(EventLog):
@@ -226,13 +705,22 @@ class UnknownError(EventLog):
     class_id = b'\xFF'
 
     def __init__(self, description):
-        # cap length of descr at 25 bytes
-        self.payload = bytearray(description[:min(len(description), 50)])
+        # capped so a repeat of it keeps all of it
+        self.payload = bytearray(description, "utf-8")[:EVENT_MAX]
 
 
-def initLogs(device_id):
-    global DEVICE_ID
+ECEF_RECORD_SIZE = 35  # bytes of an ECEFLog record, a location block takes less for each fix
+
+
+# fixes is the most a reading logs, dataSink is made big enough for them
+def initLogs(device_id, fixes=0):
+    global DEVICE_ID, dataSink
     DEVICE_ID = device_id
+    size = fixes * ECEF_RECORD_SIZE + COMMIT_SIZE
+    if size > len(dataSink.buf):
+        dataSink.commit()
+        dataSink.writeIndex()
+        dataSink = LogSink(size)
 
 
 def bwAnd(b1, b2):
@@ -262,14 +750,18 @@ def getTime(bytes):
     return year, month, day, hour, minute, second
 
 
-def curTimeInBytes():
-    year, month, day, weekday, hours, minutes, seconds, subseconds = pyb.RTC().datetime()
+# time is an RTC().datetime() tuple, the RTC is read if it isn't given
+def curTimeInBytes(time=None):
+    if time is None:
+        time = pyb.RTC().datetime()
+    year, month, day, weekday, hours, minutes, seconds, subseconds = time
     return Formats.u2toBytes(year) + Formats.u1toBytes(month) + Formats.u1toBytes(day) + Formats.u1toBytes(hours) + \
            Formats.u1toBytes(minutes) + Formats.u1toBytes(seconds)
 
 
-def getdtstring():
-    time = pyb.RTC().datetime()
+def getdtstring(time=None):
+    if time is None:
+        time = pyb.RTC().datetime()
     return "{0}-{1}-{2}-".format(time[2], time[1], time[0])
 
 
@@ -312,7 +804,7 @@ def getLine(file):
         return None
 
     length = Formats.U2(lbytes)
-    if length > 50:
+    if length > 50 and type != BLOCK_TYPE:
         return b''
 
     data = file.read(length)
@@ -339,137 +831,169 @@ def unparseLog(filename):
         # skip empty lines
         if len(line) == 0:
             continue
-        year, month, day, hour, minute, second = list(map(str, getTime(line[0])))
-        did = Formats.U1(line[1])
-        type = Formats.U1(line[2])
-        logdata = line[3]
-        readable = "[{0}] - {1}/{2}/{3} {4}:{5}:{6} - ".format(did, day, month, year, hour, minute, second)
-        csv = "{0},{1}/{2}/{3} {4}:{5}:{6},".format(did, day, month, year, hour, minute, second)
-        print(type, readable, logdata)
-        if type == 0x00:
-            readable += "Device startup"
-        elif type == 0x01:
-            readable += "RTC synchronised"
-        elif type == 0x02:
-            readable += "RTC time updated"
-        elif type == 0x02:
-            readable += "Wakeup events synced to RTC"
-        elif readable == 0x03:
-            readable += "Calibration succeeded"
-        elif type == 0x10:
-            eType = logdata[0]
-            if eType == 0x11:
-                eType = "unfiltered"
-            elif eType == 0x12:
-                eType = "median"
-            elif eType == 0x13:
-                eType = "best-acc"
-            else:
-                eType = "unknown"
-            readable += "ECEF Location logged [{0}]".format(eType)
-        elif type == 0x11:
-            # raw location log
-            x = Formats.I4(logdata[0:4]) + 1e-2 * Formats.I1(logdata[12:13])
-            y = Formats.I4(logdata[4:8]) + 1e-2 * Formats.I1(logdata[13:14])
-            z = Formats.I4(logdata[8:12]) + 1e-2 * Formats.I1(logdata[14:15])
-            pacc = Formats.I4(logdata[15:19]) * .01
-            svs = Formats.U1(logdata[19:20])
-            readable += "Raw location, accuracy: " + str(pacc)
-            csv += "raw,{0:.2f},{1:.2f},{2:.2f},{3:.2f},{4:.2f}".format(x, y, z, pacc, svs)
-            print(readable)
-        elif type == 0x12:
-            x = Formats.I4(logdata[0:4]) + 1e-2 * Formats.I1(logdata[12:13])
-            y = Formats.I4(logdata[4:8]) + 1e-2 * Formats.I1(logdata[13:14])
-            z = Formats.I4(logdata[8:12]) + 1e-2 * Formats.I1(logdata[14:15])
-            pacc = Formats.I4(logdata[15:19]) * .01
-            svs = Formats.U1(logdata[19:20])
-            readable += "Median-filtered location, accuracy: " + str(pacc)+"cm"
-            csv += "med,{0:.2f},{1:.2f},{2:.2f},{3:.2f},{4:.2f}".format(x, y, z, pacc, svs)
-            print(readable)
-        elif type == 0x13:
-            x = Formats.I4(logdata[0:4]) + 1e-2 * Formats.I1(logdata[12:13])
-            y = Formats.I4(logdata[4:8]) + 1e-2 * Formats.I1(logdata[13:14])
-            z = Formats.I4(logdata[8:12]) + 1e-2 * Formats.I1(logdata[14:15])
-            pacc = Formats.I4(logdata[15:19]) * .01
-            svs = Formats.U1(logdata[19:20])
-            readable += "Best-accuracy-filtered location, accuracy: " + str(pacc)+"cm"
-            csv += "ba,{0:.2f},{1:.2f},{2:.2f},{3:.2f},{4:.2f}".format(x, y, z, pacc, svs)
-            print(readable)
-        elif type == 0x1E:
-            readable += "Location logs transmitted"
-        elif type == 0x1F:
-            readable += "Location logs cleared"
-        elif type == 0x20:
-            readable += "LCD on"
-        elif type == 0x21:
-            readable += "LCD off"
-        elif type == 0x22:
-            readable += "LCD locked"
-        elif type == 0x23:
-            readable += "LCD unlocked"
-        elif type == 0xE0:
-            # len forcibly changed by code
-            ubxClass = Formats.U1(logdata[:1])
-            ubxID = Formats.U1(logdata[1:2])
-            byteLength = Formats.U2(logdata[2:4])
-            newLength = Formats.U2(logdata[4:6])
-            readable += "Length force for " + str([ubxClass, ubxID]) + ": " + str(
-                byteLength) + " -> " + str(
-                newLength)
-        elif type == 0xE1:
-            # len mismatch with parsed len
-            ubxClass = Formats.U1(logdata[:1])
-            ubxID = Formats.U1(logdata[1:2])
-            byteLength = Formats.U2(logdata[2:4])
-            parseLength = Formats.U2(logdata[4:6])
-            readable += "Length mismatch on " + str([ubxClass, ubxID]) + ": " + str(byteLength) + "(b) vs " + str(
-                parseLength) + "(p)"
-        elif type == 0xE2:
-            # no parse data for incoming message
-            ubxClass = Formats.U1(logdata[:1])
-            ubxID = Formats.U1(logdata[1:2])
-            readable += "No class=" + str(ubxClass) + ", id=" + str(ubxID)
-        elif type == 0xF0:
-            readable += "UART port uncalibrated"
-        elif type == 0xF1:
-            # unacceptable packet length on uart stream (>100 and not sat)
+        print(Formats.U1(line[2]), recordPrefix(line[0], line[1]), line[3])
+        if line[2] == b'\xF1':
             print(line)
-            try:
-                badLength = Formats.U2(logdata[:2])
-            except:
-                badLength = "<uknown>"
-            readable += "Bad UART len: " + str(badLength)
-        elif type == 0xF2:
-            # number ENcoding error
-            badNumber = (logdata[:4])
-            format = (logdata[4:6])
-            readable += "Number encoding error: " + str(badNumber) + ": " + str(format)
-        elif type == 0xF3:
-            # number DEcoding error
-            badNumber = (logdata[:4])
-            format = (logdata[4:6])
-            readable += "Number decoding error: " + str(badNumber) + ": " + str(format)
-        elif type == 0xF4:
-            readable += "Calibration t-o"
-        elif type == 0xF5:
-            readable += "Reading t-o"
-        elif type == 0xFE:
-            readable += "No storage space"
-        elif type == 0xFF:
-            readable += str(logdata)
-        else:
-            readable += "UE: " + str(type)
+        readable, rows = describeRecord(line[0], line[1], line[2], line[3])
         if hash(readable) not in dups:
             # write to file - no check for file space :/
             fev.write(readable + "\n")
             dups.add(hash(readable))
-        # csv line complete
-        if csv[-1] != "," and hash(csv) not in dups:
-            fcsv.write(csv+"\n")
-            dups.add(hash(csv))
+        for csv in rows:
+            if hash(csv) not in dups:
+                fcsv.write(csv + "\n")
+                dups.add(hash(csv))
         # print(readable)
         # print("------")
     fcsv.flush()
     fcsv.close()
     fev.flush()
     fev.close()
+
+
+# the start of a record's event text, its device id and time
+def recordPrefix(date, did):
+    return "[{0}] - {3}/{2}/{1} {4}:{5}:{6} - ".format(Formats.U1(did), *getTime(date))
+
+
+# the event text and csv lines unparseLog writes for one record, as getLine returns it
+def describeRecord(date, did, type, logdata):
+    year, month, day, hour, minute, second = list(map(str, getTime(date)))
+    readable = recordPrefix(date, did)
+    did = Formats.U1(did)
+    type = Formats.U1(type)
+    rows = []
+    csv = "{0},{1}/{2}/{3} {4}:{5}:{6},".format(did, day, month, year, hour, minute, second)
+    if type == 0x0D:
+        # repeated event, read as the event it stands for
+        readable += "(x" + str(Formats.U2(logdata[1:3])) + ") "
+        type = Formats.U1(logdata[0:1])
+        logdata = logdata[3:]
+    if type == 0x00:
+        readable += "Device startup"
+    elif type == 0x0C:
+        readable += "Logs committed: " + str(Formats.U2(logdata[0:2])) + " bytes"
+    elif type == 0x01:
+        readable += "RTC synchronised"
+    elif type == 0x02:
+        readable += "RTC time updated"
+    elif type == 0x02:
+        readable += "Wakeup events synced to RTC"
+    elif readable == 0x03:
+        readable += "Calibration succeeded"
+    elif type == 0x10:
+        eType = logdata[0]
+        if eType == 0x11:
+            eType = "unfiltered"
+        elif eType == 0x12:
+            eType = "median"
+        elif eType == 0x13:
+            eType = "best-acc"
+        else:
+            eType = "unknown"
+        readable += "ECEF Location logged [{0}]".format(eType)
+    elif type == 0x11:
+        # raw location log
+        x = Formats.I4(logdata[0:4]) + 1e-2 * Formats.I1(logdata[12:13])
+        y = Formats.I4(logdata[4:8]) + 1e-2 * Formats.I1(logdata[13:14])
+        z = Formats.I4(logdata[8:12]) + 1e-2 * Formats.I1(logdata[14:15])
+        pacc = Formats.I4(logdata[15:19]) * .01
+        svs = Formats.U1(logdata[19:20])
+        readable += "Raw location, accuracy: " + str(pacc)
+        csv += "raw,{0:.2f},{1:.2f},{2:.2f},{3:.2f},{4:.2f}".format(x, y, z, pacc, svs)
+    elif type == 0x12:
+        x = Formats.I4(logdata[0:4]) + 1e-2 * Formats.I1(logdata[12:13])
+        y = Formats.I4(logdata[4:8]) + 1e-2 * Formats.I1(logdata[13:14])
+        z = Formats.I4(logdata[8:12]) + 1e-2 * Formats.I1(logdata[14:15])
+        pacc = Formats.I4(logdata[15:19]) * .01
+        svs = Formats.U1(logdata[19:20])
+        readable += "Median-filtered location, accuracy: " + str(pacc)+"cm"
+        csv += "med,{0:.2f},{1:.2f},{2:.2f},{3:.2f},{4:.2f}".format(x, y, z, pacc, svs)
+    elif type == 0x13:
+        x = Formats.I4(logdata[0:4]) + 1e-2 * Formats.I1(logdata[12:13])
+        y = Formats.I4(logdata[4:8]) + 1e-2 * Formats.I1(logdata[13:14])
+        z = Formats.I4(logdata[8:12]) + 1e-2 * Formats.I1(logdata[14:15])
+        pacc = Formats.I4(logdata[15:19]) * .01
+        svs = Formats.U1(logdata[19:20])
+        readable += "Best-accuracy-filtered location, accuracy: " + str(pacc)+"cm"
+        csv += "ba,{0:.2f},{1:.2f},{2:.2f},{3:.2f},{4:.2f}".format(x, y, z, pacc, svs)
+    elif type == 0x14:
+        fixes = readLocationBlock(logdata)
+        if fixes is None:
+            readable += "Location block of unknown version " + str(logdata[0])
+        else:
+            readable += "Location block, " + str(len(fixes)) + " fixes"
+            for kind, tow, x, y, z, pacc, svs, secs in fixes:
+                # same lines as the ECEFLogs they stand for, each at its own time
+                fixCsv = "{0},{3}/{2}/{1} {4}:{5}:{6},".format(did, *addSeconds(getTime(date), secs))
+                line = fixCsv + "{0},{1:.2f},{2:.2f},{3:.2f},{4:.2f},{5:.2f}".format(
+                    BLOCK_KINDS.get(kind, "unknown"), x[0] + 1e-2 * x[1], y[0] + 1e-2 * y[1], z[0] + 1e-2 * z[1],
+                    pacc * .01, svs)
+                rows.append(line)
+    elif type == 0x1E:
+        readable += "Location logs transmitted"
+    elif type == 0x1F:
+        readable += "Location logs cleared"
+    elif type == 0x20:
+        readable += "LCD on"
+    elif type == 0x21:
+        readable += "LCD off"
+    elif type == 0x22:
+        readable += "LCD locked"
+    elif type == 0x23:
+        readable += "LCD unlocked"
+    elif type == 0xE0:
+        # len forcibly changed by code
+        ubxClass = Formats.U1(logdata[:1])
+        ubxID = Formats.U1(logdata[1:2])
+        byteLength = Formats.U2(logdata[2:4])
+        newLength = Formats.U2(logdata[4:6])
+        readable += "Length force for " + str([ubxClass, ubxID]) + ": " + str(
+            byteLength) + " -> " + str(
+            newLength)
+    elif type == 0xE1:
+        # len mismatch with parsed len
+        ubxClass = Formats.U1(logdata[:1])
+        ubxID = Formats.U1(logdata[1:2])
+        byteLength = Formats.U2(logdata[2:4])
+        parseLength = Formats.U2(logdata[4:6])
+        readable += "Length mismatch on " + str([ubxClass, ubxID]) + ": " + str(byteLength) + "(b) vs " + str(
+            parseLength) + "(p)"
+    elif type == 0xE2:
+        # no parse data for incoming message
+        ubxClass = Formats.U1(logdata[:1])
+        ubxID = Formats.U1(logdata[1:2])
+        readable += "No class=" + str(ubxClass) + ", id=" + str(ubxID)
+    elif type == 0xF0:
+        readable += "UART port uncalibrated"
+    elif type == 0xF1:
+        # unacceptable packet length on uart stream (>100 and not sat)
+        try:
+            badLength = Formats.U2(logdata[:2])
+        except:
+            badLength = "<uknown>"
+        readable += "Bad UART len: " + str(badLength)
+    elif type == 0xF2:
+        # number ENcoding error
+        badNumber = (logdata[:4])
+        format = (logdata[4:6])
+        readable += "Number encoding error: " + str(badNumber) + ": " + str(format)
+    elif type == 0xF3:
+        # number DEcoding error
+        badNumber = (logdata[:4])
+        format = (logdata[4:6])
+        readable += "Number decoding error: " + str(badNumber) + ": " + str(format)
+    elif type == 0xF4:
+        readable += "Calibration t-o"
+    elif type == 0xF5:
+        readable += "Reading t-o"
+    elif type == 0xFE:
+        readable += "No storage space"
+    elif type == 0xFF:
+        readable += str(logdata)
+    else:
+        readable += "UE: " + str(type)
+    # csv line complete
+    if csv[-1] != ",":
+        rows.append(csv)
+    return readable, rows
@@ -18,7 +18,10 @@
 # field names are direct copy to documentation found here:
 # https://www.u-blox.com/en/docs/UBX-13003221
 
+import struct
+from array import array
 from Formats import *
+from Layouts import *
 
 fixes = ["No fix", "Dead reckoning", "2D", "3D", "GPS + DR", "Time"]
 
@@ -33,182 +36,185 @@ class InvalidFixError(Exception):
         return self.msg
 
 
+# a message is one object holding its decoded fields in an array, in the order of its layout (Layouts.py), with a
+# property of the class for each field. On the board an object's attributes go in a dict (MicroPython ignores
+# __slots__), whose table is grown a few entries at a time as they are set, the array is 4 bytes a field.
+# U4 fields are unpacked as I4 so every value fits the array (see decodingLayout) and read back unsigned
+def field(i):
+    return property(lambda self: self.v[i])
+
+
+def unsigned(i):
+    return property(lambda self: self.v[i] & 0xFFFFFFFF)
+
+
 class Message:
-    iTOW = None
+    v = None
+    iTOW = unsigned(0)
 
-    def __init__(self, iTOW):
-        self.iTOW = iTOW
+    # the values unpacked from the payload
+    def __init__(self, *values):
+        self.v = array("i", values)
 
     def getTOW(self):
-        if type(self.iTOW) is not tuple:
-            return self.iTOW
-        else:
-            return self.iTOW[1](self.iTOW[0])
+        return self.iTOW
 
 
 # 01 01
 class ECEF(Message):
-    ecefX = None
-    ecefY = None
-    ecefZ = None
-    pAcc = None
-
-    def __init__(self, tow, x, y, z, acc):
-        self.iTOW = tow
-        self.ecefX = x
-        self.ecefY = y
-        self.ecefZ = z
-        self.pAcc = acc
+    ecefX = field(1)
+    ecefY = field(2)
+    ecefZ = field(3)
+    pAcc = unsigned(4)
 
     def getX(self):
-        if type(self.ecefX) is not tuple:
-            return self.ecefX
-        else:
-            return self.ecefX[1](self.ecefX[0])
+        return self.ecefX
 
     def getY(self):
-        if type(self.ecefY) is not tuple:
-            return self.ecefY
-        else:
-            return self.ecefY[1](self.ecefY[0])
+        return self.ecefY
 
     def getZ(self):
-        if type(self.ecefZ) is not tuple:
-            return self.ecefZ
-        else:
-            return self.ecefZ[1](self.ecefZ[0])
+        return self.ecefZ
 
     def getPAcc(self):
-        if type(self.pAcc) is not tuple:
-            return self.pAcc * 1e-4
-        else:
-            return self.pAcc[1](self.pAcc[0]) * 1e-2
+        return self.pAcc * 1e-2
 
 
 # 01 02
 class LLH(Message):
-    lon = None
-    lat = None
-    height = None
-    hMSL = None
-    hAcc = None
-    vAcc = None
-
-    def __init__(self, tow, lon, lat, h, hmsl, hacc, vacc):
-        self.iTOW = tow
-        self.lon = lon
-        self.lat = lat
-        self.height = h
-        self.hMSL = hmsl
-        self.hAcc = hacc
-        self.vAcc = vacc
+    lon = field(1)
+    lat = field(2)
+    height = field(3)
+    hMSL = field(4)
+    hAcc = unsigned(5)
+    vAcc = unsigned(6)
 
 
 # 01 03
 class Status(Message):
-    gpsFix = None
-    flags = None
-    fixStat = None
-    flags2 = None
-    ttff = None
-    msss = None
-    diffSol = None
-    gpsFixOK = None
-    wknValid = None
-    towValid = None
-    solInvalid = None
-
-    def __init__(self, tow, fix, flags, fixstat, flags2, ttff, msss):
-        self.iTOW = tow
-        self.fixStat = fixstat if type(fixstat) is not tuple else fixstat[1](fixstat[0])
-        self.flags = flags if type(flags) is not tuple else flags[1](flags[0])
-        # translate flags to variables
-        self.towValid = self.flags & 8 == 8
-        self.wknValid = self.flags & 4 == 4
-        self.diffSol = self.flags & 2 == 2
-        self.gpsFixOK = self.flags & 1 == 1
-
-        self.solInvalid = self.fixStat & 2 == 2
-
-        self.ttff = ttff
-        self.flags2 = flags2 if type(flags2) is not tuple else flags2[1](flags2[0])
-        self.msss = msss
-
+    flags = field(2)
+    fixStat = field(3)
+    flags2 = field(4)
+    ttff = unsigned(5)
+    msss = unsigned(6)
+    # flags as variables
+    towValid = property(lambda self: self.v[2] & 8 == 8)
+    wknValid = property(lambda self: self.v[2] & 4 == 4)
+    diffSol = property(lambda self: self.v[2] & 2 == 2)
+    gpsFixOK = property(lambda self: self.v[2] & 1 == 1)
+    solInvalid = property(lambda self: self.v[3] & 2 == 2)
+
+    @property
+    def gpsFix(self):
         try:
-            self.gpsFix = fixes[fix[0]]
+            return fixes[self.v[1]]
         except:
-            # print(fix)
-            self.gpsFix = "E - Reserved " + str(flags) + " " + str(fixstat)
+            return "E - Reserved " + str(self.flags) + " " + str(self.fixStat)
 
 # 01 06
 class Solution(Message):
-    fTOW = None
-    week = None
-    gpsFix = None
-    ecefX = None
-    ecefY = None
-    ecefZ = None
-    pAcc = None
-    ecefVX = None
-    ecefVY = None
-    ecefVZ = None
-    sAcc = None
-    pDOP = None
-    numSv = None
-
-    def __init__(self, tow, ftow, week, fix, x, y, z, pacc, vx, vy, vz, sacc, pdop, numsats):
-        self.iTOW = tow
-        self.fTOW = ftow
-        self.week = week
-        self.gpsFix = fix
-        self.ecefX = x
-        self.ecefY = y
-        self.ecefZ = z
-        self.pAcc = pacc
-        self.ecefVX = vx
-        self.ecefVY = vy
-        self.ecefVZ = vz
-        self.sAcc = sacc
-        self.pDOP = pdop
-        self.numSv = numsats
+    fTOW = field(1)
+    week = field(2)
+    gpsFix = field(3)
+    flags = field(4)
+    ecefX = field(5)
+    ecefY = field(6)
+    ecefZ = field(7)
+    pAcc = unsigned(8)
+    ecefVX = field(9)
+    ecefVY = field(10)
+    ecefVZ = field(11)
+    sAcc = unsigned(12)
+    pDOP = field(13)
+    numSv = field(14)
+
+
+# date and time fields shared by NAV-TIMEUTC and NAV-PVT, either can set the clock
+class DateTime(Message):
+    def getYear(self):
+        return self.year
+
+    def getMonth(self):
+        return self.month
+
+    def getDay(self):
+        return self.day
+
+    def getHour(self):
+        return self.hour
+
+    def getMinute(self):
+        return self.min
+
+    def getSeconds(self):
+        return self.sec
+
+    def getNano(self):
+        return self.nano
+
+
+# 01 07
+# position, velocity and time in one message, the velocity/heading fields after vAcc are not kept
+class PVT(DateTime):
+    year = field(1)
+    month = field(2)
+    day = field(3)
+    hour = field(4)
+    min = field(5)
+    sec = field(6)
+    valid = field(7)
+    tAcc = unsigned(8)
+    nano = field(9)
+    fixType = field(10)
+    flags = field(11)
+    numSV = field(13)
+    lon = property(lambda self: self.v[14] * 1e-7)
+    lat = property(lambda self: self.v[15] * 1e-7)
+    height = field(16)
+    hMSL = field(17)
+    hAcc = unsigned(18)
+    vAcc = unsigned(19)
+    gpsFixOK = property(lambda self: self.v[11] & 1 == 1)
+    diffSol = property(lambda self: self.v[11] & 2 == 2)
+
+    def __init__(self, *values):
+        self.v = array("i", values[:20])
+
+    def getNumSvs(self):
+        return self.numSV
+
+    # valid date, valid time and fully resolved
+    def validTime(self):
+        return self.valid & 7 == 7
 
 
 # Precise coordinate in cm = ecefX + (ecefXHp * 1e-2).
 # 01 13
 class HPECEF(ECEF):
-    ecefXHp = None
-    ecefYHp = None
-    ecefZHp = None
-    pAcc = None
-    invalidFix = None
-
-    def __init__(self, tow, x, y, z, xhp, yhp, zhp, pacc, flags):
-        super(HPECEF, self).__init__(tow, x, y, z, pacc)
-        self.ecefXHp = xhp
-        self.ecefYHp = yhp
-        self.ecefZHp = zhp
-        if type(flags) is not tuple:
-            self.invalidFix = flags == b'\x01'
-        else:
-            self.invalidFix = flags[0] == b'\x01'
+    ecefXHp = field(4)
+    ecefYHp = field(5)
+    ecefZHp = field(6)
+    pAcc = unsigned(8)
+    invalidFix = property(lambda self: self.v[7] == 1)
+    normSq = None # set on first use
 
     def getXHP(self):
-        if type(self.ecefXHp) is not tuple:
-            return self.ecefXHp
-        else:
-            return self.ecefXHp[1](self.ecefXHp[0])
+        return self.ecefXHp
 
     def getYHP(self):
-        if type(self.ecefYHp) is not tuple:
-            return self.ecefYHp
-        else:
-            return self.ecefYHp[1](self.ecefYHp[0])
+        return self.ecefYHp
 
     def getZHP(self):
-        if type(self.ecefZHp) is not tuple:
-            return self.ecefZHp
-        else:
-            return self.ecefZHp[1](self.ecefZHp[0])
+        return self.ecefZHp
+
+    # the same fix at another position, with the fix flagged valid
+    def moved(self, x, y, z, xhp, yhp, zhp):
+        v = self.v
+        return HPECEF(v[0], x, y, z, xhp, yhp, zhp, 0, v[8])
+
+    def get3DPos(self):
+        return (self.getX() + self.getXHP() * 1e-2, self.getY() + self.getYHP() * 1e-2,
+                self.getZ() + self.getZHP() * 1e-2)
 
     def getXPos(self):
         return self.getX() + self.getXHP() * 1e-2
@@ -219,199 +225,94 @@ class HPECEF(ECEF):
     def getZPos(self):
         return self.getZ() + self.getZHP() * 1e-2
 
-    def get3DPos(self):
-        return self.getXPos(), self.getYPos(), self.getZPos()
+    # squared distance from the centre of the earth
+    # worked out on first use then kept, the median sort reads it again for every comparison
+    def getNormSq(self):
+        if self.normSq is None:
+            px, py, pz = self.get3DPos()
+            self.normSq = px ** 2 + py ** 2 + pz ** 2
+        return self.normSq
 
 
 # Precise longitude in deg * 1e-7 = lon + (lonHp * 1e-2).
 # 01 14
 class HPLLH(LLH):
-    lon = None
-    lat = None
-    height = None
-    hMSL = None
-    lonHp = None
-    latHp = None
-    heightHp = None
-    hMSLHp = None
-    invalidFix = None
-
-    def __init__(self, tow, lon, lat, h, hmsl, lonhp, lathp, hhp, hmslhp, hacc, vacc, flags):
-        self.iTOW = tow
-        self.lon = (lon + lonhp * .01) * .0000001
-        self.lat = (lat + lathp * .01) * .0000001
-        self.height = h
-        self.hMSL = hmsl
-        self.lonHp = lonhp
-        self.latHp = lathp
-        self.heightHp = hhp
-        self.hMSLHp = hmslhp
-        self.hAcc = hacc
-        self.vAcc = vacc
-        self.invalidFix = flags == 1
+    iTOW = unsigned(1)
+    lon = property(lambda self: (self.v[2] + self.v[6] * .01) * .0000001)
+    lat = property(lambda self: (self.v[3] + self.v[7] * .01) * .0000001)
+    height = field(4)
+    hMSL = field(5)
+    lonHp = field(6)
+    latHp = field(7)
+    heightHp = field(8)
+    hMSLHp = field(9)
+    hAcc = unsigned(10)
+    vAcc = unsigned(11)
+    invalidFix = property(lambda self: self.v[0] == 1)
 
 
 # 01 35
 class SatInfo(Message):
-    numSvs = None
-
     # there is more information but I don't know if I need it yet
-
-    def __init__(self, tow, nosats):
-        self.iTOW = tow
-        self.numSvs = nosats
+    numSvs = field(1)
 
     def getNumSvs(self):
-        if type(self.numSvs) is not tuple:
-            return self.numSvs
-        else:
-            return self.numSvs[1](self.numSvs[0])
-
-
-class TimeUTC(Message):
-    tAcc = None
-    nano = None
-    year = None
-    month = None
-    day = None
-    hour = None
-    min = None
-    sec = None
-    valid = None
-
-    validTime = None
-    validDate = None
-
-    def __init__(self, iTOW, tAcc, nano, year, month, day, hour, min, sec, valid):
-        self.iTOW = iTOW
-        self.year = year
-        self.month = month
-        self.day = day
-        self.hour = hour
-        self.min = min
-        self.sec = sec
-        self.valid = valid
-        self.tAcc = tAcc
-        self.nano = nano
+        return self.numSvs
 
-    def getYear(self):
-        if notLazy(self.year):
-            return self.year
-        else:
-            return self.year[1](self.year[0])
 
-    def getMonth(self):
-        if notLazy(self.month):
-            return self.year
-        else:
-            return self.month[1](self.month[0])
-
-    def getDay(self):
-        if notLazy(self.day):
-            return self.year
-        else:
-            return self.day[1](self.day[0])
-
-    def getHour(self):
-        if notLazy(self.hour):
-            return self.year
-        else:
-            return self.hour[1](self.hour[0])
-
-    def getMinute(self):
-        if notLazy(self.min):
-            return self.year
-        else:
-            return self.min[1](self.min[0])
-
-    def getSeconds(self):
-        if notLazy(self.sec):
-            return self.year
-        else:
-            return self.sec[1](self.sec[0])
-
-    def getNano(self):
-        if notLazy(self.nano):
-            return self.nano
-        else:
-            return self.nano[1](self.nano[0])
+class TimeUTC(DateTime):
+    tAcc = unsigned(1)
+    nano = field(2)
+    year = field(3)
+    month = field(4)
+    day = field(5)
+    hour = field(6)
+    min = field(7)
+    sec = field(8)
+    valid = field(9)
 
     def validTime(self):
-        if notLazy(self.valid):
-            return self.valid & 4
-        else:
-            return self.valid[1](self.valid[0]) & 4
+        return self.valid & 4
 
 
 # 01 3B
 class SVIN(Message):
-    dur = None
-    meanX = None
-    meanY = None
-    meanZ = None
-    meanXHp = None
-    meanYHp = None
-    meanZHp = None
-    meanAcc = None
-    obs = None
-    valid = None
-    active = None
-
-    def __init__(self, dur, meanX, meanY, meanZ, meanXHp, meanYHp, meanZHp, meanAcc, obs, valid, active):
-        self.iTOW = 0
-        self.dur = dur
-        self.meanX = meanX
-        self.meanY = meanY
-        self.meanZ = meanZ
-        self.meanXHp = meanXHp
-        self.meanYHp = meanYHp
-        self.meanZHp = meanZHp
-        self.meanAcc = meanAcc
-        self.obs = obs
-        self.valid = valid
-        self.active = active
+    dur = unsigned(1)
+    meanX = field(2)
+    meanY = field(3)
+    meanZ = field(4)
+    meanXHp = field(5)
+    meanYHp = field(6)
+    meanZHp = field(7)
+    meanAcc = unsigned(8)
+    obs = unsigned(9)
+    valid = field(10)
+    active = field(11)
 
     def getX(self):
-        if type(self.meanX) is not tuple:
-            return self.meanX
-        else:
-            return self.meanX[1](self.meanX[0])
+        return self.meanX
 
     def getY(self):
-        if type(self.meanY) is not tuple:
-            return self.meanY
-        else:
-            return self.meanY[1](self.meanY[0])
+        return self.meanY
 
     def getZ(self):
-        if type(self.meanZ) is not tuple:
-            return self.meanZ
-        else:
-            return self.meanZ[1](self.meanZ[0])
+        return self.meanZ
 
     def getPAcc(self):
-        if type(self.meanAcc) is not tuple:
-            return self.meanAcc * 1e-4
-        else:
-            return self.meanAcc[1](self.meanAcc[0]) * 1e-4
+        return self.meanAcc * 1e-4
 
     def getXHP(self):
-        if type(self.meanXHp) is not tuple:
-            return self.meanXHp
-        else:
-            return self.meanXHp[1](self.meanXHp[0])
+        return self.meanXHp
 
     def getYHP(self):
-        if type(self.meanYHp) is not tuple:
-            return self.meanYHp
-        else:
-            return self.meanYHp[1](self.meanYHp[0])
+        return self.meanYHp
 
     def getZHP(self):
-        if type(self.meanZHp) is not tuple:
-            return self.meanZHp
-        else:
-            return self.meanZHp[1](self.meanZHp[0])
+        return self.meanZHp
+
+    def get3DPos(self):
+        return (self.getX() + self.getXHP() * 1e-2, self.getY() + self.getYHP() * 1e-2,
+                self.getZ() + self.getZHP() * 1e-2)
 
     def getXPos(self):
         return self.getX() + self.getXHP() * 1e-2
@@ -422,36 +323,21 @@ class SVIN(Message):
     def getZPos(self):
         return self.getZ() + self.getZHP() * 1e-2
 
-    def get3DPos(self):
-        return self.getXPos(), self.getYPos(), self.getZPos()
+    def getNormSq(self):
+        px, py, pz = self.get3DPos()
+        return px ** 2 + py ** 2 + pz ** 2
 
     def getDuration(self):
-        if type(self.dur) is not tuple:
-            return self.dur
-        else:
-            return self.dur[1](self.dur[0])
+        return self.dur
 
     def getObs(self):
-        if type(self.obs) is not tuple:
-            return self.obs
-        else:
-            return self.obs[1](self.obs[0])
+        return self.obs
 
     def getValid(self):
-        if type(self.valid) is not tuple:
-            return self.valid
-        else:
-            return self.valid[1](self.valid[0])
+        return self.valid
 
     def getActive(self):
-        if type(self.active) is not tuple:
-            return self.active
-        else:
-            return self.active[1](self.active[0])
-
-
-def notLazy(x):
-    return type(x) is not tuple
+        return self.active
 
 
 # U1 Unsigned char
@@ -481,130 +367,168 @@ def bigEndianOf(bytes):
     return int.from_bytes(bytes, 'big')
 
 
+# 05 01
+# reply to a CFG command, not part of an epoch so it has no iTOW
+class Ack(Message):
+    clsID = field(0)
+    msgID = field(1)
+    acked = True
+
+    def getTOW(self):
+        return None
+
+
+# 05 00
+class Nak(Ack):
+    acked = False
+
+
+# 06 8B
+# header of the reply to a CFG-VALGET poll, the key/value pairs after it are read by Commands.valuesReceived
+class CfgValues(Message):
+    version = field(0)
+    layer = field(1)
+    position = field(2)
+
+    def getTOW(self):
+        return None
+
+
+# registry of the messages we can decode
+# (class << 8 | id) -> [payload format, payload size, decoder, name, layout, field positions, argument template]
+# formats are compiled once at import so a payload is decoded with a single unpack_from call
+# positions/template are only set when a field mask is in use, see setFieldMask
+decoders = {}
+# frames seen per (class << 8 | id), decoded and dropped, to show what the receiver is actually sending
+hits = {}
+misses = {}
+
+
+# the struct format of a layout as it is decoded, with U4 read as I4 so every value fits a message's array
+def decodingLayout(fields, keep=None):
+    fmt, names = compileLayout(fields, keep)
+    return fmt.replace("L", "l"), names
+
+
+# decoder is called with the named fields of the layout as positional arguments, e.g. a Message class
+def registerMessage(classs, id, name, fields, decoder):
+    fmt, names = decodingLayout(fields)
+    decoders[classs << 8 | id] = [fmt, struct.calcsize(fmt), decoder, name, fields, None, None]
+
+
+# decode only the named fields of a message, the others are skipped by unpack_from and passed to the decoder as 0
+# iTOW is always kept since epochs are assembled on it. keep=None decodes every field again
+def setFieldMask(name, keep):
+    for key in decoders:
+        entry = decoders[key]
+        if entry[3] != name:
+            continue
+        fields = entry[4]
+        fmt, allNames = decodingLayout(fields)
+        if keep is None:
+            entry[0], entry[5], entry[6] = fmt, None, None
+            return True
+        keep = list(keep)
+        if "iTOW" in allNames and "iTOW" not in keep:
+            keep.append("iTOW")
+        for field in keep:
+            if field not in allNames:
+                print("No field", field, "in", name)
+        fmt, names = decodingLayout(fields, keep)
+        positions = []
+        for field in names:
+            positions.append(allNames.index(field))
+        entry[0] = fmt
+        entry[5] = tuple(positions)
+        entry[6] = [0] * len(allNames)
+        return True
+    print("No message called", name)
+    return False
+
+
+def isRegistered(classs, id):
+    return classs << 8 | id in decoders
+
+
+def countMiss(key):
+    misses[key] = misses.get(key, 0) + 1
+
+
+def getMessageCounts():
+    counts = []
+    for key in hits:
+        counts.append((decoders[key][3], hits[key]))
+    for key in misses:
+        counts.append(("{0:02X}-{1:02X}".format(key >> 8, key & 255), -misses[key]))
+    return counts
+
+
+def resetMessageCounts():
+    hits.clear()
+    misses.clear()
+
+
+# message class for each of the layouts in Layouts.MESSAGES
+messageTypes = {"NAV-POSECEF": ECEF, "NAV-POSLLH": LLH, "NAV-STATUS": Status, "NAV-SOL": Solution, "NAV-PVT": PVT,
+                "NAV-HPPOSECEF": HPECEF, "NAV-HPPOSLLH": HPLLH, "NAV-TIMEUTC": TimeUTC, "NAV-SAT": SatInfo,
+                "NAV-SVIN": SVIN, "ACK-NAK": Nak, "ACK-ACK": Ack, "CFG-VALGET": CfgValues}
+
+
+def registerLayouts():
+    for classs, id, name, fields in MESSAGES:
+        registerMessage(classs, id, name, fields, messageTypes[name])
+
+
+registerLayouts()
+
+
+# zero-copy parse of a frame that starts at offset start of buf (e.g. the UART read buffer)
+# only the header bytes are indexed and the payload is unpacked in place, no slices are taken
+def parseUBXFrame(buf, start=0):
+    classs = buf[start + 2]
+    id = buf[start + 3]
+    length = buf[start + 4] | buf[start + 5] << 8
+
+    key = classs << 8 | id
+    entry = decoders.get(key)
+    if entry is None:
+        countMiss(key)
+        print("No id for", id, "in class", classs)
+        Log.NoMessageError(classs, id)
+        return None
+
+    fmt, size, decoder, name, fields, positions, template = entry
+    # the header can claim more than buf holds when the frame was cut short, unpack_from would raise then
+    length = min(length, len(buf) - start - 6)
+    if length < size:
+        print("Data corrupted: payload too short for", name)
+        Log.LengthMismatchError(classs, id, length, size).writeLog()
+        return None
+
+    hits[key] = hits.get(key, 0) + 1
+    values = struct.unpack_from(fmt, buf, start + 6)
+    if positions is None:
+        return decoder(*values)
+    # masked: put the decoded values back in their argument positions
+    args = template[:]
+    for i in range(len(positions)):
+        args[positions[i]] = values[i]
+    return decoder(*args)
+
+
 def binaryParseUBXMessage(msg):
-    # ba = msg.split(" ")
-    ba = msg
-    # print(ba[6:14])
+    ba = memoryview(msg)
     confirm = ba[0] == 0xb5 and ba[1] == 0x62
     if not confirm:
         print("Data corrupted: preamble")
 
-    # print(ba)
-
-    classs = U1(ba[2:3])
-    id = U1(ba[3:4])
-    length = U2(ba[4:6])  # little endian for length, only defines length of payload
+    length = ba[4] | ba[5] << 8  # little endian for length, only defines length of payload
     # also note is number of bytes in pl not bits
 
-    cid = [classs, id]
-    # print("\n",cid,"\n")
-
-    pl = ba[6:-2]
-    crc = (ba[-2], ba[-1])
-
-    corrupted = verifyChecksum(pl, crc)
-
-    # print(id)
-    # print(len(pl))
-    # crc = int(ba[-2] + ba[-1], 16)
+    corrupted = verifyChecksum(ba[6:-2], (ba[-2], ba[-1]))
 
     if length != (len(ba) - 6 - 2):
         print("Data corrupted: Length")
         # log - don't halt since might be sat msg
 
-    # ids in decimal here, comments above classes are in hex
-    if classs == 1:
-        if id == 0x01:
-            return ECEF((pl[0:4], U4),
-                        (pl[4:8], I4),
-                        (pl[8:12], I4),
-                        (pl[12:16], I4),
-                        (pl[16:], U4))
-        elif id == 0x02:
-            return LLH((pl[0:4], U4),
-                       (pl[4:8], I4),
-                       (pl[8:12], I4),
-                       (pl[12:16], I4),
-                       (pl[16:20], I4),
-                       (pl[20:24], U4),
-                       (pl[24:], U4))
-        elif id == 0x03:
-            # print("not long enough?", pl[12:], len(pl), length)
-            return Status((pl[0:4], U4),
-                          (pl[4:5], U1),
-                          (pl[5:6], U1),
-                          (pl[6:7], U1),
-                          (pl[7:8], U1),
-                          (pl[8:12], U4),
-                          (pl[12:], U4))
-        elif id == 0x06:
-            # print(ba)
-            return Solution((pl[0:4], U4),
-                            (pl[4:8], I4),
-                            (pl[8:10], I2),
-                            (pl[10:11], U1),
-                            (pl[12:16], I4),
-                            (pl[16:20], I4),
-                            (pl[20:24], I4),
-                            (pl[24:28], I4),
-                            (pl[28:32], I4),
-                            (pl[32:36], I4),
-                            (pl[36:40], I4),
-                            (pl[40:44], U4),
-                            (pl[44:46], U2),
-                            (pl[47:48], U1))
-        elif id == 0x13:
-            # print(pl[20:21], pl[20])
-            return HPECEF((pl[4:8], U4),
-                          (pl[8:12], I4),
-                          (pl[12:16], I4),
-                          (pl[16:20], I4),
-                          (pl[20:21], I1),
-                          (pl[21:22], I1),
-                          (pl[22:23], I1),
-                          (pl[24:], U4),
-                          (pl[23:24], U1))
-        elif id == 0x14:
-            return HPLLH((pl[4:8], U4),
-                         (pl[8:12], I4),
-                         (pl[12:16], I4),
-                         (pl[16:20], I4),
-                         (pl[20:24], I4),
-                         (pl[24], I1),
-                         (pl[25], I1),
-                         (pl[26], I1),
-                         (pl[27], I1),
-                         (pl[28:32], U4),
-                         (pl[32:], U4),
-                         (pl[3], U1))
-        elif id == 0x21:
-            # print("pvt..?")
-            return TimeUTC((pl[0:4], U4),
-                           (pl[4:8], U4),
-                           (pl[8:12], I4),
-                           (pl[12:14], U2),
-                           (pl[14:15], U1),
-                           (pl[15:16], U1),
-                           (pl[16:17], U1),
-                           (pl[17:18], U1),
-                           (pl[18:19], U1),
-                           (pl[19:20], U1))
-        elif id == 0x35:
-            return SatInfo((pl[0:4], U4),
-                           (pl[5:6], U1))
-        elif id == 0x3B:
-            # print("ITS A SURVEY YAAY")
-            return SVIN((pl[8:12], U4),
-                        (pl[12:16], I4),
-                        (pl[16:20], I4),
-                        (pl[20:24], I4),
-                        (pl[24:25], I1),
-                        (pl[25:26], I1),
-                        (pl[26:27], I1),
-                        (pl[28:32], U4),
-                        (pl[32:36], U4),
-                        (pl[36:37], U1),
-                        (pl[37:38], U1))
-        else:
-            print("No id for", id, "in class 01-NAV")
-            Log.NoMessageError(classs, id)
+    return parseUBXFrame(ba)
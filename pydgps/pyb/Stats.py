@@ -0,0 +1,208 @@
+/* micropython ublox M9 based movement tracker
+ * for the glacsweb.org project
+ * Authors: Emily James 2020, University of Southampton
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    see <https://www.gnu.org/licenses/> for the GNU General Public License
+*/
+# Order statistics for the readings, done in place on the caller's list so picking a median is expected O(n) with
+# nothing allocated per item. The keys are functions of an item (an epoch) and are called on every comparison, so
+# they should be cheap (cached or small ints)
+#
+# ReadingStats keeps the statistics of a reading up to date as each epoch arrives, so a reading holds a bounded
+# sample of epochs however many it takes
+#
+# Convergence tells a reading it can stop early, once the fix has settled
+#
+# Positions are compared as offsets from a reference epoch in 0.1 mm (cm * 100 + the high precision part) instead of
+# absolute ECEF: the offsets of a probe that moves metres a day stay small ints on the board, and are still exact as
+# the single precision floats the pyboard has, where an absolute coordinate in cm is only good to about 64 cm
+
+
+from random import randint
+
+
+# rearranges items so items[k] is the k-th smallest by key (everything before it no larger, everything after no
+# smaller) and returns it, quickselect with a median of three pivot
+def select(items, k, key):
+    lo = 0
+    hi = len(items) - 1
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        # order lo, mid, hi so the pivot is the middle one of the three
+        if key(items[mid]) < key(items[lo]):
+            items[lo], items[mid] = items[mid], items[lo]
+        if key(items[hi]) < key(items[lo]):
+            items[lo], items[hi] = items[hi], items[lo]
+        if key(items[hi]) < key(items[mid]):
+            items[mid], items[hi] = items[hi], items[mid]
+        pivot = key(items[mid])
+        i = lo
+        j = hi
+        while i <= j:
+            while key(items[i]) < pivot:
+                i += 1
+            while pivot < key(items[j]):
+                j -= 1
+            if i <= j:
+                items[i], items[j] = items[j], items[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            break
+    return items[k]
+
+
+# the upper of the two middle items for an even count, as the full sort this replaces picked
+def median(items, key):
+    return select(items, len(items) >> 1, key)
+
+
+# geometric median (the point with the least summed distance to all of them) of the items at (kx, ky, kz), by
+# Weiszfeld's iteration from (x, y, z) until it moves less than tol, or after iterations steps
+# an item the estimate lands on is left out of that step, which would otherwise divide by zero
+def geometricMedian(items, kx, ky, kz, x, y, z, tol=1.0, iterations=50):
+    for n in range(iterations):
+        sx = sy = sz = sw = 0.0
+        for item in items:
+            px = kx(item)
+            py = ky(item)
+            pz = kz(item)
+            d = ((px - x) ** 2 + (py - y) ** 2 + (pz - z) ** 2) ** 0.5
+            if d < 1e-6:
+                continue
+            w = 1 / d
+            sx += px * w
+            sy += py * w
+            sz += pz * w
+            sw += w
+        if sw == 0:
+            break
+        nx = sx / sw
+        ny = sy / sw
+        nz = sz / sw
+        moved = abs(nx - x) + abs(ny - y) + abs(nz - z)
+        x, y, z = nx, ny, nz
+        if moved < tol:
+            break
+    return x, y, z
+
+
+# running statistics of a reading: Welford's mean and variance of the position (kx, ky, kz), the epoch with the
+# smallest acc, and a reservoir sample of at most size epochs for the median, which is every epoch while there are no
+# more than size of them
+class ReadingStats:
+    size = 0
+    count = 0
+    mean = None  # [x, y, z]
+    m2 = None  # summed squared differences from the mean, per axis
+    best = None
+    bestAcc = 0
+    sample = None
+
+    def __init__(self, size, kx, ky, kz, acc):
+        self.size = size
+        self.kx = kx
+        self.ky = ky
+        self.kz = kz
+        self.acc = acc
+        self.mean = [0.0, 0.0, 0.0]
+        self.m2 = [0.0, 0.0, 0.0]
+        self.sample = []
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        for i in range(3):
+            self.mean[i] = 0.0
+            self.m2[i] = 0.0
+        self.best = None
+        self.bestAcc = 0
+        self.sample.clear()
+
+    def add(self, item):
+        self.count += 1
+        self.update(0, self.kx(item))
+        self.update(1, self.ky(item))
+        self.update(2, self.kz(item))
+
+        acc = self.acc(item)
+        if self.best is None or acc < self.bestAcc:
+            self.best = item
+            self.bestAcc = acc
+
+        # Algorithm R: once full, the n-th item replaces a random one with probability size / n
+        if len(self.sample) < self.size:
+            self.sample.append(item)
+        else:
+            i = randint(0, self.count - 1)
+            if i < self.size:
+                self.sample[i] = item
+
+    def update(self, axis, value):
+        d = value - self.mean[axis]
+        self.mean[axis] += d / self.count
+        self.m2[axis] += d * (value - self.mean[axis])
+
+    def variance(self, axis):
+        if self.count < 2:
+            return 0.0
+        return self.m2[axis] / (self.count - 1)
+
+
+# whether the last needed epochs in a row all had an acc of at most acc and fit in a box spread wide on each axis
+# the box is started again from the epoch that breaks it, so only a few ints are kept however long the reading
+class Convergence:
+    spread = 0
+    acc = 0
+    needed = 0
+    run = 0  # epochs in a row that fit
+    lo = None  # [x, y, z] corners of the box
+    hi = None
+
+    def __init__(self, spread, acc, needed):
+        self.spread = spread
+        self.acc = acc
+        self.needed = needed
+        self.lo = [0, 0, 0]
+        self.hi = [0, 0, 0]
+        self.reset()
+
+    def reset(self):
+        self.run = 0
+
+    def add(self, x, y, z, acc):
+        if acc > self.acc:
+            self.run = 0
+            return False
+        if self.run > 0 and self.fits(0, x) and self.fits(1, y) and self.fits(2, z):
+            self.run += 1
+        else:
+            self.run = 1
+            self.lo[0] = self.hi[0] = x
+            self.lo[1] = self.hi[1] = y
+            self.lo[2] = self.hi[2] = z
+        return self.run >= self.needed
+
+    # widens the box to take value on axis, unless that makes it more than spread wide
+    def fits(self, axis, value):
+        lo = min(self.lo[axis], value)
+        hi = max(self.hi[axis], value)
+        if hi - lo > self.spread:
+            return False
+        self.lo[axis] = lo
+        self.hi[axis] = hi
+        return True
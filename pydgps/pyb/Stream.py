@@ -0,0 +1,237 @@
+/* micropython ublox M9 based movement tracker
+ * for the glacsweb.org project
+ * Authors: Emily James 2020, University of Southampton
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    see <https://www.gnu.org/licenses/> for the GNU General Public License
+*/
+# Incremental UBX frame decoder
+# bytes are read from the UART in whatever chunks are available into one preallocated buffer and frames are
+# found in place: sync chars -> header (class, id, length) -> payload + checksum, which is updated as the bytes
+# arrive so a frame is never re-walked. Frames split across reads are kept until the rest of them arrives.
+import array
+import Log
+from Formats import UBXChecksum, copyBytes, u2toBytes
+
+FRAME_OVERHEAD = 8  # sync chars, class, id, length, checksum
+
+
+class UBXDecoder:
+    buf = None
+    mv = None
+    filled = 0  # number of bytes held in buf
+    pos = 0  # next byte to look at when searching for a frame
+    start = -1  # offset of the frame being assembled, -1 while searching for the sync chars
+    length = -1  # payload length of the frame being assembled, -1 until its header is in
+    checked = 0  # bytes up to here have been added to the checksum
+    ck = None
+
+    # counters, useful to see how noisy the UART is
+    frames = 0
+    badChecksums = 0
+    badLengths = 0
+    overruns = 0  # reads skipped because buf was full, the UART's own buffer has to hold the bytes
+    bytesRead = 0
+
+    def __init__(self, size=1024):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.ck = UBXChecksum()
+        self.reset()
+
+    def reset(self):
+        self.filled = 0
+        self.pos = 0
+        self.start = -1
+        self.length = -1
+        self.checked = 0
+
+    # moves the unfinished frame (or the unsearched tail) to the front of the buffer
+    # offsets returned by nextFrame() are invalid after this
+    def compact(self):
+        keep = self.start if self.start >= 0 else self.pos
+        if keep == 0:
+            return
+        n = self.filled - keep
+        if n > 0:
+            self.mv[0:n] = self.mv[keep:self.filled]
+        self.filled = n
+        self.pos -= keep
+        if self.start >= 0:
+            self.start -= keep
+            self.checked -= keep
+
+    # reads whatever the UART has waiting (or blocks up to the UART timeout for the first byte)
+    # returns the number of bytes read, 0 on timeout
+    def readFrom(self, uart):
+        free = self.space(uart.any())
+        if len(free) == 0:
+            self.overruns += 1
+            return 0
+        return self.received(uart.readinto(free))
+
+    # the part of buf the next want (at least 1) bytes can be read into, empty if buf is full
+    # for reads done somewhere else, e.g. by an asyncio stream, which then pass the number read to received()
+    def space(self, want):
+        self.compact()
+        free = len(self.buf) - self.filled
+        if want < 1:
+            want = 1
+        if want > free:
+            want = free
+        return self.mv[self.filled:self.filled + want]
+
+    def received(self, n):
+        if n is None:
+            return 0
+        self.filled += n
+        self.bytesRead += n
+        return n
+
+    # copies bytes that were read some other way (file, radio) into the decoder, returns how many were taken
+    def feed(self, data):
+        self.compact()
+        n = min(len(data), len(self.buf) - self.filled)
+        self.mv[self.filled:self.filled + n] = memoryview(data)[:n]
+        self.filled += n
+        return n
+
+    # returns the offset in buf of the next complete frame with a valid checksum, -1 if more bytes are needed
+    # the frame stays in place until the next readFrom/feed
+    def nextFrame(self):
+        buf = self.buf
+        while True:
+            if self.start < 0:
+                # search for the sync chars, a trailing 0xb5 is left for the next read
+                i = self.pos
+                end = self.filled - 1
+                while i < end and not (buf[i] == 0xb5 and buf[i + 1] == 0x62):
+                    i += 1
+                self.pos = i
+                if i >= end:
+                    return -1
+                self.start = i
+                self.length = -1
+                self.checked = i + 2
+                self.ck.reset()
+
+            start = self.start
+            if self.length < 0:
+                if self.filled < start + 6:
+                    return -1
+                length = buf[start + 4] | buf[start + 5] << 8
+                if length + FRAME_OVERHEAD > len(buf):
+                    # can't ever fit, most likely a false sync - resync from the next byte
+                    print("Frame too long for buffer", length)
+                    Log.UnacceptableLengthError(u2toBytes(length)).writeLog()
+                    self.badLengths += 1
+                    self.start = -1
+                    self.pos = start + 1
+                    continue
+                self.length = length
+
+            stop = start + 6 + self.length
+            if self.checked < stop:
+                n = stop if stop < self.filled else self.filled
+                self.ck.update(buf, self.checked, n)
+                self.checked = n
+                if n < stop:
+                    return -1
+            if self.filled < stop + 2:
+                return -1
+
+            self.start = -1
+            if self.ck.matches(buf[stop], buf[stop + 1]):
+                self.pos = stop + 2
+                self.frames += 1
+                return start
+            # corrupted, resync from the byte after the sync chars
+            self.badChecksums += 1
+            self.pos = start + 1
+
+    # gives back the frame nextFrame() just returned, it will be returned again (e.g. when there was nowhere to put it)
+    def unread(self, start):
+        self.start = -1
+        self.pos = start
+        self.frames -= 1
+
+    # total length of the frame at offset start
+    def frameLength(self, start):
+        return (self.buf[start + 4] | self.buf[start + 5] << 8) + FRAME_OVERHEAD
+
+    def frame(self, start):
+        return self.mv[start:start + self.frameLength(start)]
+
+
+# fixed capacity queue of whole frames, filled from the decoder and parsed in place by the reader
+# frames are stored back to back in one byte ring, a frame that would run past the end of the ring starts again at
+# the front instead so every frame is contiguous. The offsets of the queued frames are kept in a ring of slots, so
+# pushing and popping never allocate and memory use is size + 2 * slots bytes however long a reading runs.
+class FrameQueue:
+    buf = None
+    mv = None
+    offsets = None
+    head = 0  # slot of the oldest frame
+    count = 0  # number of frames queued
+    write = 0  # offset the next frame would be written at
+
+    def __init__(self, size=2048, slots=32):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.offsets = array.array("H", [0] * slots)
+        self.reset()
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.write = 0
+
+    def __len__(self):
+        return self.count
+
+    def full(self):
+        return self.count == len(self.offsets)
+
+    # copies n bytes of src starting at start in as a frame, returns False if there is no room
+    def push(self, src, start, n):
+        at = self.write
+        if self.count == 0:
+            at = 0
+        elif self.count == len(self.offsets):
+            at = -1
+        else:
+            oldest = self.offsets[self.head]
+            if at > oldest:
+                # free space is the tail of the ring, then the front up to the oldest frame
+                if at + n > len(self.buf):
+                    at = 0 if n <= oldest else -1
+            elif at + n > oldest:
+                at = -1
+        if at < 0 or n > len(self.buf):
+            return False
+        copyBytes(self.buf, at, src, start, n)
+        self.offsets[(self.head + self.count) % len(self.offsets)] = at
+        self.count += 1
+        self.write = at + n
+        return True
+
+    # offset in buf of the oldest frame, -1 if empty. The frame stays valid until pop()
+    def peek(self):
+        if self.count == 0:
+            return -1
+        return self.offsets[self.head]
+
+    def pop(self):
+        if self.count == 0:
+            return
+        self.head = (self.head + 1) % len(self.offsets)
+        self.count -= 1
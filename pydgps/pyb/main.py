@@ -15,7 +15,6 @@
     see <https://www.gnu.org/licenses/> for the GNU General Public License
 */
 from random import randint
-from math import ceil
 import pyb
 import json
 # from machine import WDT
@@ -23,22 +22,32 @@ from pyb import UART
 
 import LCD
 import Log
+import Stream
+import Commands
+import Epoch
+import Stats
 from Message import *
 from Formats import *
-import os
+try:
+    import uasyncio as asyncio
+except ImportError:
+    asyncio = None
+import utime
 
 stat = None
-pack_buf = []
-nextpack = None
+decoder = None
+frames = None  # Stream.FrameQueue of frames waiting to be parsed
 pl_length_rem = 0  # will be assigned when first packet found
 until_len = None  # will be assigned when first packet found
-calibrated = False
 
 DEVICE_ID = 0
 GPS_UART_PORT = 6
 GPS_BAUDRATE = 38400
+GPS_FAST_BAUDRATES = [115200, 230400, 460800, 921600] # stepped up through at startup, empty to stay at GPS_BAUDRATE
 GPS_TIMEOUT = 1001 # ms
 GPS_BUF_SIZ = 512 # bytes
+GPS_FRAME_BUF_SIZ = 1024 # bytes, longest frame that can be decoded is 8 bytes shorter
+GPS_RING_SIZ = 2048 # bytes of frames that can wait to be parsed, a NAV-SAT with 30 satellites is 376
 
 IS_BASE_STATION = False
 SVIN_DUR = 600 # 5 min
@@ -56,8 +65,9 @@ RADIO_BUF_SIZ = 1024
 TIME_CONF_LIMIT = 500  # number of readings before time-resync
 timeConfidence = 0  # update time on 0 ==> on reset or start time is set
 
-msg_buf = {}
-msg_count = 0
+assembler = None # Epoch.EpochAssembler collecting the messages of each epoch
+EPOCH_SLOTS = 4 # epochs that can be assembled at once
+EPOCH_MAX_AGE = 2000 # ms an incomplete epoch is kept once newer messages arrive
 
 monitoring = False
 
@@ -74,17 +84,30 @@ STAT_CODE = -2
 SATINF_CODE = -2
 SVIN_CODE = -2
 TIMEUTC_ENABLED = True
+PVT_OUTPUT = False # NAV-PVT takes the place of NAV-STATUS, NAV-SAT and NAV-TIMEUTC, halving the bytes per epoch
+CONFIGURE_OUTPUT = True # set the receiver's UART output to just the enabled messages at startup
 
 LOG_RAW = False
 LOG_MEDIAN = True
 LOG_BEST = True
+LOG_BLOCKS = True # a reading's fixes in one delta encoded Log.LocationBlock, False for an ECEFLog each
+MEDIAN_SAMPLE = 32 # epochs the median is picked from, a random sample of them in readings longer than this
+MEDIAN_MODE = "norm" # median epoch by distance from the earth's centre, "component" for the median of X, Y and Z
+                     # taken separately, "geometric" for the point with the least summed distance to every epoch
 UPDATE_DELAY = 1 # works best if harmonises with 1000ms i.e. 250, 500, 125, etc.
 
 NO_READINGS = 25  # number of positions used in one reading
 NO_MSGS = 3  # ROVER: number of messages per epoch (HPECEF, SAT, STATUS) = 3 --> NOTE that TIMUTC is used then discarded once time is updated
 MAX_READING_ATTEMPTS = 100 # prevents livelock in case no message triples are valid
-MAX_PACK_BUF = 25
-CALIBRATION_TTL = 1000 # maximum number of bytes that will be read in one calibration before timeout
+CONVERGE_EPOCHS = 0 # stop a reading early once this many epochs in a row are within CONVERGE_SPREAD and CONVERGE_ACC,
+                    # 0 to always take NO_READINGS
+CONVERGE_SPREAD = 100 # 0.1 mm, widest the box around those epochs can be on each axis
+CONVERGE_ACC = 100 # 0.1 mm, largest pAcc any of them can have
+MIN_READINGS = 5 # epochs a reading takes even if it has converged before then
+MAX_PACK_BUF = 25 # number of frames that can wait to be parsed
+ACK_TIMEOUT = 1500 # ms to wait for the receiver to ACK/NAK a configuration command
+PROBE_TIMEOUT = 250 # ms a baud rate poll has to be answered in, on top of the time the bytes take at that rate
+CALIBRATION_TTL = 1000 # maximum number of bytes that will be read while looking for a frame before timeout
 MAX_CALIBRATE_FAILURES = 50 # number of UART timeouts until calibration attepts stopped
 # NO_MSGS = 5 # BASE STATION: number of messages per epoch (HPECEF, SAT, STATUS, TIMEUTC, SVIN) = 5
 # MSG_PERIOD = 8 * 60 * 60  # (in seconds) every eight hours - min. 1 minute (50 readings taken with a delay of 1s
@@ -99,6 +122,8 @@ MSG_START_TIME = 12  # defines the first hour in which the readings will take pl
                      # use is for < 10 readings per day
 TRANSMIT_AFTER = 3 # 3 readings before transmit
 MAX_TRANSMIT_ATTEMPTS = 3 # defines how many times a file will be transmitted before deletion
+ASYNC_RUNTIME = asyncio is not None # run the uasyncio tasks instead of the RTC wakeup callbacks and the polling loop
+LCD_POLL_MS = 50 # how often the LCD task redraws/checks for touches, the touch screen has no interrupt
 
 def loadBaseStationParams(data):
     global IS_BASE_STATION, SVIN_ACC, SVIN_DUR
@@ -109,19 +134,39 @@ def loadBaseStationParams(data):
         SVIN_DUR = data['svin_dur']
 
 def loadLogParams(data):
-    global LOC_CODE, STAT_CODE, SATINF_CODE, TIMEUTC_ENABLED, SVIN_CODE, NO_MSGS, NO_READINGS, MAX_READING_ATTEMPTS, LOG_RAW, LOG_MEDIAN, LOG_BEST, MAX_PACK_BUF
+    global LOC_CODE, STAT_CODE, SATINF_CODE, TIMEUTC_ENABLED, SVIN_CODE, NO_MSGS, NO_READINGS, MAX_READING_ATTEMPTS, LOG_RAW, LOG_MEDIAN, LOG_BEST, MAX_PACK_BUF, \
+        LOG_BLOCKS, EPOCH_SLOTS, EPOCH_MAX_AGE, PVT_OUTPUT, CONFIGURE_OUTPUT, MEDIAN_MODE, \
+        MEDIAN_SAMPLE, CONVERGE_EPOCHS, CONVERGE_SPREAD, CONVERGE_ACC, MIN_READINGS
     if 'no_readings' in data:
         NO_READINGS = data['no_readings']
     if 'max_reading_attempts' in data:
         MAX_READING_ATTEMPTS = data['max_reading_attempts']
+    if 'min_readings' in data:
+        MIN_READINGS = data['min_readings']
+    if 'converge_epochs' in data:
+        CONVERGE_EPOCHS = data['converge_epochs']
+    if 'converge_spread_mm' in data:
+        CONVERGE_SPREAD = round(data['converge_spread_mm'] * 10)
+    if 'converge_pacc_mm' in data:
+        CONVERGE_ACC = round(data['converge_pacc_mm'] * 10)
     if 'max_pack_buf' in data:
         MAX_PACK_BUF = data['max_pack_buf']
+    if 'epoch_slots' in data:
+        EPOCH_SLOTS = data['epoch_slots']
+    if 'epoch_max_age' in data:
+        EPOCH_MAX_AGE = data['epoch_max_age']
     if 'log_raw' in data:
         LOG_RAW = data['log_raw']
     if 'log_median' in data:
         LOG_MEDIAN = data['log_median']
     if 'log_best' in data:
         LOG_BEST = data['log_best']
+    if 'log_blocks' in data:
+        LOG_BLOCKS = data['log_blocks']
+    if 'median_mode' in data:
+        MEDIAN_MODE = data['median_mode']
+    if 'median_sample' in data:
+        MEDIAN_SAMPLE = data['median_sample']
     if 'msgs_enabled' in data:
         msgs = data['msgs_enabled']
         c = 0
@@ -146,10 +191,33 @@ def loadLogParams(data):
             SVIN_CODE = c
 
         NO_MSGS = c
+    if 'configure_output' in data:
+        CONFIGURE_OUTPUT = data['configure_output']
+    if data.get('pvt_output', False):
+        # one NAV-PVT is the status, satellite count and time of its epoch
+        # the codes are set again whatever order msgs_enabled listed them in, the epoch only has these slots
+        PVT_OUTPUT = True
+        if LOC_CODE >= 0:
+            LOC_CODE = 0
+            STAT_CODE = 1
+        else:
+            STAT_CODE = 0
+        SATINF_CODE = STAT_CODE
+        TIMEUTC_ENABLED = True
+        NO_MSGS = STAT_CODE + 1
+        if SVIN_CODE >= 0:
+            SVIN_CODE = NO_MSGS
+
+    if 'fields' in data:
+        # per-message list of the fields that are actually read, anything else isn't decoded
+        fields = data['fields']
+        for name in fields:
+            setFieldMask(name, fields[name])
 
 
 def loadTimeParams(data):
-    global MSG_PERIOD, MSG_START_TIME, TIME_CONF_LIMIT, UPDATE_DELAY, TRANSMIT_AFTER, MAX_TRANSMIT_ATTEMPTS
+    global MSG_PERIOD, MSG_START_TIME, TIME_CONF_LIMIT, UPDATE_DELAY, TRANSMIT_AFTER, MAX_TRANSMIT_ATTEMPTS, \
+        ASYNC_RUNTIME, LCD_POLL_MS
     if 'log_period_s' in data:
         MSG_PERIOD = data['log_period_s']
     if 'log_start' in data:
@@ -162,24 +230,40 @@ def loadTimeParams(data):
         TRANSMIT_AFTER = data['transmit_after']
     if 'transmit_attempts' in data:
         MAX_TRANSMIT_ATTEMPTS = data['transmit_attempts']
+    if 'async_runtime' in data:
+        ASYNC_RUNTIME = data['async_runtime'] and asyncio is not None
+    if 'lcd_poll_ms' in data:
+        LCD_POLL_MS = data['lcd_poll_ms']
 
 def loadUARTParams(data):
-    global GPS_UART_PORT, GPS_BAUDRATE, GPS_TIMEOUT, CALIBRATION_TTL, GPS_BUF_SIZ, gpsIn, DEVICE_ID, \
-        MAX_CALIBRATE_FAILURES, RADIO_UART_PORT, RADIO_BAUDRATE, RADIO_TIMEOUT, RADIO_BUF_SIZ
+    global GPS_UART_PORT, GPS_BAUDRATE, GPS_FAST_BAUDRATES, GPS_TIMEOUT, PROBE_TIMEOUT, CALIBRATION_TTL, GPS_BUF_SIZ, GPS_FRAME_BUF_SIZ, GPS_RING_SIZ, gpsIn, \
+        DEVICE_ID, MAX_CALIBRATE_FAILURES, RADIO_UART_PORT, RADIO_BAUDRATE, RADIO_TIMEOUT, RADIO_BUF_SIZ
     if 'device_id' in data:
         DEVICE_ID = data['device_id']
     if 'gps_uart' in data:
         GPS_UART_PORT = data['gps_uart']
     if 'gps_baudrate' in data:
         GPS_BAUDRATE = data['gps_baudrate']
+    if 'gps_fast_baudrates' in data:
+        GPS_FAST_BAUDRATES = data['gps_fast_baudrates']
     if 'gps_timeout' in data:
         GPS_TIMEOUT = data['gps_timeout']
+    if 'gps_probe_timeout' in data:
+        PROBE_TIMEOUT = data['gps_probe_timeout']
     if 'gps_buffer_size' in data:
         GPS_BUF_SIZ = data['gps_buffer_size']
+    if 'gps_frame_buffer_size' in data:
+        GPS_FRAME_BUF_SIZ = data['gps_frame_buffer_size']
+    if 'gps_ring_size' in data:
+        GPS_RING_SIZ = data['gps_ring_size']
+    if GPS_RING_SIZ < GPS_FRAME_BUF_SIZ:
+        # a frame as long as the decoder can hold would never fit in the queue and acquisition would stall on it
+        print("gps_ring_size {0} is less than the longest frame, using {1}".format(GPS_RING_SIZ, GPS_FRAME_BUF_SIZ))
+        GPS_RING_SIZ = GPS_FRAME_BUF_SIZ
     if 'calibration_ttl' in data:
         CALIBRATION_TTL = data['calibration_ttl']
     if 'max_calibration_fail' in data:
-        CALIBRATION_TTL = data['max_calibration_fail']
+        MAX_CALIBRATE_FAILURES = data['max_calibration_fail']
     if 'radio_uart' in data:
         RADIO_UART_PORT = data['radio_uart']
     if 'radio_baudrate' in data:
@@ -209,114 +293,87 @@ def getParamsFromConfig():
         print("Error {0}, using default parameters".format(e))
 
 
-def calibrate():
-    global CALIBRATION_TTL
-    print("Calibrating...", end=" ")
-    start_bit_one = False
-    start_bit_two = False
+# moves complete frames from the UART into the frame queue, blocking for more bytes only when the queue is empty
+# returns True if there are frames waiting to be parsed
+def readBytes():
+    global gpsIn, decoder, frames
+    if gpsIn is None:
+        return False
+    if pollBytes():
+        return True
+
+    print("Reading...", end="")
     ttl = CALIBRATION_TTL
     remaining_failures = MAX_CALIBRATE_FAILURES
-    while not (start_bit_one and start_bit_two) and ttl > 0 and remaining_failures > 0:
-        curr = gpsIn.read(1)
-        ttl -= 1
-        if curr == b'\xb5':
-            start_bit_one = True
-        elif curr == b'\x62':
-            start_bit_two = True
-        elif curr is None:
+    while len(frames) == 0:
+        if ttl <= 0 or remaining_failures <= 0:
+            print("Timed out")
+            Log.CalibrationTimeoutEvent().writeLog()
+            return False
+        n = decoder.readFrom(gpsIn)
+        if n == 0:
             # uart timeout
             remaining_failures -= 1
-        else:
-            start_bit_one = False
-            start_bit_two = False
-
-    if ttl > 0 and remaining_failures > 0:
-        print("Calibration Finished")
-    else:
-        print("Calibration timed out")
-    return ttl > 0 and remaining_failures > 0
-
-def readBytes():
-    global nextpack, pack_buf, calibrated, gpsIn
-    if gpsIn is None or len(pack_buf) > MAX_PACK_BUF:
-        return False
-    print("Reading...", end="")
-    calibrated = gpsIn.read(2) == b'\xb5\x62'
-    if not calibrated:
-        calibrated = calibrate()
-        Log.CalibrateEvent().writeLog()
-    if not calibrated:
-        Log.CalibrationTimeoutEvent().writeLog()
-        return False
-    # print(calibrated)
-    nextpack = bytearray(b'\xb5\x62')
-    class_id = gpsIn.read(2)
-    pack_len_bytes = gpsIn.read(2)
-    pack_len = U2(pack_len_bytes)
-    # print(pack_len_bytes,pack_len, "bytes long")
-
-    if pack_len > 100 and class_id != bytearray(b'\x01\x35'):
-        Log.UnacceptableLengthError(pack_len_bytes).writeLog()
-        print(class_id)
-        print("BAD LENGTH", pack_len)
-        return False
-    elif class_id == bytearray(b'\x01\x35'):
-        print("Sat message, length capped...", end="")
-        Log.LengthForceError(b'\x01', b'\x35', pack_len_bytes, u2toBytes(8)).writeLog()
-        pack_len = 8
-        pack_len_bytes = u2toBytes(pack_len)
-    payload = gpsIn.read(pack_len)
-    crc = gpsIn.read(2)
-    if crc is None:
-        crc = b'\x00\x00'
-    # print(crc,"crc")
-    try:
-        nextpack.extend(class_id)  # append class and ID to byte
-        nextpack.extend(pack_len_bytes)
-        nextpack.extend(payload)
-        nextpack.extend(crc)
-        pack_buf.append(nextpack)
-    except Exception as e:
-        Log.UnknownError("Reading bytes from UART").writeLog()
-        print(e)
-        print("Error:")
-        print(class_id)
-        print(pack_len_bytes)
-        print(payload)
-        print(crc)
-        print("End error")
-        # log error?
-        return False
-    nextpack = None
+        ttl -= n
+        queueFrames()
     print("Finished.")
     return True
 
 
+# takes whatever the UART already holds, without waiting for more, so its buffer never overflows while frames wait
+# to be parsed. Returns True if there are frames waiting to be parsed
+def pollBytes():
+    if gpsIn.any():
+        decoder.readFrom(gpsIn)
+    queueFrames()
+    return len(frames) > 0
+
+
+# copies the frames the decoder has found into the queue, messages we have no decoder for are dropped here
+# frames are left in the decoder while the queue is full
+def queueFrames():
+    while not frames.full():
+        start = decoder.nextFrame()
+        if start < 0:
+            return
+        if isRegistered(decoder.buf[start + 2], decoder.buf[start + 3]):
+            if not frames.push(decoder.buf, start, decoder.frameLength(start)):
+                decoder.unread(start)
+                return
+        else:
+            countMiss(decoder.buf[start + 2] << 8 | decoder.buf[start + 3])
+
+
 # 0 -> High-precision ECEF data
 # 1 -> GPS Status (ttff, fix status, etc.)
 # 2 -> Satellite information (notably the number of satellites used)
 # 3 -> Survey-in data (base station)
 def getMessageFromBuffer():
-    global pack_buf, msg_buf, LOC_CODE, STAT_CODE, SATINF_CODE, NO_MSGS, TIMEUTC_ENABLED, fixOK, dgpsUsed
-    if len(pack_buf) == 0:
+    global frames, LOC_CODE, STAT_CODE, SATINF_CODE, NO_MSGS, TIMEUTC_ENABLED, fixOK, dgpsUsed
+    start = frames.peek()
+    if start < 0:
         return None, -1
-    print(len(pack_buf))
-    byte_stream = pack_buf[0]
-    del pack_buf[0]
-    print(byte_stream)
+    print(len(frames))
     msg = None
     try:
-        msg = binaryParseUBXMessage(byte_stream)
+        # frames in the queue have had their checksum checked by the decoder, parse them where they are
+        msg = parseUBXFrame(frames.buf, start)
+        if isinstance(msg, CfgValues):
+            # the values follow the header, read them before the frame is released
+            Commands.valuesReceived(frames.buf, start)
+            msg = None
     except:
         Log.UnknownError("when parsing ubx message from bytestream")
+    frames.pop()
 
     if msg is None:
         return None, -1
 
-    tow = msg.getTOW()
-    # print(len(msg_buf), "messages in buffer")
-    if tow not in msg_buf:
-        msg_buf[tow] = [None] * NO_MSGS
+    if isinstance(msg, Ack):
+        # only the command waiting for it cares, nothing for the readings
+        Commands.ackReceived(msg.clsID, msg.msgID, msg.acked)
+        return None, -1
+
     code = -1
     if isinstance(msg, HPECEF) and LOC_CODE >= 0:
         code = LOC_CODE
@@ -324,6 +381,11 @@ def getMessageFromBuffer():
         code = STAT_CODE
         fixOK = msg.gpsFixOK
         dgpsUsed = msg.diffSol
+    elif isinstance(msg, PVT) and PVT_OUTPUT:
+        code = STAT_CODE
+        fixOK = msg.gpsFixOK
+        dgpsUsed = msg.diffSol
+        updateTime(msg)
     elif isinstance(msg, SatInfo) and SATINF_CODE >= 0:
         code = SATINF_CODE
     elif isinstance(msg, TimeUTC) and TIMEUTC_ENABLED:
@@ -336,96 +398,129 @@ def getMessageFromBuffer():
         code = -1
 
     if code != -1:  # just in case msg is not being used -> TIMEUTC? maybe another message has been enabled by accident i.e. LLH
-        msg_buf[tow][code] = msg
+        epoch = assembler.add(msg.getTOW(), code, msg)
+        if epoch is not None and reading and not readingDone():
+            addToReading(epoch)
     updateLEDs()  # update LEDs as readings taken - shows if fix dies during read
     return msg, code
 
 
 reading = False
 
-# tells us if the last epoch was corrupted by:
-# - not enough messages read from gps
-# - some messages invalid from last epoch
+# tells us if an epoch (which has all NO_MSGS messages) is unusable as the fix was invalid
 def invalidEpoch(epoch_msgs):
-    global NO_MSGS, STAT_CODE, LOC_CODE
-    return any(map(lambda r: r is None, epoch_msgs)) or len(epoch_msgs) < NO_MSGS or not epoch_msgs[
-        STAT_CODE].gpsFixOK or epoch_msgs[LOC_CODE].invalidFix
+    global STAT_CODE, LOC_CODE
+    return not epoch_msgs[STAT_CODE].gpsFixOK or epoch_msgs[LOC_CODE].invalidFix
+
+
+# state of the reading in progress, shared by getReadings and the asyncio reading task
+epochs = 0
+reading_stats = None # Stats.ReadingStats of the valid epochs of the reading, each a list of messages indexed by code
+convergence = None # Stats.Convergence of the reading's positions
+converged = False
+chosen_msgs = []
+location_block = None # Log.LocationBlock the reading's fixes are going into
+reading_ttl = 0 # time to live, prevents livelock
+reading_start = 0 # pyb.millis() the reading started at
 
 
 def getReadings(i=0):
-    global msg_buf, msg_count, NO_READINGS, STAT_CODE, timeConfidence, MSG_PERIOD, reading, fixOK, dgpsUsed
-    # shoudln't read twice at same time, or if nothing to log don't bother
-    if reading or not (LOG_RAW or LOG_BEST or LOG_MEDIAN):
-        print("Duplicate call?")
+    global reading_ttl
+    if not beginReading():
         return
-    LCD.reading = True
-    reading = True
-    LCD.makeLCDBusy("getReadings")
-    msg_buf = {}
-    curepoch = 0
-    lastepoch = 0
-    chosen_msgs = []
-    ttl = MAX_READING_ATTEMPTS # time to live, prevents livelock
-    epochs = 0
-    while epochs < (NO_READINGS + 1) and ttl > 0:
+    while not readingDone():
         bytesavailable = readBytes()
         print(epochs)
         if not bytesavailable:
-            ttl -= 1
+            reading_ttl -= 1
             # add delay to try to dislodge timeout / get more data in buffer
             pyb.delay(100)
             continue # restart iteration with hopefully more bytes in buffer - ttl should stop if many attempts taken
+        # complete epochs are added to the reading as they are parsed
         msg, id = getMessageFromBuffer()
         print(msg, id)
         if msg is None:
             pyb.delay(10)
-            continue
-        curepoch = msg.getTOW()
-
-        if curepoch != lastepoch and lastepoch != 0:
-            print("------ ### ------")
-            # if any messages are missing from last epoch, delete data from that epoch as unreliable (incomplete metadata)
-            lastepoch_msgs = msg_buf[lastepoch]
-            if invalidEpoch(lastepoch_msgs):
-                msg_count -= sum(map(lambda r: r is not None, lastepoch_msgs))
-                print("Some messages none on turn of next epoch, deleting epoch...")
-                print(lastepoch_msgs)
-                del msg_buf[lastepoch]
-                ttl -= 1
-                lastepoch = curepoch # might not work? needs testing
-                continue # skip count increment
-            elif LOG_RAW:
-                # safe to log as raw data
-                Log.ECEFLog(lastepoch_msgs[LOC_CODE], b'\xF1', lastepoch_msgs[SATINF_CODE]).writeLog()
-                Log.LocationEvent(b'\x11').writeLog()  # write event log for location write
-            epochs += 1
-        # print(msg, id, msg_count)
-        lastepoch = curepoch
-        # original code for detecting location invalid -> moved to last epoch calculation
-        # invalidFix = id == STAT_CODE and not msg.gpsFixOK or id == LOC_CODE and msg.invalidFix
-        # if invalidFix:
-        #     msg_count -= id
-        #     del msg_buf[msg.iTOW]
-        #     print("Invalid fix, deleting msg", msg_buf, msg_count, id == STAT_CODE and not msg.gpsFixOK, id == LOC_CODE and msg.invalidFix)
-        #     Log.UnknownError("Invalid location deleted from buffer").writeLog()
-        # else:
-
-    # 0 msgs will only happen if timeout
-    if len(msg_buf) > 0:
-        del msg_buf[curepoch] # trim last epoch from buffer
+    endReading() # frees the LCD and stops the board itself
+
+def beginReading():
+    global reading, epochs, chosen_msgs, reading_ttl, reading_start, median_ref, converged
+    # shoudln't read twice at same time, or if nothing to log don't bother
+    if reading or not (LOG_RAW or LOG_BEST or LOG_MEDIAN):
+        print("Duplicate call?")
+        return False
+    LCD.reading = True
+    reading = True
+    LCD.makeLCDBusy("getReadings")
+    reading_stats.reset()
+    convergence.reset()
+    converged = False
+    median_ref = None
+    chosen_msgs = []
+    reading_ttl = MAX_READING_ATTEMPTS
+    epochs = 0
+    reading_start = pyb.millis()
+    decoder.bytesRead = 0
+    Log.readClock() # the reading's records are timed from this, until they are committed
+    return True
+
+
+def readingDone():
+    return epochs >= (NO_READINGS + 1) or reading_ttl <= 0 or converged and epochs >= MIN_READINGS
+
+
+# called with each epoch as soon as its last message is parsed
+def addToReading(epoch_msgs):
+    global epochs, reading_ttl, median_ref, converged
+    print("------ ### ------")
+    # delete data from that epoch as unreliable
+    if invalidEpoch(epoch_msgs):
+        print("Invalid fix, deleting epoch...")
+        print(epoch_msgs)
+        reading_ttl -= 1
+        return # skip count increment
+    elif LOG_RAW:
+        # safe to log as raw data
+        logLocation(epoch_msgs[LOC_CODE], b'\xF1', epoch_msgs[SATINF_CODE])
+        queueLog(Log.LocationEvent(b'\x11'))  # write event log for location write
+    if median_ref is None:
+        median_ref = epoch_msgs[LOC_CODE]
+    reading_stats.add(epoch_msgs)
+    if CONVERGE_EPOCHS > 0 and convergence.add(getOffsetX(epoch_msgs), getOffsetY(epoch_msgs),
+                                               getOffsetZ(epoch_msgs), getRawAcc(epoch_msgs)):
+        converged = True
+    epochs += 1
+
+
+# an ECEFLog, or the fix added to the reading's location block
+def logLocation(location, smoothType, sats):
+    global location_block
+    if not LOG_BLOCKS:
+        queueLog(Log.ECEFLog(location, smoothType, sats))
+        return
+    if location_block is None:
+        location_block = Log.LocationBlock(location, smoothType, sats)
+    else:
+        location_block.add(location, smoothType, sats)
+    if location_block.full():
+        queueLog(location_block)
+        location_block = None
+
+
+def endReading():
+    global timeConfidence, reading, location_block
     timeConfidence -= 1
 
     # clock will drift as time continues, update time when this reaches 0 (see TIME_CONF_LIMIT for readings before
     # reset)
-    if LOG_MEDIAN and len(msg_buf) > 0:
-        # print(msg_buf, msg_count)
+    if LOG_MEDIAN and reading_stats.count > 0:
         type_code = b'\x12'
-        chosen_msgs.append((type_code, getMedianMsg(msg_buf)))
+        chosen_msgs.append((type_code, getMedianMsg(reading_stats.sample)))
 
-    if LOG_BEST and len(msg_buf) > 0:
-        # take message with smallest pAcc --> most accurate of the readings
+    if LOG_BEST and reading_stats.count > 0:
+        # message with smallest pAcc --> most accurate of the readings, kept as they came in
         type_code = b'\x13'
-        chosen_msgs.append((type_code, getBestAcc(msg_buf)))
+        chosen_msgs.append((type_code, reading_stats.best))
 
     if len(chosen_msgs) > 0:
         print(chosen_msgs)
@@ -433,25 +528,50 @@ def getReadings(i=0):
             # print(t, m)
             location = m[LOC_CODE]
             sats = m[SATINF_CODE]
-            Log.ECEFLog(location, t, sats).writeLog()
-            Log.LocationEvent(t).writeLog() # write event log for location write
+            logLocation(location, t, sats)
+            queueLog(Log.LocationEvent(t)) # write event log for location write
+    if location_block is not None:
+        queueLog(location_block)
+        location_block = None
+    if logs_waiting is None:
+        Log.commitLogs(False) # the logging task commits once it has written them
 
     if not IS_BASE_STATION:
-        transmitLogs()
+        if transmit_due is None:
+            transmitLogs()
+        else:
+            transmit_due.set()
 
     updateLCD()
-    msg_buf = {}
-    msg_count = 0
+    if converged:
+        print("Converged after", epochs, "epochs")
+    if reading_stats.count > 1:
+        print("Position sd (mm):", [round(reading_stats.variance(i) ** 0.5 / 10, 1) for i in range(3)])
+    reading_stats.reset() # let the epochs go
+    print("Messages received (negative = no decoder):", getMessageCounts())
+    print("Epochs completed:", assembler.completed, "dropped incomplete:", assembler.dropped)
+    assembler.completed = 0
+    assembler.dropped = 0
+    print("Reads skipped with the frame buffer full:", decoder.overruns)
+    took = pyb.elapsed_millis(reading_start)
+    print("GPS bytes read:", decoder.bytesRead, "in", took, "ms,", decoder.bytesRead * 1000 // max(took, 1), "B/s of",
+          GPS_BAUDRATE // 10)
+    resetMessageCounts()
+    decoder.overruns = 0
     LCD.makeLCDFree()
     reading = False
     LCD.reading = False
     print("\nREADINGS DONE\n")
-    if LCD.powered == 0:
+    if LCD.powered == 0 and transmit_due is None:
         pyb.stop() # put board into low-power mode until ext. interrupt
 
+
 def forceReading():
     global clock
     print("\n\nForcing reading\n\n")
+    if reading_due is not None:
+        reading_due.set()
+        return
     clock.wakeup(None)
     getReadings()
     if not IS_BASE_STATION:
@@ -460,7 +580,7 @@ def forceReading():
 
 def updateTime(timeMsg):
     global clock, timeConfidence, TIME_CONF_LIMIT
-    if type(timeMsg) is not TimeUTC or not timeMsg.validTime() or timeConfidence > 0:
+    if not isinstance(timeMsg, DateTime) or not timeMsg.validTime() or timeConfidence > 0:
         print("No clock update: ", timeConfidence)
         timeConfidence -= 1
         return
@@ -472,6 +592,8 @@ def updateTime(timeMsg):
     LCD.makeLCDFree()
     clock.datetime((timeMsg.getYear(), timeMsg.getMonth(), timeMsg.getDay(), 1,
                     timeMsg.getHour(), timeMsg.getMinute(), timeMsg.getSeconds(), timeMsg.getNano()))
+    if reading:
+        Log.readClock() # the rest of the reading is timed from the new time
 
 
 t_attempts = 1
@@ -485,6 +607,12 @@ t_attempts = 1
 
 # allow for further implementation of LR comms - UART?
 def transmitLogs():
+    for data in logChunks():
+        radio.write(data)
+
+
+# yields the waiting logs in 50 byte chunks when it is time to transmit, counting the attempts for each file
+def logChunks():
     global TRANSMIT_AFTER, MAX_TRANSMIT_ATTEMPTS, t_attempts, dgpsUsed
     # don't run if don't want to transmit for some reason
     print("Might be transmitting..?",str(t_attempts),dgpsUsed)
@@ -494,17 +622,18 @@ def transmitLogs():
         return
     elif t_attempts >= TRANSMIT_AFTER:
         try:
+            Log.commitLogs() # so the files hold everything logged so far
             print(Log.waiting_logs)
             for file in Log.waiting_logs:
                 print(file)
                 with open(file, "rb") as f:
                     data = f.read(50)
                     while data != b'':
-                        radio.write(data)
+                        yield data
                         data = f.read(50)
                 Log.waiting_logs[file] += 1
                 if Log.waiting_logs[file] >= MAX_TRANSMIT_ATTEMPTS:
-                    os.remove(file)
+                    Log.removeLog(file)
                     del Log.waiting_logs[file]
                     Log.LocationEvent(b'\x1F').writeLog()
             Log.LocationEvent(b'\x1E').writeLog()
@@ -552,133 +681,208 @@ def updateLEDs():
 #     transmitLocation(msg)
 #     updateLCD()
 
-def getAcc(msgSet):
+def getEuclidiean(msgSet):
     global LOC_CODE
-    return msgSet[LOC_CODE].getPAcc()
+    return msgSet[LOC_CODE].getNormSq()
 
 
-def getEuclidiean(msgTriple):
+def getRawAcc(msgSet):
     global LOC_CODE
-    msg = msgTriple[1][LOC_CODE]
-    px, py, pz = msg.get3DPos()
-    return px ** 2 + py ** 2 + pz ** 2
+    return msgSet[LOC_CODE].pAcc
 
 
-# SHOULD return a list of messages with indexes matching the codes
-def getMedianMsg(msgs):
-    sorted_msg_values = list({key: value for key, value in
-                         sorted(msgs.items(), key=lambda item: getEuclidiean(item))})
-    halfway_point = (len(sorted_msg_values) + 1) / 2 - 1
-    # easier to choose left value rather than average between the two
-    med = msgs[sorted_msg_values[int(ceil(halfway_point))]]
-    return med
+# position of an epoch in 0.1 mm from median_ref, see Stats
+median_ref = None
+
+def getOffsetX(msgSet):
+    m = msgSet[LOC_CODE]
+    return (m.ecefX - median_ref.ecefX) * 100 + m.ecefXHp
+
+
+def getOffsetY(msgSet):
+    m = msgSet[LOC_CODE]
+    return (m.ecefY - median_ref.ecefY) * 100 + m.ecefYHp
+
+
+def getOffsetZ(msgSet):
+    m = msgSet[LOC_CODE]
+    return (m.ecefZ - median_ref.ecefZ) * 100 + m.ecefZHp
 
 
-def getBestAcc(msgs):
-    msgs = sorted(msgs.values(), key=getAcc)
-    return msgs[0]
+# cm and high precision part of the coordinate offset (0.1 mm) from cm, hp between -50 and 49
+def fromOffset(cm, offset):
+    c = (offset + 50) // 100
+    return cm + c, offset - c * 100
 
 
+# SHOULD return a list of messages with indexes matching the codes
+# msgs is reordered in place, see Stats.select
+def getMedianMsg(msgs):
+    global median_ref
+    if MEDIAN_MODE != "component" and MEDIAN_MODE != "geometric":
+        return Stats.median(msgs, getEuclidiean)
+    if median_ref is None:
+        median_ref = msgs[0][LOC_CODE]
+    # the component-wise median, where the geometric median search starts from
+    x = getOffsetX(Stats.median(msgs, getOffsetX))
+    y = getOffsetY(Stats.median(msgs, getOffsetY))
+    z = getOffsetZ(Stats.median(msgs, getOffsetZ))
+    if MEDIAN_MODE == "geometric":
+        x, y, z = Stats.geometricMedian(msgs, getOffsetX, getOffsetY, getOffsetZ, x, y, z)
+        x, y, z = round(x), round(y), round(z)
+    # not a position any one epoch had, it goes out with the rest of the epoch with the median accuracy
+    chosen = list(Stats.median(msgs, getRawAcc))
+    ecefX, ecefXHp = fromOffset(median_ref.ecefX, x)
+    ecefY, ecefYHp = fromOffset(median_ref.ecefY, y)
+    ecefZ, ecefZHp = fromOffset(median_ref.ecefZ, z)
+    chosen[LOC_CODE] = chosen[LOC_CODE].moved(ecefX, ecefY, ecefZ, ecefXHp, ecefYHp, ecefZHp)
+    return chosen
+
+
+# names of the messages the receiver should send, see Commands.CFG_MSGOUT_UART1
+def enabledOutput():
+    enabled = []
+    if LOC_CODE >= 0:
+        enabled.append("NAV-HPPOSECEF")
+    if PVT_OUTPUT:
+        enabled.append("NAV-PVT")
+    else:
+        if STAT_CODE >= 0:
+            enabled.append("NAV-STATUS")
+        if SATINF_CODE >= 0:
+            enabled.append("NAV-SAT")
+        if TIMEUTC_ENABLED:
+            enabled.append("NAV-TIMEUTC")
+    if SVIN_CODE >= 0:
+        enabled.append("NAV-SVIN")
+    return enabled
+
+# sets the receiver's UART output to exactly the messages we use and NMEA off with one CFG-VALSET, then polls it
+# back with CFG-VALGET to check it took
+async def configureOutput():
+    enabled = enabledOutput()
+    print("Setting receiver output to", enabled)
+    Commands.send(gpsIn, Commands.messageOutput(enabled))
+    await awaitAck(Commands.valset)
+    Commands.send(gpsIn, Commands.pollMessageOutput())
+    if await awaitAck(Commands.valget) and Commands.outputMatches(enabled):
+        return True
+    print("Receiver output not as set:", Commands.values)
+    Log.UnknownError("Receiver output not as set").writeLog()
+    return False
+
+def initGPSUart(baudrate):
+    gpsIn.init(baudrate, bits=8, parity=None, stop=1, read_buf_len=GPS_BUF_SIZ,
+               timeout=GPS_TIMEOUT)  # timeout should overlap epochs -> 1s atm
+    decoder.reset()
+    frames.reset()
+
+# True if the receiver answers a poll of its baud rate with the rate gpsIn is at
+# a receiver at another rate never answers, so the poll at each rate tried has a deadline of its own, much shorter
+# than ACK_TIMEOUT: PROBE_TIMEOUT plus the time the poll, its reply and the ACK (about 50 bytes) take at that rate
+async def gpsResponds(baudrate):
+    Commands.send(gpsIn, Commands.pollBaudrate())
+    timeout = PROBE_TIMEOUT + 50 * 10000 // baudrate
+    return await awaitAck(Commands.valget, False, timeout) and Commands.values.get(Commands.CFG_UART1_BAUDRATE) == baudrate
+
+# finds the rate the receiver is at (it keeps one set earlier until it is power cycled), then steps it up through
+# GPS_FAST_BAUDRATES while it answers a poll at each new rate, falling back to the last rate that worked
+# going up one rate at a time means a link that can't take a rate is found before the receiver is sent any faster
+async def negotiateBaudrate():
+    global GPS_BAUDRATE
+    rates = sorted(GPS_FAST_BAUDRATES)
+    current = -1
+    for rate in [GPS_BAUDRATE] + rates:
+        initGPSUart(rate)
+        if await gpsResponds(rate):
+            current = rate
+            break
+    if current < 0:
+        print("No reply from the receiver at any baud rate")
+        Log.UnknownError("GPS baud rate unknown").writeLog()
+        initGPSUart(GPS_BAUDRATE)
+        return GPS_BAUDRATE
+
+    for rate in rates:
+        if rate <= current:
+            continue
+        Commands.send(gpsIn, Commands.baudrate(rate))
+        pyb.delay(20) # let the command go out before we switch
+        initGPSUart(rate)
+        start = pyb.millis()
+        if await gpsResponds(rate):
+            print("GPS at", rate, "baud, poll answered in", pyb.elapsed_millis(start), "ms")
+            current = rate
+            continue
+        # back to the rate that worked, telling the receiver too in case it did switch
+        print("No reply at", rate, "baud")
+        Commands.send(gpsIn, Commands.baudrate(current))
+        pyb.delay(20)
+        initGPSUart(current)
+        if not await gpsResponds(current):
+            Log.UnknownError("Lost GPS after trying " + str(rate)).writeLog()
+        break
+    GPS_BAUDRATE = current
+    return current
+
 surveying = False
-def startSVIN(dur=600, acc=1000):
-    global surveying
-    bs = bytearray()
-    bs.append(0xb5)
-    bs.append(0x62)
-    bs.append(0x06)
-    bs.append(0x71)
-    bs.append(0x28)
-    bs.append(0)
-
-    bs.append(0)
-    bs.append(0)
-    bs.append(1)
-    bs.append(0)
-
-    for i in range(20):
-        bs.append(0)
-    # bs.append(0x58)
-    # bs.append(0x02)
-    # bs.append(0)
-    # bs.append(0)
-
-    bs.extend(u4toBytes(dur))
-    bs.extend(u4toBytes(acc))
-
-    # bs.append(0xe8)
-    # bs.append(0x03)
-    # bs.append(0)
-    # bs.append(0)
-    for i in range(8):
-        bs.append(0)
-
-    ck_a, ck_b = ubxChecksum(bs[2:])
-    bs.append(ck_a)
-    bs.append(ck_b)
-    gpsIn.write(bs)
-    return bs
-
-def stopSVIN(svinmsg):
-    bs = bytearray()
-    bs.append(0xb5)
-    bs.append(0x62)
-    bs.append(0x06)
-    bs.append(0x71)
-    bs.append(0x28)
-    bs.append(0)
-
-    bs.append(0)
-    bs.append(0)
-    bs.append(2)
-    bs.append(0)
-
-    bs.extend(svinmsg.meanX[0])
-    bs.extend(svinmsg.meanY[0])
-    bs.extend(svinmsg.meanZ[0])
-
-    bs.extend(svinmsg.meanXHp[0])
-    bs.extend(svinmsg.meanYHp[0])
-    bs.extend(svinmsg.meanZHp[0])
-
-    bs.append(0)
-    bs.extend(svinmsg.meanAcc[0])
-
-    bs.append(0)
-    bs.append(0)
-    bs.append(0)
-    bs.append(0)
-
-    bs.append(0)
-    bs.append(0)
-    bs.append(0)
-    bs.append(0)
-    for i in range(8):
-        bs.append(0)
-
-    ck_a, ck_b = ubxChecksum(bs[2:])
-    bs.append(ck_a)
-    bs.append(ck_b)
-    gpsIn.write(bs)
-    return bs
+# survey-in and the fixed position are each set with one CFG-VALSET to RAM, BBR and flash, then one ACK wait
+async def startSVIN(dur=600, acc=1000):
+    Commands.send(gpsIn, Commands.surveyIn(dur, acc))
+    return await awaitAck(Commands.valset)
+
+async def stopSVIN(svinmsg):
+    Commands.send(gpsIn, Commands.fixedPosition(svinmsg.getX(), svinmsg.getY(), svinmsg.getZ(), svinmsg.getXHP(),
+                                                svinmsg.getYHP(), svinmsg.getZHP(), svinmsg.meanAcc))
+    return await awaitAck(Commands.valset)
 
 def saveCFG():
-    bs = bytearray()
-    bs.append(0xb5)
-    bs.append(0x62)
-    bs.append(0x06)
-    bs.append(0x09)
-    bs.extend(u2toBytes(13))
-
-    bs.extend(x4toBytes(0))
-    bs.extend(x4toBytes(7967))
-    bs.extend(x4toBytes(0))
-    bs.extend(x1toBytes(2))
-
-    ck_a, ck_b = ubxChecksum(bs[2:])
-    bs.append(ck_a)
-    bs.append(ck_b)
-    gpsIn.write(bs)
-    return bs
+    Commands.send(gpsIn, Commands.saveCfg)
+
+# parses incoming messages until the receiver ACKs/NAKs the last command or timeout (ms, ACK_TIMEOUT if None) runs out
+def waitForAck(command, report=True, timeout=None):
+    if timeout is None:
+        timeout = ACK_TIMEOUT
+    # only what the UART already has is read, readBytes would block for whole UART timeouts on a silent receiver
+    start = pyb.millis()
+    while Commands.ackState(command) == Commands.ACK_WAITING and pyb.elapsed_millis(start) < timeout:
+        if pollBytes():
+            getMessageFromBuffer()
+        else:
+            pyb.delay(1)
+    if not report:
+        return Commands.ackState(command) == Commands.ACK_ACKED
+    return checkAck(command)
+
+# what the commands wait with: once the asyncio tasks are running the epoch task parses the reply and this only
+# sleeps between looks, before then (and without the asyncio runtime) nothing else is running and waitForAck polls
+async def awaitAck(command, report=True, timeout=None):
+    if frames_queued is None:
+        return waitForAck(command, report, timeout)
+    if timeout is None:
+        timeout = ACK_TIMEOUT
+    start = pyb.millis()
+    while Commands.ackState(command) == Commands.ACK_WAITING and pyb.elapsed_millis(start) < timeout:
+        await asyncio.sleep_ms(20)
+    if not report:
+        return Commands.ackState(command) == Commands.ACK_ACKED
+    return checkAck(command)
+
+# runs a coroutine that never has to wait for another task to its end, returning its result
+# this is how the command coroutines are run without the asyncio runtime, or before its tasks have started
+def runNow(coro):
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("coroutine waited outside the asyncio runtime")
+
+def checkAck(command):
+    state = Commands.ackState(command)
+    if state != Commands.ACK_ACKED:
+        print("Command not acknowledged", command.key(), state)
+        Log.UnknownError("No ACK for " + str(command.key()) + ": " + str(state)).writeLog()
+    return state == Commands.ACK_ACKED
 
 def searchForSVIN():
     global SVIN_CODE
@@ -695,13 +899,27 @@ def toggleSVIN():
     surveying = not surveying
     LCD.surveying = not LCD.surveying
     LCD.forceUpdateLCD()
+    if svin_toggled is not None:
+        svin_toggled.set() # the survey task sends the command
+    else:
+        runNow(applySurvey())
+
+# sends the survey-in, or the fixed position the survey ended at, once the LCD has toggled surveying
+# a command the receiver doesn't ACK toggles surveying back, so the LCD shows what the receiver is doing
+async def applySurvey():
+    global surveying
     if surveying:
         print("Starting survey")
-        startSVIN(SVIN_DUR, SVIN_ACC)
-    elif not surveying and cursvin is not None:
+        acked = await startSVIN(SVIN_DUR, SVIN_ACC)
+    elif cursvin is not None:
         print("Stopping survey")
-        stopSVIN(cursvin)
-    saveCFG()
+        acked = await stopSVIN(cursvin)
+    else:
+        return
+    if not acked:
+        surveying = not surveying
+        LCD.surveying = not LCD.surveying
+        LCD.forceUpdateLCD()
 
 # resets clock to use actual period synced up to the time specified
 def initialReading(i=0):
@@ -710,38 +928,41 @@ def initialReading(i=0):
     clock.wakeup(MSG_PERIOD*1000, getReadings)
     Log.TimeWakeupSyncEvent().writeLog()
 
+# ms from now until the first reading, so the readings are in step with MSG_START_TIME
+def msUntilFirstReading():
+    time = clock.datetime()
+    hour = time[4] + time[5]/60 # should enable us to tell number of minutes along the hour
+    diff = (hour - MSG_START_TIME) * 60 * 60
+    # next reading would be in MSG_PERIOD amt of time anyway
+    if diff == 0 or diff % MSG_PERIOD == 0:
+        print("Wakeup in", MSG_PERIOD*1000)
+        return MSG_PERIOD*1000
+    # start time is in the future, next reading = time until start time
+    elif diff < 0:
+        diff=round(abs(diff))
+        print("1 Wakeup in", abs(diff)*1000)
+        return abs(diff)*1000
+    # start time is in the past, calculate when next reading would be
+    nextLogTime = MSG_START_TIME
+    period_h = MSG_PERIOD / 60 ** 2
+    # repeatedly increment until next log time in future
+    print(nextLogTime, period_h)
+    while diff > 0:
+        nextLogTime += period_h
+        diff = hour - nextLogTime
+    # calc difference to next log time
+    # diff = ceil(diff)
+    wakeup = round(abs(diff) * 60 * 60 * 1000)
+    print("2 Wakeup in", wakeup)
+    return MSG_PERIOD*1000 if diff == 0 else wakeup
+
 # used to synchronise the readings with the clock
 def initialTimer(i=0):
     global MSG_START_TIME, MSG_PERIOD, clock
     if timeConfidence != 0:
         LCD.makeLCDBusy("RTC sync")
         clock.wakeup(None)
-        time = clock.datetime()
-        hour = time[4] + time[5]/60 # should enable us to tell number of minutes along the hour
-        diff = (hour - MSG_START_TIME) * 60 * 60
-        # next reading would be in MSG_PERIOD amt of time anyway
-        if diff == 0 or diff % MSG_PERIOD == 0:
-            print("Wakeup in", MSG_PERIOD*1000)
-            clock.wakeup(MSG_PERIOD*1000, initialReading)
-        # start time is in the future, next reading = time until start time
-        elif diff < 0:
-            diff=round(abs(diff))
-            print("1 Wakeup in", abs(diff)*1000)
-            clock.wakeup(abs(diff)*1000, initialReading)
-        # start time is in the past, calculate when next reading would be
-        elif diff > 0:
-            nextLogTime = MSG_START_TIME
-            period_h = MSG_PERIOD / 60 ** 2
-            # repeatedly increment until next log time in future
-            print(nextLogTime, period_h)
-            while diff > 0:
-                nextLogTime += period_h
-                diff = hour - nextLogTime
-            # calc difference to next log time
-            # diff = ceil(diff)
-            wakeup = round(abs(diff) * 60 * 60 * 1000)
-            print("2 Wakeup in", wakeup)
-            clock.wakeup(MSG_PERIOD*1000 if diff == 0 else wakeup, initialReading)
+        clock.wakeup(msUntilFirstReading(), initialReading)
     else:
         # see if data is incoming to try to update RTC
         readBytes()
@@ -765,18 +986,236 @@ def checkForIncoming(i=0):
         pyb.stop()
 
 
+# asyncio runtime: one task per job, each waiting on its UART or on an event from another task, so a touch, a radio
+# packet or a reading never has to wait for one of the others to finish polling
+# set up by runTasks, None when the RTC wakeup callbacks and the polling loop at the bottom are used instead
+frames_queued = None # frames waiting in the queue for the epoch task
+frames_parsed = None # the epoch task has made room in the queue
+reading_progress = None # messages have been added to the reading in progress
+reading_due = None
+transmit_due = None
+logs_waiting = None
+svin_toggled = None # the LCD has toggled surveying, for the survey task
+pending_logs = [] # logs the logging task has still to write
+
+
+# writes a log now, or leaves it for the logging task when that is running
+def queueLog(log):
+    if logs_waiting is None:
+        log.writeLog()
+        return
+    pending_logs.append(log)
+    logs_waiting.set()
+
+
+svs = 0 # number of satellites observed, used in LCD updates
+def monitorMessage(msg, code):
+    global svs, cursvin
+    if code == LOC_CODE:
+        print("Updating location data")
+        LCD.updateLocMonitorData(msg, svs)
+    elif code == SVIN_CODE:
+        print("Updating survey data")
+        LCD.updateSVINMonitorData(msg, surveying)
+        cursvin = msg
+    elif code == SATINF_CODE:
+        svs = msg.getNumSvs()
+
+
+async def gpsTask():
+    reader = asyncio.StreamReader(gpsIn)
+    while True:
+        free = decoder.space(gpsIn.any())
+        if len(free) == 0:
+            # the decoder is holding frames the queue has no room for
+            decoder.overruns += 1
+            await frames_parsed.wait()
+            frames_parsed.clear()
+        else:
+            decoder.received(await reader.readinto(free))
+        queueFrames()
+        if len(frames) > 0:
+            frames_queued.set()
+
+
+# parses every queued frame, feeding the reading in progress (if any) and the LCD monitor pages
+async def epochTask():
+    while True:
+        await frames_queued.wait()
+        frames_queued.clear()
+        while len(frames) > 0:
+            msg, code = getMessageFromBuffer()
+            if msg is not None and (LCD.monitoring or surveying):
+                monitorMessage(msg, code)
+        frames_parsed.set()
+        if reading:
+            reading_progress.set()
+
+
+async def readingTask():
+    global reading_ttl
+    while True:
+        await reading_due.wait()
+        reading_due.clear()
+        if not beginReading():
+            continue
+        while not readingDone():
+            try:
+                await asyncio.wait_for_ms(reading_progress.wait(), GPS_TIMEOUT)
+            except asyncio.TimeoutError:
+                # nothing from the GPS for a whole UART timeout
+                reading_ttl -= 1
+            reading_progress.clear()
+        endReading()
+
+
+# waits for the GPS to set the clock, then starts a reading every MSG_PERIOD in step with MSG_START_TIME
+async def scheduleTask():
+    while timeConfidence == 0:
+        print("No time confidence")
+        await asyncio.sleep_ms(10000)
+    await idle(msUntilFirstReading())
+    Log.TimeWakeupSyncEvent().writeLog()
+    while True:
+        reading_due.set()
+        await idle(MSG_PERIOD*1000)
+
+
+# True while another task has something to do, the board can't go into stop mode under it
+def tasksBusy():
+    return LCD.powered == 1 or surveying or reading or len(pending_logs) > 0 or len(frames) > 0 or \
+        reading_due.is_set() or logs_waiting.is_set() or transmit_due.is_set() or radio.any() > 0
+
+
+# sleeps for ms, in stop mode (woken by the RTC, as the wakeup callbacks were) whenever no other task has anything
+# to do, otherwise a second at a time so they get their turns
+async def idle(ms):
+    end = utime.time() + ms // 1000
+    while ms > 0:
+        await asyncio.sleep_ms(0) # the other tasks take up what they were just given first
+        if tasksBusy():
+            await asyncio.sleep_ms(min(ms, 1000))
+        else:
+            clock.wakeup(ms)
+            pyb.stop()
+            clock.wakeup(None)
+        ms = (end - utime.time()) * 1000
+
+
+async def logTask():
+    while True:
+        await logs_waiting.wait()
+        logs_waiting.clear()
+        while len(pending_logs) > 0:
+            pending_logs.pop(0).writeLog()
+            await asyncio.sleep_ms(0)
+        if not reading:
+            Log.commitLogs(False) # once a reading has ended, as getReadings does, not after every epoch's logs
+
+
+async def radioTxTask():
+    writer = asyncio.StreamWriter(radio, {})
+    while True:
+        await transmit_due.wait()
+        transmit_due.clear()
+        # the reading's logs the logging task hasn't got to yet, so they go out with it
+        while len(pending_logs) > 0:
+            pending_logs.pop(0).writeLog()
+        for data in logChunks():
+            writer.write(data)
+            await writer.drain()
+
+
+async def radioRxTask():
+    reader = asyncio.StreamReader(radio)
+    while True:
+        incoming = await reader.read(1) # waits for the radio
+        n = radio.any()
+        if n > 0:
+            incoming += radio.read(min(n, 99))
+        print("\n\n!! Incoming data: ", incoming, " !!\n\n")
+        queueLog(Log.RawLog(incoming))
+
+
+async def lcdTask():
+    while True:
+        if not reading and LCD.powered == 1 or surveying:
+            LCD.updateLCD(LCD_POLL_MS)
+        await asyncio.sleep_ms(LCD_POLL_MS)
+
+
+# sends the survey commands when the LCD toggles surveying, one toggle at a time
+async def surveyTask():
+    while True:
+        await svin_toggled.wait()
+        svin_toggled.clear()
+        await applySurvey()
+
+
+# base station: saves the receiver's config every 10 s, as checkForIncoming does. The radio task logs what comes in
+async def baseStationTask():
+    while True:
+        await asyncio.sleep_ms(10000)
+        saveCFG()
+
+
+# steps the baud rate up and sets the receiver's output, as configured
+async def startReceiver():
+    if len(GPS_FAST_BAUDRATES) > 0:
+        await negotiateBaudrate()
+    if CONFIGURE_OUTPUT:
+        await configureOutput()
+    Log.StartupEvent().writeLog()
+    Log.commitLogs()
+
+
+async def runTasks():
+    global frames_queued, frames_parsed, reading_progress, reading_due, transmit_due, logs_waiting, svin_toggled
+    await startReceiver() # before the GPS task reads the UART, the ACK waits poll it themselves until then
+    frames_queued = asyncio.Event()
+    frames_parsed = asyncio.Event()
+    reading_progress = asyncio.Event()
+    reading_due = asyncio.Event()
+    transmit_due = asyncio.Event()
+    logs_waiting = asyncio.Event()
+    svin_toggled = asyncio.Event()
+    asyncio.create_task(gpsTask())
+    asyncio.create_task(epochTask())
+    asyncio.create_task(logTask())
+    asyncio.create_task(radioRxTask())
+    asyncio.create_task(lcdTask())
+    asyncio.create_task(readingTask())
+    asyncio.create_task(surveyTask())
+    if IS_BASE_STATION:
+        asyncio.create_task(baseStationTask())
+    else:
+        asyncio.create_task(scheduleTask())
+        asyncio.create_task(radioTxTask())
+    while True:
+        await asyncio.sleep_ms(60000)
+
+
 print("Starting...")
 getParamsFromConfig() # loads fields from JSON file
-Log.initLogs(DEVICE_ID) # defines ID used when logging files
+Log.initLogs(DEVICE_ID, NO_READINGS + 3) # defines ID used when logging files, and room for a reading's raw, median and best fixes
 LCD.initLCDAPI(MSG_PERIOD, MSG_START_TIME, LOG_RAW, LOG_MEDIAN, LOG_BEST, IS_BASE_STATION, readCallback=forceReading, svintoggle=toggleSVIN, svin_dur=SVIN_DUR, svin_acc=SVIN_ACC)
 gpsIn = UART(GPS_UART_PORT, GPS_BAUDRATE)
 gpsIn.init(GPS_BAUDRATE, bits=8, parity=None, stop=1, read_buf_len=GPS_BUF_SIZ,
            timeout=GPS_TIMEOUT)  # timeout should overlap epochs -> 1s atm
+decoder = Stream.UBXDecoder(GPS_FRAME_BUF_SIZ)
+frames = Stream.FrameQueue(GPS_RING_SIZ, MAX_PACK_BUF)
+assembler = Epoch.EpochAssembler(NO_MSGS, EPOCH_SLOTS, EPOCH_MAX_AGE)
+reading_stats = Stats.ReadingStats(MEDIAN_SAMPLE, getOffsetX, getOffsetY, getOffsetZ, getRawAcc)
+convergence = Stats.Convergence(CONVERGE_SPREAD, CONVERGE_ACC, CONVERGE_EPOCHS)
 clock = pyb.RTC()
 
 radio = UART(RADIO_UART_PORT, RADIO_BAUDRATE)
 radio.init(RADIO_BAUDRATE, bits=8, parity=None, stop=1, read_buf_len=RADIO_BUF_SIZ, timeout=RADIO_TIMEOUT)
 
+if ASYNC_RUNTIME:
+    asyncio.run(runTasks()) # never returns
+runNow(startReceiver())
+
 if IS_BASE_STATION:
     clock.wakeup(10000, checkForIncoming)
 else:
@@ -784,8 +1223,6 @@ else:
     clock.wakeup(10000, initialTimer) # start checking every 10 seconds if time is accurate, then start reading
                                       # properly
 # main loop
-svs = 0 # number of satellites observed, used in LCD updates
-Log.StartupEvent().writeLog()
 time = pyb.Timer(2, prescaler=83, period=0x3fffffff)
 while True:
     if not reading and LCD.powered == 1 or surveying:  # don't update LCD if taking a reading or if it's unpowered
@@ -794,7 +1231,6 @@ while True:
         # LCD power check is done in LCD.updateLCD(..) but put here too to stop pyb.delay() from triggering => redundancy
         monitoring = LCD.monitoring
         if monitoring or surveying:
-            msg_buf = {}  # reset to stop memory leaks - shouldn't interfere with periodic reading as won't be reachable during
             try:
                 # fill buffer with bytes from UART
                 readBytes()
@@ -805,15 +1241,7 @@ while True:
                 msg = None
                 code = -1
                 Log.UnknownError("msg for LCD update")
-            if code == LOC_CODE:
-                print("Updating location data")
-                LCD.updateLocMonitorData(msg, svs)
-            elif code == SVIN_CODE:
-                print("Updating survey data")
-                LCD.updateSVINMonitorData(msg, surveying)
-                cursvin = msg
-            elif code == SATINF_CODE:
-                svs = msg.getNumSvs()
+            monitorMessage(msg, code)
         print("Updating LCD")
         duration = (time.counter() - starttime) * 1000
         LCD.updateLCD(duration)